@@ -0,0 +1,228 @@
+"""
+Banc d'essai du pipeline sur données synthétiques.
+
+Usage :
+    python -m benchmarks.run_benchmarks --seasons 5 --leagues 10
+    python -m benchmarks.run_benchmarks --seasons 5 --leagues 1 --baseline benchmarks/results/xxx.json
+
+Chaque étape est chronométrée dans une base SQLite jetable (dossier temporaire),
+et les résultats sont écrits en JSON pour comparer les runs dans le temps.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+# Le dossier de travail change pendant le run : on fixe la racine du repo dans le path
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+class BenchmarkRunner:
+    def __init__(self, seasons=5, leagues=1, teams_per_league=20, repeat=1, slate_size=50, seed=42):
+        self.seasons = seasons
+        self.leagues = leagues
+        self.teams_per_league = teams_per_league
+        self.repeat = repeat
+        self.slate_size = slate_size
+        self.seed = seed
+        self.stages = {}
+
+    def timed(self, name, func, rows=None, repeat=None):
+        """Chronomètre `func` (meilleur temps sur `repeat` essais) et retourne son dernier résultat."""
+        runs = []
+        result = None
+        for _ in range(repeat or self.repeat):
+            start = time.perf_counter()
+            result = func()
+            runs.append(time.perf_counter() - start)
+        self.stages[name] = {'seconds': min(runs), 'runs': runs, 'rows': rows}
+        print(f"⏱️  {name:<22} {min(runs):9.4f} s" + (f"  ({rows} lignes)" if rows is not None else ""))
+        return result
+
+    def run(self):
+        # Imports différés : le dossier de travail doit être en place avant BettingDB()
+        import pandas as pd
+        from benchmarks.synthetic_data import SyntheticSeasonGenerator
+        from src.database import BettingDB
+        from src.ledger_export import LedgerExport
+        from src.collectors.stats_collector import StatsCollector
+        from src.collectors.sentiment_collector import SentimentCollector
+        from src.models.feature_engineering import FeatureEngineer
+        from src.models.predictor_v3 import PredictorV3
+        from src.models.streaming import default_nthread
+        from src.simulation.backtest import Backtester
+        from src.simulation.paper_trader import PaperTrader
+        from src.utils.visualizer import Visualizer
+
+        gen = SyntheticSeasonGenerator(
+            seasons=self.seasons, leagues=self.leagues,
+            teams_per_league=self.teams_per_league, seed=self.seed
+        )
+        matches_df = gen.generate_matches()
+        n_matches = len(matches_df)
+
+        db = BettingDB()
+        db.initialize_tables()
+
+        # 1. Ingestion (collecteurs)
+        collector = StatsCollector()
+        raw_df = gen.to_football_data(matches_df)
+        self.timed("ingest_stats", lambda: collector.clean_and_save(raw_df), rows=n_matches, repeat=1)
+
+        sentiments_df = gen.generate_sentiments(matches_df)
+        analyzer = SentimentCollector()
+        self.timed("score_sentiment",
+                   lambda: [analyzer.analyze_sentiment(t) for t in sentiments_df['source_text']],
+                   rows=len(sentiments_df))
+
+        counts = gen.populate(db, matches_df=matches_df, include_matches=False)
+
+        # 2. Features
+        conn = db.get_connection()
+        finished = pd.read_sql_query("SELECT * FROM matches WHERE status = 'FINISHED' ORDER BY date ASC", conn)
+        conn.close()
+        fe = FeatureEngineer()
+        self.timed("enrich_matches", lambda: fe.enrich_matches(finished.copy()), rows=len(finished))
+        self.timed("enrich_matches_parallel", lambda: fe.enrich_matches(finished.copy(), workers=default_nthread()),
+                   rows=len(finished))
+
+        predictor = PredictorV3()
+        self.timed("load_and_prepare_data", predictor.load_and_prepare_data, rows=len(finished))
+
+        # 3. Entraînement et prédiction
+        self.timed("train", predictor.train, rows=len(finished), repeat=1)
+
+        slate = matches_df[matches_df['status'] == 'SCHEDULED'].head(self.slate_size)
+        first = slate.iloc[0]
+        self.timed("predict_single", lambda: predictor.predict_match(
+            first['home_team'], first['away_team'], first['home_odds'], first['draw_odds'], first['away_odds']
+        ), rows=1)
+        self.timed("predict_batch", lambda: predictor.predict_batch(predictor.build_features(slate)),
+                   rows=len(slate))
+
+        # 4. Simulation, règlement et rapport
+        backtester = Backtester()
+        self.timed("run_backtest", backtester.run_backtest, rows=len(finished), repeat=1)
+        self.timed("run_matchday_backtest", backtester.run_matchday_backtest, rows=len(finished), repeat=1)
+
+        trader = PaperTrader()
+        # Seuls les paris PENDING semés par le générateur sont réglés par cette étape
+        self.timed("check_results", trader.check_results, rows=counts['pending'], repeat=1)
+        self.timed("export_ledger", lambda: LedgerExport().export(full=True), rows=counts['bets'])
+
+        viz = Visualizer()
+        self.timed("generate_report", viz.generate_report, rows=counts['bets'])
+
+        return {
+            'matches': n_matches,
+            'sentiments': counts['sentiments'],
+            'bets': counts['bets'],
+        }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print("\n" + "=" * 56)
+    print(f"📊 Comparaison avec {os.path.basename(baseline_path)}")
+    print("=" * 56)
+    for name, stage in results['stages'].items():
+        old = baseline.get('stages', {}).get(name)
+        if not old or not old['seconds']:
+            print(f"{name:<22} {stage['seconds']:9.4f} s   (nouveau)")
+            continue
+        ratio = stage['seconds'] / old['seconds']
+        print(f"{name:<22} {old['seconds']:9.4f} s -> {stage['seconds']:9.4f} s   x{ratio:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks du pipeline sur données synthétiques")
+    parser.add_argument("--seasons", type=int, default=5)
+    parser.add_argument("--leagues", type=int, default=1)
+    parser.add_argument("--teams", type=int, default=20, help="Équipes par ligue")
+    parser.add_argument("--repeat", type=int, default=3, help="Essais par étape rapide (on garde le meilleur)")
+    parser.add_argument("--slate", type=int, default=50, help="Taille du lot pour predict_batch")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Fichier JSON de sortie (défaut : benchmarks/results/<date>.json)")
+    parser.add_argument("--baseline", help="Résultat JSON précédent à comparer")
+    parser.add_argument("--keep", action="store_true", help="Conserver le dossier de travail temporaire")
+    parser.add_argument("--metrics", help="Écrit les spans d'instrumentation (JSON lines) dans ce fichier")
+    parser.add_argument("--profile", nargs="?", const="all",
+                        help="Profil cProfile des étapes (\"all\" ou noms séparés par des virgules)")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output) if args.output else os.path.join(
+        RESULTS_DIR, datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    if args.metrics or args.profile:
+        from src.utils import instrumentation
+        instrumentation.enable(
+            os.path.abspath(args.metrics or os.path.splitext(output)[0] + ".metrics.jsonl"),
+            profile=args.profile,
+            profile_dir=os.path.splitext(output)[0] + "_profiles",
+        )
+
+    # Base SQLite jetable : on ne touche jamais à data/ ni au Postgres de prod
+    workdir = tempfile.mkdtemp(prefix="ligue1_bench_")
+    previous_cwd = os.getcwd()
+    # Chaîne vide (et non suppression) pour que load_dotenv ne la réinjecte pas depuis .env
+    os.environ["DATABASE_URL"] = ""
+    os.chdir(workdir)
+
+    runner = BenchmarkRunner(
+        seasons=args.seasons, leagues=args.leagues, teams_per_league=args.teams,
+        repeat=args.repeat, slate_size=args.slate, seed=args.seed
+    )
+    try:
+        sizes = runner.run()
+    finally:
+        os.chdir(previous_cwd)
+        if args.keep:
+            print(f"📂 Dossier de travail conservé : {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'params': vars(args),
+        'sizes': sizes,
+        'stages': runner.stages,
+    }
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Résultats sauvegardés : {output}")
+
+    if baseline:
+        compare(results, baseline)
+    return results
+
+
+if __name__ == "__main__":
+    main()
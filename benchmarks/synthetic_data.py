@@ -0,0 +1,197 @@
+import datetime
+import numpy as np
+import pandas as pd
+from src.database import BettingDB
+from src.collectors.sentiment_collector import SentimentCollector
+from src.odds_history import to_ts
+from src.teams import TeamRegistry
+
+# Titres fictifs construits à partir du lexique du SentimentCollector
+HEADLINE_TEMPLATES = [
+    "{team} : nouvelle victoire solide avant le choc",
+    "{team} en crise après une lourde défaite",
+    "Blessure inquiétante pour un cadre de {team}",
+    "{team} retrouve la forme et l'ambition",
+    "Doute et tensions dans le vestiaire de {team}",
+    "{team} : le leader confirme, incroyable exploit",
+    "Conférence de presse de l'entraîneur de {team}",
+    "{team} battu, la relégation devient un danger",
+]
+
+
+class SyntheticSeasonGenerator:
+    """Génère un historique déterministe (matchs, sentiments, paris) pour N saisons x M ligues."""
+
+    def __init__(self, seasons=5, leagues=1, teams_per_league=20, start_year=2021,
+                 scheduled_matchdays=2, headlines_per_team=5, bet_rate=0.1, seed=42):
+        self.seasons = seasons
+        self.leagues = leagues
+        self.teams_per_league = teams_per_league
+        self.start_year = start_year
+        self.scheduled_matchdays = scheduled_matchdays
+        self.headlines_per_team = headlines_per_team
+        self.bet_rate = bet_rate
+        self.seed = seed
+
+    def team_names(self, league):
+        return [f"L{league + 1} Team {i + 1:02d}" for i in range(self.teams_per_league)]
+
+    def _round_robin(self, teams):
+        """Calendrier aller-retour (méthode du cercle)."""
+        n = len(teams)
+        order = list(range(n))
+        first_leg = []
+        for r in range(n - 1):
+            pairs = []
+            for i in range(n // 2):
+                h, a = order[i], order[n - 1 - i]
+                pairs.append((h, a) if r % 2 == 0 else (a, h))
+            first_leg.append(pairs)
+            order = [order[0]] + [order[-1]] + order[1:-1]
+        second_leg = [[(a, h) for h, a in day] for day in first_leg]
+        return first_leg + second_leg
+
+    def generate_matches(self):
+        """Retourne un DataFrame au format de la table `matches`."""
+        rng = np.random.default_rng(self.seed)
+        rows = []
+        for league in range(self.leagues):
+            teams = self.team_names(league)
+            attack = rng.normal(1.35, 0.25, len(teams)).clip(0.6, 2.2)
+            defense = rng.normal(1.35, 0.25, len(teams)).clip(0.6, 2.2)
+
+            for s in range(self.seasons):
+                year = self.start_year + s
+                schedule = self._round_robin(list(range(len(teams))))
+                # Premier match mi-août, une journée par semaine
+                kickoff = datetime.date(year, 8, 10) + datetime.timedelta(days=league)
+                last_season = s == self.seasons - 1
+
+                for day_idx, day in enumerate(schedule):
+                    match_date = (kickoff + datetime.timedelta(weeks=day_idx)).strftime("%Y-%m-%d")
+                    scheduled = last_season and day_idx >= len(schedule) - self.scheduled_matchdays
+
+                    for h, a in day:
+                        lam_h = attack[h] * defense[a] / 1.35 * 1.1
+                        lam_a = attack[a] * defense[h] / 1.35 * 0.9
+                        h_score, a_score = rng.poisson(lam_h), rng.poisson(lam_a)
+
+                        # Cotes à partir de probabilités bruitées + marge bookmaker
+                        strength = (lam_h - lam_a) + rng.normal(0, 0.2)
+                        p_home = float(np.clip(1 / (1 + np.exp(-1.2 * strength)) * 0.74, 0.08, 0.66))
+                        p_draw = 0.26
+                        p_away = 1 - p_home - p_draw
+                        odds = [round(1 / (p * 1.06), 2) for p in (p_home, p_draw, p_away)]
+
+                        home, away = teams[h], teams[a]
+                        rows.append({
+                            'id': f"{match_date}_{home}_{away}".replace(" ", ""),
+                            'date': match_date,
+                            'home_team': home,
+                            'away_team': away,
+                            'home_odds': odds[0],
+                            'draw_odds': odds[1],
+                            'away_odds': odds[2],
+                            'home_score': None if scheduled else int(h_score),
+                            'away_score': None if scheduled else int(a_score),
+                            'status': 'SCHEDULED' if scheduled else 'FINISHED',
+                            'league': f"L{league + 1}",
+                        })
+
+                # Petite dérive des niveaux d'une saison à l'autre
+                attack = (attack + rng.normal(0, 0.1, len(teams))).clip(0.6, 2.2)
+                defense = (defense + rng.normal(0, 0.1, len(teams))).clip(0.6, 2.2)
+
+        return pd.DataFrame(rows).sort_values(['date', 'id'], ignore_index=True)
+
+    def to_football_data(self, matches_df):
+        """Convertit les matchs au format CSV de football-data.co.uk (entrée du StatsCollector)."""
+        dates = pd.to_datetime(matches_df['date']).dt.strftime("%d/%m/%Y")
+        return pd.DataFrame({
+            'Div': matches_df['league'],
+            'Date': dates,
+            'HomeTeam': matches_df['home_team'],
+            'AwayTeam': matches_df['away_team'],
+            'FTHG': matches_df['home_score'].astype(float),
+            'FTAG': matches_df['away_score'].astype(float),
+            'B365H': matches_df['home_odds'],
+            'B365D': matches_df['draw_odds'],
+            'B365A': matches_df['away_odds'],
+        })
+
+    def generate_sentiments(self, matches_df):
+        """Quelques titres par équipe et par journée, datés de la veille du match."""
+        rng = np.random.default_rng(self.seed + 1)
+        analyzer = SentimentCollector()
+        scores = [analyzer.analyze_sentiment(t.format(team="")) for t in HEADLINE_TEMPLATES]
+        rows = []
+        for (date, team) in pd.concat([
+            matches_df[['date', 'home_team']].rename(columns={'home_team': 'team'}),
+            matches_df[['date', 'away_team']].rename(columns={'away_team': 'team'}),
+        ]).itertuples(index=False):
+            news_date = (pd.Timestamp(date) - pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+            picks = rng.integers(0, len(HEADLINE_TEMPLATES), self.headlines_per_team)
+            for p in picks:
+                title = f"{HEADLINE_TEMPLATES[p].format(team=team)} - {news_date}"
+                rows.append((news_date, team, scores[p], title))
+        return pd.DataFrame(rows, columns=['date', 'team', 'sentiment_score', 'source_text'])
+
+    def generate_bets(self, matches_df):
+        """Paris réglés (WIN/LOSE) et en attente (PENDING) sur des matchs terminés."""
+        rng = np.random.default_rng(self.seed + 2)
+        finished = matches_df[matches_df['status'] == 'FINISHED']
+        picked = finished[rng.uniform(0, 1, len(finished)) < self.bet_rate]
+        # Le dernier quart reste en attente pour check_results
+        n_pending = len(picked) // 4
+        rows = []
+        for i, m in enumerate(picked.itertuples(index=False)):
+            pred = ['1', 'N', '2'][rng.integers(0, 3)]
+            odds = {'1': m.home_odds, 'N': m.draw_odds, '2': m.away_odds}[pred]
+            actual = '1' if m.home_score > m.away_score else ('2' if m.away_score > m.home_score else 'N')
+            stake = 100.0
+            if i >= len(picked) - n_pending:
+                result, profit, settled_at = 'PENDING', None, None
+            else:
+                result = 'WIN' if pred == actual else 'LOSE'
+                profit = stake * odds - stake if result == 'WIN' else -stake
+                settled_at = to_ts(m.date) + 86400      # réglé le lendemain du match
+            rows.append((m.id, pred, float(rng.uniform(0.35, 0.9)), stake, odds, result, profit, m.date, 'V3-Champion',
+                         settled_at))
+        return pd.DataFrame(rows, columns=['match_id', 'prediction', 'confidence', 'stake', 'odds_taken',
+                                           'result', 'profit', 'bet_date', 'model_version', 'settled_at'])
+
+    def populate(self, db=None, matches_df=None, include_matches=True):
+        """Remplit les tables `matches`, `sentiments` et `bets`."""
+        db = db or BettingDB()
+        matches_df = self.generate_matches() if matches_df is None else matches_df
+        sentiments_df = self.generate_sentiments(matches_df)
+        bets_df = self.generate_bets(matches_df)
+
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        ph = db.get_placeholder()
+
+        if include_matches:
+            matches_df = matches_df.copy()
+            teams = TeamRegistry(db)
+            _, matches_df['home_team_key'] = teams.keys(cursor, matches_df['home_team'])
+            _, matches_df['away_team_key'] = teams.keys(cursor, matches_df['away_team'])
+            cols = list(matches_df.columns)
+            cursor.executemany(
+                f"INSERT INTO matches ({', '.join(cols)}) VALUES ({', '.join([ph] * len(cols))})",
+                [tuple(None if pd.isna(v) else v for v in row) for row in matches_df.itertuples(index=False)]
+            )
+        counts_sentiments = SentimentCollector().store_headlines(
+            cursor, list(sentiments_df.itertuples(index=False, name=None))
+        )
+        cursor.executemany(
+            f'''INSERT INTO bets (match_id, prediction, confidence, stake, odds_taken, result, profit, bet_date, model_version,
+                                  settled_at)
+                VALUES ({', '.join([ph] * 10)})''',
+            [tuple(None if pd.isna(v) else v for v in row) for row in bets_df.itertuples(index=False)]
+        )
+        conn.commit()
+        conn.close()
+
+        return {'matches': len(matches_df), 'sentiments': counts_sentiments, 'bets': len(bets_df),
+                'pending': int((bets_df['result'] == 'PENDING').sum())}
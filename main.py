@@ -0,0 +1,226 @@
+"""
+Point d'entrée unique du bot.
+
+    python main.py init | collect | train | trade | settle | backtest | report
+    python main.py run-all            # graphe complet du workflow, dans un seul process
+
+Les modules lourds (pandas, xgboost, psycopg2...) ne sont importés que par les
+étapes qui en ont besoin.
+"""
+import argparse
+import hashlib
+import os
+import sys
+
+
+class BotContext:
+    """Objets partagés entre étapes d'un même run (une seule instance de trader, etc.)."""
+
+    def __init__(self, shadow=False, matchday=False, stream=False, nthread=None, snapshot=False):
+        self._db = None
+        self._read_db = None
+        self._trader = None
+        self.snapshot = snapshot
+        self.shadow = shadow
+        self.matchday = matchday
+        self.stream = stream
+        self.nthread = nthread
+
+    @property
+    def db(self):
+        if self._db is None:
+            from src.database import BettingDB
+            self._db = BettingDB()
+        return self._db
+
+    @property
+    def read_db(self):
+        """Base des lectures lourdes : copie locale synchronisée (--snapshot) ou base principale."""
+        if self._read_db is None:
+            if self.snapshot:
+                from src.snapshot import LocalSnapshot
+                snapshot = LocalSnapshot(self.db)
+                snapshot.sync()
+                self._read_db = snapshot.reader()
+            else:
+                self._read_db = self.db
+        return self._read_db
+
+    @property
+    def trader(self):
+        if self._trader is None:
+            from src.simulation.paper_trader import PaperTrader
+            self._trader = PaperTrader(shadow=self.shadow or None, read_db=self.read_db)
+        return self._trader
+
+    def query_fingerprint(self, query, *files):
+        """Empreinte d'un résultat SQL (+ contenu de fichiers) pour détecter les entrées inchangées."""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(query)
+        digest = hashlib.sha1(repr(cursor.fetchall()).encode())
+        conn.close()
+        for path in files:
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        return digest.hexdigest()
+
+    def close(self):
+        if self._trader is not None:
+            self._trader.notifier.close()
+
+
+# --- Étapes ---
+
+def stage_init(ctx):
+    ctx.db.initialize_tables()
+
+
+def stage_collect_stats(ctx):
+    from src.collectors.stats_collector import StatsCollector
+    StatsCollector().collect()
+
+
+def stage_collect_sentiment(ctx):
+    from src.collectors.sentiment_collector import SentimentCollector
+    SentimentCollector().fetch_news()
+
+
+def stage_train(ctx):
+    from src.models.predictor_v3 import PredictorV3
+    predictor = PredictorV3(db=ctx.read_db)
+    if ctx.stream:
+        predictor.train_streaming(nthread=ctx.nthread)
+    else:
+        predictor.train()
+
+
+def stage_trade(ctx):
+    ctx.trader.place_new_bets()
+
+
+def stage_settle(ctx):
+    ctx.trader.check_results()
+
+
+def stage_export(ctx):
+    from src.ledger_export import LedgerExport
+    LedgerExport(source=ctx.db).export()
+
+
+def stage_backtest(ctx):
+    from src.simulation.backtest import Backtester
+    bt = Backtester(db=ctx.read_db)
+    bt.plot_results(bt.run_matchday_backtest() if ctx.matchday else bt.run_backtest())
+
+
+def stage_report(ctx):
+    from src.utils.visualizer import Visualizer
+    Visualizer().generate_report()
+
+
+# --- Empreintes des entrées (None = toujours exécuter) ---
+
+def fingerprint_train(ctx):
+    return ctx.query_fingerprint(
+        "SELECT COUNT(*), MAX(date) FROM matches WHERE status = 'FINISHED'"
+    )
+
+
+def fingerprint_trade(ctx):
+    return ctx.query_fingerprint('''
+        SELECT m.id, m.home_odds, m.draw_odds, m.away_odds
+        FROM matches m
+        LEFT JOIN bets b ON m.id = b.match_id
+        WHERE m.status = 'SCHEDULED' AND b.id IS NULL
+        ORDER BY m.id
+    ''', "data/registry/aliases.json", "data/model_v3_xgb.json", "data/q_table.json")
+
+
+def fingerprint_settle(ctx):
+    return ctx.query_fingerprint('''
+        SELECT b.id FROM bets b
+        JOIN matches m ON b.match_id = m.id
+        WHERE b.result = 'PENDING' AND m.status = 'FINISHED'
+        ORDER BY b.id
+    ''')
+
+
+def fingerprint_report(ctx):
+    return ctx.query_fingerprint(
+        "SELECT COUNT(*), SUM(profit) FROM bets WHERE result IN ('WIN', 'LOSE')"
+    )
+
+
+COMMANDS = {
+    "init": [stage_init],
+    "collect": [stage_collect_stats, stage_collect_sentiment],
+    "train": [stage_train],
+    "trade": [stage_trade],
+    "settle": [stage_settle],
+    "export": [stage_export],
+    "backtest": [stage_backtest],
+    "report": [stage_report],
+}
+
+
+def build_run_all(ctx):
+    from src.pipeline import Stage
+    bind = lambda f: (lambda: f(ctx))
+    return [
+        Stage("init", bind(stage_init)),
+        Stage("collect_stats", bind(stage_collect_stats), deps=["init"]),
+        Stage("collect_sentiment", bind(stage_collect_sentiment), deps=["init"]),
+        Stage("trade", bind(stage_trade), deps=["collect_stats", "collect_sentiment"],
+              fingerprint=bind(fingerprint_trade)),
+        Stage("settle", bind(stage_settle), deps=["trade"], fingerprint=bind(fingerprint_settle)),
+    ]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="⚽ Ligue 1 AI Betting Bot")
+    parser.add_argument("command", choices=sorted(COMMANDS) + ["run-all"])
+    parser.add_argument("--force", action="store_true", help="run-all : ne saute aucune étape")
+    parser.add_argument("--workers", type=int, default=4, help="run-all : étapes en parallèle")
+    parser.add_argument("--shadow", action="store_true",
+                        help="trade : tous les modèles du registre notent les matchs (seule la production parie)")
+    parser.add_argument("--matchday", action="store_true",
+                        help="backtest : simulation journée par journée (bankroll et exposition plafonnée)")
+    parser.add_argument("--stream", action="store_true",
+                        help="train : features par blocs + mémoire externe XGBoost (grands historiques)")
+    parser.add_argument("--nthread", type=int, help="train : threads XGBoost (défaut : XGB_NTHREAD ou cœurs disponibles)")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="Lectures lourdes (features, train, backtest) sur la copie locale synchronisée")
+    parser.add_argument("--metrics", help="Écrit les spans d'instrumentation (JSON lines) dans ce fichier")
+    parser.add_argument("--profile", nargs="?", const="all",
+                        help="cProfile des étapes (\"all\" ou noms séparés par des virgules)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.metrics or args.profile:
+        from src.utils import instrumentation
+        instrumentation.enable(args.metrics, profile=args.profile)
+
+    ctx = BotContext(shadow=args.shadow, matchday=args.matchday, stream=args.stream, nthread=args.nthread,
+                     snapshot=args.snapshot or os.getenv("USE_SNAPSHOT") == "1")
+    try:
+        if args.command == "run-all":
+            from src.pipeline import PipelineRunner
+            runner = PipelineRunner(build_run_all(ctx), max_workers=args.workers, force=args.force)
+            status = runner.run()
+            print("🏁 " + " | ".join(f"{name}: {s}" for name, s in status.items()))
+            return 1 if any(s in ("failed", "blocked") for s in status.values()) else 0
+
+        for stage in COMMANDS[args.command]:
+            stage(ctx)
+        return 0
+    finally:
+        ctx.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""
+Points de reprise des collecteurs (table `collector_checkpoints`).
+
+Une ligne par (source, élément) : ex. ("stats", "F1/2324") ou ("sentiment", "PSG").
+`position` : dernière ligne traitée d'un fichier, ou dernier article vu d'un flux ;
+`fingerprint` : empreinte du contenu repris (une reprise n'a de sens que sur le même fichier) ;
+`status` : 'partial' tant que l'élément n'est pas terminé, puis 'done'.
+Le checkpoint est écrit dans la même transaction que les données qu'il couvre.
+"""
+from collections import namedtuple
+from src.odds_history import to_ts
+
+Checkpoint = namedtuple("Checkpoint", ["position", "fingerprint", "status"])
+
+
+class CheckpointStore:
+    def __init__(self, db):
+        self.db = db
+
+    def get(self, cursor, source, item):
+        ph = self.db.get_placeholder()
+        cursor.execute(f'''
+            SELECT position, fingerprint, status FROM collector_checkpoints
+            WHERE source = {ph} AND item = {ph}
+        ''', (source, item))
+        row = cursor.fetchone()
+        return Checkpoint(*row) if row else None
+
+    def all(self, cursor, source):
+        ph = self.db.get_placeholder()
+        cursor.execute(f"SELECT item, position, fingerprint, status FROM collector_checkpoints WHERE source = {ph}",
+                       (source,))
+        return {item: Checkpoint(*rest) for item, *rest in cursor.fetchall()}
+
+    def set(self, cursor, source, item, position, fingerprint=None, status="partial"):
+        self.db.insert_many(
+            cursor, "collector_checkpoints",
+            ["source", "item", "position", "fingerprint", "status", "updated_at"],
+            [(source, item, str(position), fingerprint, status, to_ts())],
+            on_conflict='''ON CONFLICT (source, item) DO UPDATE SET
+                position = EXCLUDED.position, fingerprint = EXCLUDED.fingerprint,
+                status = EXCLUDED.status, updated_at = EXCLUDED.updated_at'''
+        )
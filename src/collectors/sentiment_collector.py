@@ -1,11 +1,21 @@
 import requests
 from bs4 import BeautifulSoup
 import datetime
+from src.collectors.checkpoints import CheckpointStore
 from src.database import BettingDB
+from src.teams import TeamRegistry
+from src.utils.instrumentation import timed, current_span
 
 class SentimentCollector:
-    def __init__(self):
+    SOURCE = "sentiment"
+
+    def __init__(self, retention_days=90):
         self.db = BettingDB()
+        self.team_registry = TeamRegistry(self.db)
+        self.checkpoints = CheckpointStore(self.db)
+        # Au-delà, les titres bruts sont purgés (seul le cumul journalier est gardé)
+        self.retention_days = retention_days
+        # Noms utilisés pour la recherche d'actualités (stockés ensuite sous leur nom canonique)
         self.teams = [
             "PSG", "Marseille", "Lyon", "Monaco", "Lille", "Lens", "Rennes", "Nice",
             "Strasbourg", "Reims", "Montpellier", "Toulouse", "Nantes", "Le Havre",
@@ -34,12 +44,89 @@ class SentimentCollector:
             return max(-1.0, min(1.0, final_score))
         return 0.0
 
+    def store_headlines(self, cursor, rows):
+        """
+        Insère des titres (date, équipe, score, texte) en ignorant ceux déjà vus (encore en base
+        ou déjà purgés, cf. `sentiment_seen`), et répercute uniquement les nouveaux dans le cumul
+        journalier `sentiment_daily`.
+        Les équipes sont ramenées à leur nom canonique (celui des matchs) et à leur clé entière.
+        """
+        if not rows:
+            return 0
+        ph = self.db.get_placeholder()
+        names, keys = self.team_registry.keys(cursor, [r[1] for r in rows])
+        hashes = [self.db.headline_hash(team, r[3]) for r, team in zip(rows, names)]
+        purged = set()
+        for i in range(0, len(hashes), 500):
+            part = hashes[i:i + 500]
+            cursor.execute(f"SELECT content_hash FROM sentiment_seen WHERE content_hash IN ({', '.join([ph] * len(part))})",
+                           part)
+            purged.update(r[0] for r in cursor.fetchall())
+        insert_query = f'''
+            INSERT INTO sentiments (date, team, team_key, sentiment_score, source_text, content_hash)
+            VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph})
+            ON CONFLICT (content_hash) DO NOTHING
+        '''
+        daily = {}
+        inserted = 0
+        for (date, _, score, text), team, key, content_hash in zip(rows, names, keys, hashes):
+            if content_hash in purged:
+                continue
+            cursor.execute(insert_query, (date, team, int(key), score, text, content_hash))
+            if cursor.rowcount == 1:
+                inserted += 1
+                total, n, _ = daily.get((date, team), (0.0, 0, key))
+                daily[(date, team)] = (total + score, n + 1, int(key))
+
+        if daily:
+            cursor.executemany(f'''
+                INSERT INTO sentiment_daily (date, team, team_key, score_sum, n)
+                VALUES ({ph}, {ph}, {ph}, {ph}, {ph})
+                ON CONFLICT (date, team) DO UPDATE SET
+                    score_sum = sentiment_daily.score_sum + EXCLUDED.score_sum,
+                    n = sentiment_daily.n + EXCLUDED.n
+            ''', [(date, team, key, total, n) for (date, team), (total, n, key) in daily.items()])
+        return inserted
+
+    def prune(self, cursor, horizon_days=None):
+        """
+        Supprime les titres bruts plus vieux que l'horizon (le cumul journalier est conservé) ;
+        leurs empreintes sont gardées dans `sentiment_seen` pour ne jamais les recompter.
+        """
+        horizon_days = horizon_days or self.retention_days
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=horizon_days)).strftime("%Y-%m-%d")
+        ph = self.db.get_placeholder()
+        cursor.execute(f'''
+            INSERT INTO sentiment_seen (content_hash)
+            SELECT content_hash FROM sentiments WHERE date < {ph} AND content_hash IS NOT NULL
+            ON CONFLICT (content_hash) DO NOTHING
+        ''', (cutoff,))
+        cursor.execute(f"DELETE FROM sentiments WHERE date < {ph}", (cutoff,))
+        return cursor.rowcount
+
+    @staticmethod
+    def item_id(item):
+        """Identifiant stable d'un article du flux RSS (guid, sinon lien, sinon titre)."""
+        for tag in ("guid", "link", "title"):
+            node = item.find(tag)
+            if node is not None and node.text:
+                return node.text.strip()
+        return ""
+
+    @timed("sentiment.fetch_news")
     def fetch_news(self):
+        """
+        Une transaction par équipe : ses nouveaux titres et son checkpoint (dernier article vu)
+        sont commités ensemble. Les flux sont triés du plus récent au plus ancien : on s'arrête
+        au dernier article déjà vu, si bien qu'un run repris après une coupure ne refait pas
+        le travail des équipes déjà traitées.
+        """
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        ph = self.db.get_placeholder() # Récupère ? ou %s
+        last_seen = self.checkpoints.all(cursor, self.SOURCE)
         
         total_news = 0
+        up_to_date = 0
         today = datetime.datetime.now().strftime("%Y-%m-%d")
 
         print(f"📰 Récupération des actualités pour {len(self.teams)} équipes...")
@@ -50,24 +137,32 @@ class SentimentCollector:
                 response = requests.get(url, timeout=5)
                 if response.status_code == 200:
                     soup = BeautifulSoup(response.content, features="xml")
-                    items = soup.find_all("item")
-                    for item in items[:5]:
+                    items = soup.find_all("item")[:5]
+                    if not items:
+                        continue
+                    checkpoint = last_seen.get(team)
+                    rows = []
+                    for item in items:
+                        if checkpoint and self.item_id(item) == checkpoint.position:
+                            break
                         title = item.title.text
-                        score = self.analyze_sentiment(title)
-                        
-                        # Requête dynamique
-                        query = f'''
-                            INSERT INTO sentiments (date, team, sentiment_score, source_text)
-                            VALUES ({ph}, {ph}, {ph}, {ph})
-                        '''
-                        cursor.execute(query, (today, team, score, title))
-                        total_news += 1
+                        rows.append((today, team, self.analyze_sentiment(title), title))
+                    if not rows:
+                        up_to_date += 1
+                        continue
+                    total_news += self.store_headlines(cursor, rows)
+                    self.checkpoints.set(cursor, self.SOURCE, team, self.item_id(items[0]), status="done")
+                    conn.commit()
             except Exception as e:
+                conn.rollback()
                 print(f"⚠️ Erreur pour {team}: {e}")
 
+        pruned = self.prune(cursor)
         conn.commit()
         conn.close()
-        print(f"🧠 Analyse terminée. {total_news} articles stockés.")
+        current_span().set(rows=total_news, pruned=pruned, up_to_date=up_to_date)
+        print(f"🧠 Analyse terminée. {total_news} nouveaux articles stockés ({pruned} anciens purgés, "
+              f"{up_to_date} flux sans nouveauté).")
 
 if __name__ == "__main__":
     SentimentCollector().fetch_news()
\ No newline at end of file
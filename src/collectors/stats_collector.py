@@ -1,15 +1,29 @@
 import pandas as pd
 import datetime
+from src.collectors.checkpoints import CheckpointStore
 from src.database import BettingDB
+from src.models.h2h import H2HIndex
+from src.odds_history import OddsHistory, to_ts
+from src.teams import TeamRegistry
+from src.utils.instrumentation import timed, current_span
 
 class StatsCollector:
-    def __init__(self):
+    SOURCE = "stats"
+
+    def __init__(self, divisions=None, batch_size=500):
         self.db = BettingDB()
+        self.odds_history = OddsHistory(self.db)
+        self.teams = TeamRegistry(self.db)
+        self.h2h = H2HIndex(self.db)
+        self.checkpoints = CheckpointStore(self.db)
+        # Championnats (codes football-data) et taille des lots commités
+        self.divisions = divisions or ["F1"]
+        self.batch_size = batch_size
         self.urls = self._generate_urls()
 
     def _generate_urls(self):
-        """Génère dynamiquement les URLs de 2021 jusqu'à la saison actuelle."""
-        base_url = "https://www.football-data.co.uk/mmz4281/{}/F1.csv"
+        """Génère dynamiquement les URLs de 2021 jusqu'à la saison actuelle, pour chaque championnat."""
+        base_url = "https://www.football-data.co.uk/mmz4281/{}/{}.csv"
         urls = []
         
         current_date = datetime.datetime.now()
@@ -18,88 +32,199 @@ class StatsCollector:
         start_year_season = current_date.year if current_date.month >= 7 else current_date.year - 1
         
         # On commence en 2021 (comme dans ton code original)
-        for year in range(2021, start_year_season + 1):
-            season_str = f"{str(year)[-2:]}{str(year+1)[-2:]}" # Ex: 2021 -> "2122"
-            urls.append(base_url.format(season_str))
+        for division in self.divisions:
+            for year in range(2021, start_year_season + 1):
+                season_str = f"{str(year)[-2:]}{str(year+1)[-2:]}" # Ex: 2021 -> "2122"
+                urls.append(base_url.format(season_str, division))
             
         return urls
 
+    @staticmethod
+    def source_item(url):
+        """Clé de checkpoint d'un fichier : "F1/2324"."""
+        season, file_name = url.split('/')[-2:]
+        return f"{file_name[:-4]}/{season}"
+
+    def _download(self, url):
+        item = self.source_item(url)
+        print(f"📥 Téléchargement : {item}...")
+        try:
+            df = pd.read_csv(url)
+        except Exception as e:
+            print(f"⚠️ Pas encore disponible ou erreur : {url}")
+            return None
+        df['League'], df['Season_Source'] = item.split('/')
+        return df
+
+    @timed("stats.fetch_data")
     def fetch_data(self):
-        all_dfs = []
-        for url in self.urls:
-            print(f"📥 Téléchargement : {url.split('/')[-2]}...")
-            try:
-                df = pd.read_csv(url)
-                df['Season_Source'] = url.split('/')[-2] 
-                all_dfs.append(df)
-            except Exception as e:
-                print(f"⚠️ Pas encore disponible ou erreur : {url}")
-        
+        all_dfs = [df for df in map(self._download, self.urls) if df is not None]
         if all_dfs:
             final_df = pd.concat(all_dfs, ignore_index=True)
             print(f"✅ {len(final_df)} matchs récupérés.")
+            current_span().set(rows=len(final_df))
             return final_df
         return None
 
-    def clean_and_save(self, df):
-        if df is None: return
+    @timed("stats.collect")
+    def collect(self):
+        """
+        Télécharge et enregistre fichier par fichier (un par saison et championnat), avec reprise :
+        les saisons passées déjà terminées ne sont pas retéléchargées, et un fichier interrompu
+        reprend à la dernière ligne commitée s'il n'a pas changé entre-temps.
+        La saison en cours est toujours relue (scores et cotes évoluent).
+        """
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        done = self.checkpoints.all(cursor, self.SOURCE)
+        # État des matchs et index H2H lus une seule fois, puis tenus à jour en mémoire fichier après fichier
+        known = self.known_matches(cursor)
+        conn.close()
+        self.h2h.load()
+        current_season = self.source_item(self.urls[-1]).split('/')[1]
+
+        total, skipped = 0, 0
+        for url in self.urls:
+            item = self.source_item(url)
+            checkpoint = done.get(item)
+            if checkpoint and checkpoint.status == "done" and not item.endswith(current_season):
+                skipped += 1
+                continue
+            df = self._download(url)
+            if df is None:
+                continue
+            fingerprint = str(pd.util.hash_pandas_object(df, index=False).sum())
+            start = 0
+            if checkpoint and checkpoint.status == "partial" and checkpoint.fingerprint == fingerprint:
+                start = int(checkpoint.position)
+                print(f"↩️ Reprise de {item} à la ligne {start}.")
+            total += self.clean_and_save(df, checkpoint=(item, fingerprint), start=start, known=known)
+
+        current_span().set(rows=total, skipped_files=skipped)
+        if skipped:
+            print(f"⏭️ {skipped} saisons terminées déjà en base (checkpoint).")
+        return total
+
+    @staticmethod
+    def known_matches(cursor):
+        """Cotes et statut actuellement en base : match_id -> (cote 1, cote N, cote 2, statut)."""
+        cursor.execute("SELECT id, home_odds, draw_odds, away_odds, status FROM matches")
+        return {r[0]: r[1:] for r in cursor.fetchall()}
+
+    @timed("stats.clean_and_save")
+    def clean_and_save(self, df, checkpoint=None, start=0, known=None):
+        """
+        Enregistre les matchs de `df` par lots de `batch_size` lignes, chacun dans sa propre transaction.
+        `checkpoint=(élément, empreinte)` : la position atteinte est enregistrée avec chaque lot
+        ('partial'), puis l'élément est marqué 'done' ; `start` saute les lignes déjà commitées.
+        `known` : état des matchs déjà lu (voir known_matches), mis à jour à chaque lot commité.
+        """
+        if df is None: return 0
 
         conn = self.db.get_connection()
         cursor = conn.cursor()
         ph = self.db.get_placeholder() # Récupère "?" ou "%s"
-        
-        count = 0
-        for index, row in df.iterrows():
-            if pd.isna(row['HomeTeam']) or pd.isna(row['Date']): continue
-
-            date_str = row['Date']
-            try:
-                if len(date_str) == 8: 
-                     match_date = datetime.datetime.strptime(date_str, "%d/%m/%y").strftime("%Y-%m-%d")
-                else: 
-                     match_date = datetime.datetime.strptime(date_str, "%d/%m/%Y").strftime("%Y-%m-%d")
-            except ValueError: continue
-
-            home, away = row['HomeTeam'], row['AwayTeam']
-            match_id = f"{match_date}_{home}_{away}".replace(" ", "")
-            
-            # Gestion des scores et cotes (inchangée)
-            h_score = int(row['FTHG']) if not pd.isna(row['FTHG']) else None
-            a_score = int(row['FTAG']) if not pd.isna(row['FTAG']) else None
-            h_odds = row.get('B365H', row.get('BWH', 0.0))
-            d_odds = row.get('B365D', row.get('BWD', 0.0))
-            a_odds = row.get('B365A', row.get('BWA', 0.0))
-            status = "FINISHED" if h_score is not None else "SCHEDULED"
 
-            values = (match_id, match_date, home, away, h_odds, d_odds, a_odds, h_score, a_score, status)
+        try:
+            # Cotes actuellement en base : on n'historise que les nouvelles cotes ou celles qui ont bougé
+            if known is None:
+                known = self.known_matches(cursor)
+            odds_changes, seen = [], {}
+
+            # Index H2H chargé (ou construit) avant l'écriture : seuls les nouveaux résultats y seront ajoutés
+            if not self.h2h.loaded:
+                self.h2h.load(cursor)
+            new_results = {}
 
+            # Noms canoniques + clés entières des équipes, une recherche par nom distinct
+            df = df.dropna(subset=['HomeTeam', 'AwayTeam']).copy()
+            if 'League' not in df:
+                df['League'] = df['Div'] if 'Div' in df else self.divisions[0]
+            df['HomeTeam'], df['home_team_key'] = self.teams.keys(cursor, df['HomeTeam'])
+            df['AwayTeam'], df['away_team_key'] = self.teams.keys(cursor, df['AwayTeam'])
+        
             # --- LOGIQUE SQL HYBRIDE ---
-            if self.db.is_postgres:
-                # Syntaxe PostgreSQL (ON CONFLICT)
-                query = f'''
-                    INSERT INTO matches (id, date, home_team, away_team, home_odds, draw_odds, away_odds, home_score, away_score, status)
-                    VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})
-                    ON CONFLICT (id) DO UPDATE SET 
-                        home_score = EXCLUDED.home_score,
-                        away_score = EXCLUDED.away_score,
-                        status = EXCLUDED.status;
-                '''
-            else:
-                # Syntaxe SQLite (INSERT OR REPLACE)
-                query = f'''
-                    INSERT OR REPLACE INTO matches 
-                    (id, date, home_team, away_team, home_odds, draw_odds, away_odds, home_score, away_score, status)
-                    VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph}, {ph})
-                '''
+            # Upsert commun SQLite / Postgres : la ligne n'est réécrite (et `updated_at` avancé) que si
+            # quelque chose a changé, pour que les synchronisations incrémentales ne voient que les vraies modifications
+            updated = ['home_odds', 'draw_odds', 'away_odds', 'home_score', 'away_score', 'status',
+                       'home_team_key', 'away_team_key']
+            distinct = "IS DISTINCT FROM" if self.db.is_postgres else "IS NOT"
+            upsert_query = f'''
+                INSERT INTO matches (id, date, home_team, away_team, home_odds, draw_odds, away_odds, home_score, away_score, status,
+                                     home_team_key, away_team_key, updated_at, league)
+                VALUES ({", ".join([ph] * 14)})
+                ON CONFLICT (id) DO UPDATE SET
+                    {", ".join(f"{c} = EXCLUDED.{c}" for c in updated + ['updated_at'])}
+                WHERE {" OR ".join(f"matches.{c} {distinct} EXCLUDED.{c}" for c in updated)}
+            '''
+            now_ts = to_ts()
+
+            count, snapshots, results = 0, 0, 0
+
+            def commit_batch(position, status="partial"):
+                nonlocal odds_changes, new_results, seen, snapshots, results
+                snapshots += self.odds_history.record(cursor, odds_changes)
+                results += self.h2h.apply_results(cursor, list(new_results.values()))
+                if checkpoint is not None:
+                    self.checkpoints.set(cursor, self.SOURCE, checkpoint[0], position, checkpoint[1], status)
+                conn.commit()
+                known.update(seen)      # l'état en mémoire ne suit que ce qui est commité
+                odds_changes, new_results, seen = [], {}, {}
+
+            # `position` = nombre de lignes de df déjà traitées (c'est ce que retient le checkpoint)
+            for position, (index, row) in enumerate(df.iloc[start:].iterrows(), start):
+                if position > start and (position - start) % self.batch_size == 0:
+                    commit_batch(position)
+                if pd.isna(row['HomeTeam']) or pd.isna(row['Date']): continue
+
+                date_str = row['Date']
+                try:
+                    if len(date_str) == 8: 
+                         match_date = datetime.datetime.strptime(date_str, "%d/%m/%y").strftime("%Y-%m-%d")
+                    else: 
+                         match_date = datetime.datetime.strptime(date_str, "%d/%m/%Y").strftime("%Y-%m-%d")
+                except ValueError: continue
+
+                home, away = row['HomeTeam'], row['AwayTeam']
+                match_id = f"{match_date}_{home}_{away}".replace(" ", "")
             
-            cursor.execute(query, values)
-            count += 1
+                # Gestion des scores et cotes (inchangée)
+                h_score = int(row['FTHG']) if not pd.isna(row['FTHG']) else None
+                a_score = int(row['FTAG']) if not pd.isna(row['FTAG']) else None
+                h_odds = row.get('B365H', row.get('BWH', 0.0))
+                d_odds = row.get('B365D', row.get('BWD', 0.0))
+                a_odds = row.get('B365A', row.get('BWA', 0.0))
+                status = "FINISHED" if h_score is not None else "SCHEDULED"
 
-        conn.commit()
-        conn.close()
-        print(f"💾 {count} matchs mis à jour en base.")
+                values = (match_id, match_date, home, away, h_odds, d_odds, a_odds, h_score, a_score, status,
+                          int(row['home_team_key']), int(row['away_team_key']), now_ts, row['League'])
+
+                previous = seen.get(match_id) or known.get(match_id)
+                if status == "FINISHED" and (previous is None or previous[3] != "FINISHED"):
+                    new_results[match_id] = (match_date, int(row['home_team_key']), int(row['away_team_key']),
+                                             h_score, a_score)
+
+                new_odds = (h_odds, d_odds, a_odds)
+                if not any(pd.isna(o) for o in new_odds):
+                    old_odds = previous[:3] if previous else None
+                    if old_odds is None or any(o is None or abs(float(o) - float(n)) > 1e-6 for o, n in zip(old_odds, new_odds)):
+                        odds_changes.append((match_id,) + new_odds)
+                seen[match_id] = tuple(None if pd.isna(o) else o for o in new_odds) + (status,)
+
+                cursor.execute(upsert_query, values)
+                count += 1
+
+            commit_batch(len(df), status="done")
+        except Exception:
+            # Lot en cours abandonné : le checkpoint pointe toujours sur le dernier lot commité
+            conn.rollback()
+            self.h2h.loaded = False     # l'index en mémoire est en avance sur la base : rechargé au prochain appel
+            raise
+        finally:
+            conn.close()
+        current_span().set(rows=count, odds_snapshots=snapshots, results=results)
+        print(f"💾 {count} matchs mis à jour en base ({snapshots} nouvelles cotes historisées, {results} nouveaux résultats H2H).")
+        return count
 
 if __name__ == "__main__":
-    c = StatsCollector()
-    df = c.fetch_data()
-    c.clean_and_save(df)
\ No newline at end of file
+    StatsCollector().collect()
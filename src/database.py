@@ -1,37 +1,305 @@
 import sqlite3
 import os
+import hashlib
+from datetime import datetime, timezone
 import psycopg2
+from psycopg2.extras import execute_values
 from urllib.parse import urlparse
 from dotenv import load_dotenv  # <--- AJOUTER CECI
+from src.utils import instrumentation
+from src.teams import TeamRegistry
 
 load_dotenv()
 
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """Curseur Postgres qui compte les allers-retours (instrumentation active uniquement)."""
+
+    def execute(self, query, vars=None):
+        instrumentation.count_db_call()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        instrumentation.count_db_call()
+        return super().executemany(query, vars_list)
+
+
+class CountingSQLiteCursor(sqlite3.Cursor):
+    """Curseur SQLite : un appel execute/executemany = un appel compté (pas une ligne du lot)."""
+
+    def execute(self, sql, parameters=()):
+        instrumentation.count_db_call()
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        instrumentation.count_db_call()
+        return super().executemany(sql, seq_of_parameters)
+
+
+class CountingSQLiteConnection(sqlite3.Connection):
+    """Connexion SQLite dont les curseurs (et raccourcis conn.execute) sont comptés."""
+
+    def cursor(self, factory=CountingSQLiteCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
 class BettingDB:
-    def __init__(self):
-        self.db_url = os.getenv("DATABASE_URL") # Récupère l'URL secrète (si elle existe)
+    def __init__(self, sqlite_path=None):
+        # sqlite_path : force une base SQLite précise (ex: copie locale servie en lecture)
+        self.db_url = None if sqlite_path else os.getenv("DATABASE_URL") # Récupère l'URL secrète (si elle existe)
         self.is_postgres = bool(self.db_url)
         
         if not self.is_postgres:
             # Mode Local (SQLite)
-            self.db_folder = "data"
+            self.db_path = sqlite_path or os.path.join("data", "betting.db")
+            self.db_folder = os.path.dirname(self.db_path) or "."
             if not os.path.exists(self.db_folder):
                 os.makedirs(self.db_folder)
-            self.db_path = os.path.join(self.db_folder, "betting.db")
             print(f"📂 Mode LOCAL : Utilisation de SQLite ({self.db_path})")
         else:
             print("☁️ Mode CLOUD : Utilisation de PostgreSQL")
 
     def get_connection(self):
         """Crée et retourne une connexion (SQLite ou Postgres)."""
+        if not instrumentation.is_enabled():
+            if self.is_postgres:
+                return psycopg2.connect(self.db_url)
+            else:
+                return sqlite3.connect(self.db_path)
+
+        # Mode instrumenté : on compte connexions et requêtes
+        instrumentation.count_db_connect()
         if self.is_postgres:
-            return psycopg2.connect(self.db_url)
-        else:
-            return sqlite3.connect(self.db_path)
+            return psycopg2.connect(self.db_url, cursor_factory=CountingCursor)
+        return sqlite3.connect(self.db_path, factory=CountingSQLiteConnection)
 
     def get_placeholder(self):
         """Retourne %s pour Postgres et ? pour SQLite."""
         return "%s" if self.is_postgres else "?"
 
+    def update_many(self, cursor, table, key_column, columns, rows):
+        """
+        Met à jour plusieurs lignes en un aller-retour.
+        `rows` : tuples (clé, valeur_col1, valeur_col2, ...).
+        """
+        if not rows:
+            return
+        if self.is_postgres:
+            # UPDATE ... FROM (VALUES ...) : une seule requête quel que soit le nombre de lignes
+            assignments = ", ".join(f"{c} = v.{c}" for c in columns)
+            query = f'''
+                UPDATE {table} AS t SET {assignments}
+                FROM (VALUES %s) AS v ({key_column}, {", ".join(columns)})
+                WHERE t.{key_column} = v.{key_column}
+            '''
+            execute_values(cursor, query, rows, page_size=len(rows))
+        else:
+            ph = self.get_placeholder()
+            assignments = ", ".join(f"{c} = {ph}" for c in columns)
+            cursor.executemany(
+                f"UPDATE {table} SET {assignments} WHERE {key_column} = {ph}",
+                [tuple(r[1:]) + (r[0],) for r in rows]
+            )
+
+    def insert_many(self, cursor, table, columns, rows, on_conflict=None):
+        """
+        Insère plusieurs lignes en un aller-retour (execute_values sur Postgres).
+        `on_conflict` : clause ajoutée telle quelle, ex: "ON CONFLICT (id) DO NOTHING".
+        """
+        if not rows:
+            return
+        suffix = on_conflict or ""
+        if self.is_postgres:
+            execute_values(cursor, f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s {suffix}",
+                           rows, page_size=1000)
+        else:
+            ph = self.get_placeholder()
+            cursor.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join([ph] * len(columns))}) {suffix}",
+                rows
+            )
+
+    @staticmethod
+    def headline_hash(team, text):
+        """Empreinte d'un titre pour une équipe (déduplication des actualités)."""
+        normalized = " ".join(str(text).lower().split())
+        return hashlib.sha1(f"{team}|{normalized}".encode()).hexdigest()
+
+    def add_column_if_missing(self, cursor, table, column, col_type):
+        """Migration légère : ajoute une colonne aux tables existantes."""
+        if self.is_postgres:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {col_type}")
+            return
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
+
+    def _migrate_sentiments(self, cursor):
+        """Anciennes bases : calcule les empreintes manquantes, supprime les doublons, remplit le cumul journalier."""
+        self.add_column_if_missing(cursor, "sentiments", "content_hash", "TEXT")
+
+        cursor.execute("SELECT id, team, source_text FROM sentiments WHERE content_hash IS NULL")
+        missing = cursor.fetchall()
+        if missing:
+            self.update_many(cursor, "sentiments", "id", ["content_hash"],
+                             [(row_id, self.headline_hash(team, text)) for row_id, team, text in missing])
+            cursor.execute('''
+                DELETE FROM sentiments
+                WHERE id NOT IN (SELECT MIN(id) FROM sentiments GROUP BY content_hash)
+            ''')
+            print(f"🧹 {len(missing)} actualités migrées (empreintes + dédoublonnage).")
+
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sentiments_hash ON sentiments (content_hash)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sentiments_date ON sentiments (date)")
+
+        cursor.execute("SELECT COUNT(*) FROM sentiment_daily")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute('''
+                INSERT INTO sentiment_daily (date, team, score_sum, n)
+                SELECT date, team, SUM(sentiment_score), COUNT(*)
+                FROM sentiments
+                GROUP BY date, team
+            ''')
+
+    def _migrate_teams(self, cursor):
+        """
+        Référentiel des équipes : alias par défaut, noms ramenés à leur forme canonique
+        et clés entières remplies pour les lignes qui n'en ont pas encore.
+        """
+        for table, columns in (("matches", ["home_team_key", "away_team_key"]),
+                               ("sentiments", ["team_key"]), ("sentiment_daily", ["team_key"])):
+            for column in columns:
+                self.add_column_if_missing(cursor, table, column, "INTEGER")
+        # Jointures temporelles du sentiment par clé d'équipe
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sentiment_daily_team_key ON sentiment_daily (team_key, date)")
+        registry = TeamRegistry(self)
+        registry.seed(cursor)
+        migrated = 0
+
+        # Matchs : les ID de match sont construits à partir des noms, on ne fait que remplir les clés
+        cursor.execute("SELECT id, home_team, away_team FROM matches WHERE home_team_key IS NULL OR away_team_key IS NULL")
+        rows = cursor.fetchall()
+        if rows:
+            ids, homes, aways = zip(*rows)
+            _, home_keys = registry.keys(cursor, homes)
+            _, away_keys = registry.keys(cursor, aways)
+            self.update_many(cursor, "matches", "id", ["home_team_key", "away_team_key"],
+                             [(i, int(h), int(a)) for i, h, a in zip(ids, home_keys, away_keys)])
+            migrated += len(rows)
+
+        # Sentiments : renommage en nom canonique (=> nouvelles empreintes), puis dédoublonnage
+        cursor.execute("SELECT id, team, source_text FROM sentiments WHERE team_key IS NULL")
+        rows = cursor.fetchall()
+        if rows:
+            ids, teams, texts = zip(*rows)
+            names, keys = registry.keys(cursor, teams)
+            cursor.execute("SELECT content_hash FROM sentiments WHERE team_key IS NOT NULL")
+            seen = {r[0] for r in cursor.fetchall()}
+            updates, duplicates = [], []
+            for i, n, k, t in zip(ids, names, keys, texts):
+                digest = self.headline_hash(n, t)
+                if digest in seen:
+                    duplicates.append((i,))     # même titre déjà stocké sous l'autre graphie
+                    continue
+                seen.add(digest)
+                updates.append((i, n, int(k), digest))
+            if duplicates:
+                ph = self.get_placeholder()
+                cursor.executemany(f"DELETE FROM sentiments WHERE id = {ph}", duplicates)
+            self.update_many(cursor, "sentiments", "id", ["team", "team_key", "content_hash"], updates)
+            migrated += len(rows)
+
+        # Cumul journalier : les lignes d'un alias sont fusionnées dans celles du nom canonique
+        cursor.execute("SELECT date, team, score_sum, n FROM sentiment_daily WHERE team_key IS NULL")
+        rows = cursor.fetchall()
+        if rows:
+            dates, teams, sums, counts = zip(*rows)
+            names, keys = registry.keys(cursor, teams)
+            merged = {}
+            for date, name, key, total, n in zip(dates, names, keys, sums, counts):
+                old_total, old_n, _ = merged.get((date, name), (0.0, 0, key))
+                merged[(date, name)] = (old_total + total, old_n + n, key)
+            cursor.execute("DELETE FROM sentiment_daily WHERE team_key IS NULL")
+            self.insert_many(cursor, "sentiment_daily", ["date", "team", "team_key", "score_sum", "n"],
+                             [(d, name, int(k), t, n) for (d, name), (t, n, k) in merged.items()],
+                             on_conflict='''ON CONFLICT (date, team) DO UPDATE SET
+                                 score_sum = sentiment_daily.score_sum + EXCLUDED.score_sum,
+                                 n = sentiment_daily.n + EXCLUDED.n''')
+            migrated += len(rows)
+
+        if migrated:
+            print(f"🏷️ Référentiel des équipes : {migrated} lignes migrées (noms canoniques + clés).")
+
+    def _migrate_updated_at(self, cursor):
+        """Date de dernière modification des matchs (secondes UNIX), filigrane des synchronisations."""
+        big_int = "BIGINT" if self.is_postgres else "INTEGER"
+        self.add_column_if_missing(cursor, "matches", "updated_at", big_int)
+        ph = self.get_placeholder()
+        cursor.execute(f"UPDATE matches SET updated_at = {ph} WHERE updated_at IS NULL",
+                       (int(datetime.now(timezone.utc).timestamp()),))
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_matches_updated_at ON matches (updated_at)")
+
+    def _migrate_settled_at(self, cursor):
+        """Date de règlement des paris (secondes UNIX), filigrane de l'export du registre des paris."""
+        big_int = "BIGINT" if self.is_postgres else "INTEGER"
+        self.add_column_if_missing(cursor, "bets", "settled_at", big_int)
+        ph = self.get_placeholder()
+        cursor.execute(f"UPDATE bets SET settled_at = {ph} WHERE settled_at IS NULL AND result IN ('WIN', 'LOSE')",
+                       (int(datetime.now(timezone.utc).timestamp()),))
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_bets_settled_at ON bets (settled_at)")
+
+    def _migrate_h2h_index(self, cursor):
+        """Ancien index H2H par noms d'équipe : supprimé, il est reconstruit depuis `matches` au prochain chargement."""
+        if self.is_postgres:
+            cursor.execute('''
+                SELECT 1 FROM information_schema.columns WHERE table_name = 'h2h_index' AND column_name = 'home_team'
+            ''')
+            legacy = cursor.fetchone() is not None
+        else:
+            cursor.execute("PRAGMA table_info(h2h_index)")
+            legacy = 'home_team' in [row[1] for row in cursor.fetchall()]
+        if legacy:
+            cursor.execute("DROP TABLE h2h_index")
+
+    def _migrate_bankroll_history(self, cursor):
+        """Cumuls des KPIs sur chaque ligne ; un ancien historique sans cumuls est reconstruit au prochain rapport."""
+        self.add_column_if_missing(cursor, "bankroll_history", "cumulative_bets", "INTEGER")
+        self.add_column_if_missing(cursor, "bankroll_history", "cumulative_wins", "INTEGER")
+        self.add_column_if_missing(cursor, "bankroll_history", "cumulative_stake", "REAL")
+        cursor.execute("DELETE FROM bankroll_history WHERE cumulative_bets IS NULL")
+
+    def _migrate_league(self, cursor):
+        """Championnat (code football-data : F1, F2...) ; l'historique existant est la Ligue 1."""
+        self.add_column_if_missing(cursor, "matches", "league", "TEXT")
+        cursor.execute("UPDATE matches SET league = 'F1' WHERE league IS NULL")
+
+    def _seed_odds_snapshots(self, cursor):
+        """Première mise en place : les cotes déjà connues deviennent le premier relevé (daté du jour du match)."""
+        cursor.execute("SELECT COUNT(*) FROM odds_snapshots")
+        if cursor.fetchone()[0] > 0:
+            return
+        cursor.execute("SELECT id, date, home_odds, draw_odds, away_odds FROM matches WHERE home_odds IS NOT NULL")
+        rows = []
+        for match_id, date, h, d, a in cursor.fetchall():
+            try:
+                day = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+            except (TypeError, ValueError):
+                continue
+            rows.append((match_id, int(day.timestamp()), h, d, a))
+        if rows:
+            ph = self.get_placeholder()
+            cursor.executemany(
+                f"INSERT INTO odds_snapshots (match_id, ts, home_odds, draw_odds, away_odds) VALUES ({ph}, {ph}, {ph}, {ph}, {ph})",
+                rows
+            )
+            print(f"📈 {len(rows)} cotes existantes reprises dans l'historique.")
+
     def initialize_tables(self):
         """Crée les tables en s'adaptant à la base de données."""
         conn = self.get_connection()
@@ -43,8 +311,10 @@ class BettingDB:
         else:
             auto_inc = "INTEGER PRIMARY KEY AUTOINCREMENT"
 
+        big_int = "BIGINT" if self.is_postgres else "INTEGER"
+
         # 1. Table MATCHS
-        cursor.execute('''
+        cursor.execute(f'''
             CREATE TABLE IF NOT EXISTS matches (
                 id TEXT PRIMARY KEY,
                 date TEXT,
@@ -55,9 +325,15 @@ class BettingDB:
                 away_odds REAL,
                 home_score INTEGER,
                 away_score INTEGER,
-                status TEXT DEFAULT 'SCHEDULED'
+                status TEXT DEFAULT 'SCHEDULED',
+                home_team_key INTEGER,
+                away_team_key INTEGER,
+                updated_at {big_int},
+                league TEXT
             )
         ''')
+        self._migrate_updated_at(cursor)
+        self._migrate_league(cursor)
 
         # 2. Table SENTIMENTS
         cursor.execute(f'''
@@ -66,9 +342,45 @@ class BettingDB:
                 date TEXT,
                 team TEXT,
                 sentiment_score REAL,
-                source_text TEXT
+                source_text TEXT,
+                content_hash TEXT,
+                team_key INTEGER
+            )
+        ''')
+
+        # 2b. Cumul journalier par équipe (maintenu au fil de l'eau par le collecteur)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sentiment_daily (
+                date TEXT,
+                team TEXT,
+                score_sum REAL,
+                n INTEGER,
+                team_key INTEGER,
+                PRIMARY KEY (date, team)
+            )
+        ''')
+        # Empreintes des titres purgés : un vieil article qui réapparaît dans un flux reste ignoré
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sentiment_seen (
+                content_hash TEXT PRIMARY KEY
             )
         ''')
+        self._migrate_sentiments(cursor)
+
+        # 2c. Référentiel des équipes (ID entiers + alias des différentes sources)
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS teams (
+                id {auto_inc},
+                name TEXT UNIQUE
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS team_aliases (
+                alias TEXT PRIMARY KEY,
+                team_id INTEGER REFERENCES teams(id)
+            )
+        ''')
+        self._migrate_teams(cursor)
 
         # 3. Table PARIS (Bets)
         cursor.execute(f'''
@@ -83,9 +395,85 @@ class BettingDB:
                 profit REAL,
                 bet_date TEXT,
                 model_version TEXT,
+                settled_at {big_int},
                 FOREIGN KEY(match_id) REFERENCES matches(id)
             )
         ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_bets_result ON bets (result)")
+        self._migrate_settled_at(cursor)
+
+        # 3b. Historique des cotes (ajout seul, une ligne par variation)
+        without_rowid = "" if self.is_postgres else "WITHOUT ROWID"
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS odds_snapshots (
+                match_id TEXT NOT NULL,
+                ts {big_int} NOT NULL,
+                home_odds REAL,
+                draw_odds REAL,
+                away_odds REAL,
+                PRIMARY KEY (match_id, ts)
+            ) {without_rowid}
+        ''')
+        self._seed_odds_snapshots(cursor)
+
+        # 3c. Index des confrontations directes (agrégats par affiche de clés d'équipe, maintenus par le collecteur)
+        self._migrate_h2h_index(cursor)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS h2h_index (
+                home_team_key INTEGER,
+                away_team_key INTEGER,
+                games INTEGER,
+                points REAL,
+                goal_diff REAL,
+                score REAL,
+                last_day INTEGER,
+                PRIMARY KEY (home_team_key, away_team_key)
+            )
+        ''')
+
+        # 3d. Points de reprise des collecteurs (fichier / flux déjà traités)
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS collector_checkpoints (
+                source TEXT,
+                item TEXT,
+                position TEXT,
+                fingerprint TEXT,
+                status TEXT,
+                updated_at {big_int},
+                PRIMARY KEY (source, item)
+            )
+        ''')
+
+        # 3e. Prédictions de tous les modèles du registre (mode shadow)
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS predictions (
+                id {auto_inc},
+                match_id TEXT,
+                model_name TEXT,
+                model_version TEXT,
+                prob_home REAL,
+                prob_draw REAL,
+                prob_away REAL,
+                prediction TEXT,
+                is_production INTEGER,
+                created_at TEXT,
+                UNIQUE (match_id, model_name, model_version)
+            )
+        ''')
+
+        # 4. Historique de bankroll (alimenté en ajout seul par le Visualizer)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS bankroll_history (
+                step INTEGER PRIMARY KEY,
+                bet_id INTEGER UNIQUE,
+                profit REAL,
+                cumulative_profit REAL,
+                cumulative_bets INTEGER,
+                cumulative_wins INTEGER,
+                cumulative_stake REAL
+            )
+        ''')
+        self._migrate_bankroll_history(cursor)
 
         conn.commit()
         conn.close()
@@ -0,0 +1,155 @@
+"""
+Export colonnaire du registre des paris réglés, pour l'analyse hors base.
+
+Chaque pari réglé est joint à son match (date, équipes, cotes, score, championnat) et aux
+probabilités du modèle qui l'a placé (table `predictions`), puis écrit en colonnes NumPy :
+
+    data/ledger/season=2324/league=F1/part-00000/<colonne>.npy
+    data/ledger/_manifest.json        (filigrane `bets.settled_at`, parties écrites)
+
+Chaque export n'ajoute qu'une nouvelle partie par (saison, championnat) avec les paris réglés
+depuis le filigrane : les parties existantes ne sont jamais réécrites. Les colonnes (nombres,
+chaînes à largeur fixe) se relisent projetées en mémoire (`np.load(mmap_mode='r')`), sans copie
+ni accès à la base de production.
+
+    python -m src.ledger_export            # ajoute les nouveaux règlements
+    python -m src.ledger_export --full     # reconstruit tout l'export
+"""
+import glob
+import json
+import os
+import shutil
+import sys
+import numpy as np
+import pandas as pd
+from src.database import BettingDB
+from src.utils.instrumentation import timed, current_span
+
+LEDGER_QUERY = '''
+    SELECT b.id AS bet_id, b.settled_at, b.bet_date, b.match_id, b.prediction, b.confidence, b.stake,
+           b.odds_taken, b.result, b.profit, b.model_version,
+           m.date, m.league, m.home_team, m.away_team, m.home_odds, m.draw_odds, m.away_odds,
+           m.home_score, m.away_score,
+           p.prob_home, p.prob_draw, p.prob_away
+    FROM bets b
+    JOIN matches m ON b.match_id = m.id
+    LEFT JOIN predictions p ON p.match_id = b.match_id
+        AND p.model_name || '/' || p.model_version = b.model_version
+        AND p.prob_home + p.prob_draw + p.prob_away > 0
+    WHERE b.result IN ('WIN', 'LOSE') AND b.settled_at >= {ph}
+    ORDER BY b.settled_at, b.id
+'''
+INT_COLUMNS = ['bet_id', 'settled_at']
+TEXT_COLUMNS = ['bet_date', 'match_id', 'prediction', 'result', 'model_version', 'date', 'league',
+                'home_team', 'away_team']
+FLOAT_COLUMNS = ['confidence', 'stake', 'odds_taken', 'profit', 'home_odds', 'draw_odds', 'away_odds',
+                 'home_score', 'away_score', 'prob_home', 'prob_draw', 'prob_away']
+COLUMNS = INT_COLUMNS + TEXT_COLUMNS + FLOAT_COLUMNS
+
+
+def season_of(dates):
+    """Saison (ex: "2324") de chaque date : une saison commence en juillet."""
+    dates = pd.to_datetime(pd.Series(dates))
+    start = dates.dt.year - (dates.dt.month < 7)
+    return (start % 100).map("{:02d}".format) + ((start + 1) % 100).map("{:02d}".format)
+
+
+class LedgerExport:
+    def __init__(self, source=None, root="data/ledger"):
+        self.source = source or BettingDB()
+        self.root = root
+        self.manifest_path = os.path.join(root, "_manifest.json")
+
+    def _manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"watermark": -1, "boundary_ids": [], "parts": {}, "rows": 0}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=4, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def _columns(df):
+        """DataFrame -> colonnes NumPy projetables en mémoire (pas de tableaux d'objets)."""
+        arrays = {c: df[c].fillna(-1).to_numpy(dtype=np.int64) for c in INT_COLUMNS}
+        arrays.update({c: df[c].fillna("").astype(str).to_numpy(dtype=str) for c in TEXT_COLUMNS})
+        arrays.update({c: df[c].to_numpy(dtype=np.float64) for c in FLOAT_COLUMNS})
+        return arrays
+
+    def _write_part(self, partition, number, df):
+        folder = os.path.join(self.root, partition, f"part-{number:05d}")
+        tmp_folder = folder + ".tmp"
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        os.makedirs(tmp_folder)
+        for column, values in self._columns(df).items():
+            np.save(os.path.join(tmp_folder, f"{column}.npy"), values)
+        os.replace(tmp_folder, folder)
+
+    @timed("ledger.export")
+    def export(self, full=False):
+        """Ajoute les paris réglés depuis le dernier export. Retourne le nombre de lignes écrites."""
+        if full:
+            shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+        manifest = self._manifest()
+
+        # Filigrane inclus (règlements de la même seconde), moins les paris déjà exportés à cette seconde
+        conn = self.source.get_connection()
+        df = pd.read_sql_query(LEDGER_QUERY.format(ph=self.source.get_placeholder()), conn,
+                               params=(manifest["watermark"],))
+        conn.close()
+        df = df[~df['bet_id'].isin(manifest["boundary_ids"])]
+        if df.empty:
+            print("📒 Registre des paris : rien de nouveau à exporter.")
+            current_span().set(rows=0)
+            return 0
+
+        df['league'] = df['league'].fillna('F1')
+        df['season'] = season_of(df['date']).to_numpy()
+        for (season, league), part in df.groupby(['season', 'league'], sort=True):
+            partition = f"season={season}/league={league}"
+            number = manifest["parts"].get(partition, 0)
+            self._write_part(partition, number, part)
+            manifest["parts"][partition] = number + 1
+
+        watermark = int(df['settled_at'].max())
+        boundary = df.loc[df['settled_at'] == watermark, 'bet_id'].tolist()
+        if watermark == manifest["watermark"]:
+            boundary += manifest["boundary_ids"]
+        manifest.update(watermark=watermark, boundary_ids=sorted(int(i) for i in boundary),
+                        rows=manifest["rows"] + len(df))
+        self._save_manifest(manifest)
+
+        current_span().set(rows=len(df), partitions=df.groupby(['season', 'league']).ngroups)
+        print(f"📒 Registre des paris : {len(df)} paris réglés exportés ({manifest['rows']} au total).")
+        return len(df)
+
+    # --- Lecture (aucun accès à la base) ---
+
+    def partitions(self, season=None, league=None):
+        pattern = os.path.join(self.root, f"season={season or '*'}", f"league={league or '*'}", "part-*[0-9]")
+        return sorted(glob.glob(pattern))
+
+    @staticmethod
+    def read_part(folder, columns=None):
+        """Colonnes d'une partie, projetées en mémoire (lecture seule, aucune copie)."""
+        return {c: np.load(os.path.join(folder, f"{c}.npy"), mmap_mode='r') for c in (columns or COLUMNS)}
+
+    def scan(self, columns=None, season=None, league=None):
+        """Itère sur les parties (dict colonne -> tableau projeté), filtrées par saison / championnat."""
+        for folder in self.partitions(season, league):
+            yield self.read_part(folder, columns)
+
+    def to_frame(self, columns=None, season=None, league=None):
+        """DataFrame des parties sélectionnées (copie en mémoire, pour les analyses ponctuelles)."""
+        parts = [pd.DataFrame({c: np.asarray(v) for c, v in part.items()})
+                 for part in self.scan(columns, season, league)]
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns or COLUMNS)
+
+
+if __name__ == "__main__":
+    LedgerExport().export(full="--full" in sys.argv)
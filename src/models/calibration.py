@@ -0,0 +1,184 @@
+"""
+Calibration des probabilités (1 / N / 2) du modèle.
+
+Le filtre Value compare la confiance à 1/cote + 5% : il suppose des probabilités fiables.
+Le calibrateur est ajusté une fois, à l'entraînement, sur des prédictions hors échantillon
+(blocs chronologiques jamais vus par le modèle qui les prédit), enregistré avec la version
+du modèle (calibration.json) puis appliqué en une opération vectorisée sur tout un lot.
+
+- "temperature" : p_k ∝ p_k ^ (1 / T), un seul paramètre, conserve le classement des issues.
+- "isotonic"    : une fonction croissante par issue (un contre tous), puis renormalisation.
+
+    python -m src.models.calibration            # courbe de fiabilité du modèle en production
+"""
+import json
+import sys
+import numpy as np
+import pandas as pd
+from sklearn.isotonic import IsotonicRegression
+from sklearn.metrics import log_loss
+
+EPS = 1e-12
+
+
+class ProbabilityCalibrator:
+    def __init__(self, method="temperature"):
+        if method not in ("temperature", "isotonic"):
+            raise ValueError(f"Méthode de calibration inconnue : {method}")
+        self.method = method
+        self.temperature = 1.0
+        self.curves = []        # isotonic : (seuils x, valeurs y) par issue
+
+    def fit(self, probs, y):
+        probs, y = np.asarray(probs, dtype=float), np.asarray(y, dtype=int)
+        if self.method == "temperature":
+            # Log-loss convexe en 1/T : recherche sur une grille logarithmique, puis affinage local
+            log_p = np.log(np.clip(probs, EPS, 1.0))
+            grid = np.exp(np.linspace(np.log(0.1), np.log(20.0), 81))
+            for _ in range(2):
+                losses = [self._temperature_loss(log_p, y, t) for t in grid]
+                best = int(np.argmin(losses))
+                lo, hi = grid[max(best - 1, 0)], grid[min(best + 1, len(grid) - 1)]
+                grid = np.linspace(lo, hi, 41)
+            self.temperature = float(grid[int(np.argmin([self._temperature_loss(log_p, y, t) for t in grid]))])
+        else:
+            self.curves = []
+            for k in range(probs.shape[1]):
+                iso = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds="clip").fit(probs[:, k], y == k)
+                self.curves.append((iso.X_thresholds_.tolist(), iso.y_thresholds_.tolist()))
+        return self
+
+    @staticmethod
+    def _temperature_loss(log_p, y, t):
+        scaled = log_p / t
+        scaled -= scaled.max(axis=1, keepdims=True)
+        log_norm = np.log(np.exp(scaled).sum(axis=1))
+        return float(np.mean(log_norm - scaled[np.arange(len(y)), y]))
+
+    def transform(self, probs):
+        """Probabilités calibrées (n, 3) : une opération NumPy par issue, aucun ajustement."""
+        probs = np.asarray(probs, dtype=float)
+        if len(probs) == 0:
+            return probs
+        if self.method == "temperature":
+            scaled = np.log(np.clip(probs, EPS, 1.0)) / self.temperature
+            scaled -= scaled.max(axis=1, keepdims=True)
+            out = np.exp(scaled)
+        else:
+            out = np.column_stack([np.interp(probs[:, k], x, v) for k, (x, v) in enumerate(self.curves)])
+            out = np.clip(out, EPS, None)
+        return out / out.sum(axis=1, keepdims=True)
+
+    # --- Persistance (enregistré avec la version du modèle) ---
+
+    def to_dict(self):
+        return {"method": self.method, "temperature": self.temperature, "curves": self.curves}
+
+    @classmethod
+    def from_dict(cls, data):
+        calibrator = cls(data["method"])
+        calibrator.temperature = data.get("temperature", 1.0)
+        calibrator.curves = [(list(x), list(v)) for x, v in data.get("curves", [])]
+        return calibrator
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def time_fold_predictions(make_model, X, y, n_folds=3):
+    """
+    Prédictions hors échantillon en fenêtre croissante : l'historique est coupé en n_folds + 1
+    blocs chronologiques, et le bloc k est prédit par un modèle entraîné sur les blocs < k.
+    Retourne (probabilités, cibles) des blocs 1..n_folds.
+    """
+    bounds = np.linspace(0, len(X), n_folds + 2).astype(int)
+    probs, targets = [], []
+    for start, end in zip(bounds[1:-1], bounds[2:]):
+        y_fit = y.iloc[:start]
+        if end <= start or y_fit.nunique() < 3:
+            continue
+        model = make_model().fit(X.iloc[:start], y_fit)
+        probs.append(model.predict_proba(X.iloc[start:end]))
+        targets.append(y.iloc[start:end].to_numpy())
+    if not probs:
+        return np.empty((0, 3)), np.empty(0, dtype=int)
+    return np.vstack(probs), np.concatenate(targets)
+
+
+def reliability_curve(probs, y, bins=10):
+    """Confiance de l'issue retenue vs fréquence observée, par tranche de confiance."""
+    probs, y = np.asarray(probs, dtype=float), np.asarray(y, dtype=int)
+    pred = probs.argmax(axis=1)
+    confidence = probs[np.arange(len(probs)), pred]
+    hit = (pred == y).astype(float)
+    which = np.minimum((confidence * bins).astype(int), bins - 1)
+    count = np.bincount(which, minlength=bins)
+    with np.errstate(invalid="ignore"):
+        curve = pd.DataFrame({
+            'bin_low': np.arange(bins) / bins,
+            'count': count,
+            'confidence': np.bincount(which, confidence, bins) / count,
+            'hit_rate': np.bincount(which, hit, bins) / count,
+        })
+    return curve[curve['count'] > 0].reset_index(drop=True)
+
+
+def calibration_report(probs, y, bins=10):
+    """Brier (multi-classe), log-loss et erreur de calibration (ECE) d'un lot de probabilités."""
+    probs, y = np.asarray(probs, dtype=float), np.asarray(y, dtype=int)
+    if len(y) == 0:
+        return {}
+    probs = np.clip(probs, EPS, 1.0)
+    probs /= probs.sum(axis=1, keepdims=True)      # sorties float32 de XGBoost
+    onehot = np.eye(probs.shape[1])[y]
+    curve = reliability_curve(probs, y, bins)
+    return {
+        'brier': float(np.mean(np.sum((probs - onehot) ** 2, axis=1))),
+        'log_loss': float(log_loss(y, probs, labels=list(range(probs.shape[1])))),
+        'ece': float(np.sum(curve['count'] * np.abs(curve['confidence'] - curve['hit_rate'])) / len(y)),
+        'n': int(len(y)),
+    }
+
+
+def print_report(raw, calibrated, curve=None):
+    print(f"📐 Calibration : Brier {raw['brier']:.4f} -> {calibrated['brier']:.4f} | "
+          f"log-loss {raw['log_loss']:.4f} -> {calibrated['log_loss']:.4f} | "
+          f"ECE {raw['ece']:.4f} -> {calibrated['ece']:.4f} ({calibrated['n']} matchs)")
+    if curve is not None:
+        for row in curve.itertuples(index=False):
+            print(f"   conf. >= {row.bin_low:.1f} | prédit {row.confidence:.2f} | "
+                  f"observé {row.hit_rate:.2f} | {row.count} matchs")
+
+
+if __name__ == "__main__":
+    from src.models.predictor_v3 import PredictorV3
+    predictor = PredictorV3()
+    artifact = predictor.load_production()
+    if artifact is None:
+        sys.exit("❌ Modèle non trouvé. Lance .train()")
+    # Équipes encodées comme à l'entraînement de cette version (pas de nouvel encodeur)
+    X, y = predictor.load_and_prepare_data(encoder=artifact.encoder)
+    X = X[artifact.features]
+    cutoff = artifact.meta.get("train_until")
+    if cutoff:
+        # Hors échantillon : seuls les matchs postérieurs à l'entraînement de la version
+        after = (predictor.match_dates > cutoff).to_numpy()
+        if not after.any():
+            sys.exit(f"⚠️ Aucun match terminé après la fin de l'entraînement ({cutoff}).")
+        raw, y_test = artifact.model.predict_proba(X[after]), y[after].to_numpy()
+        scope = f"matchs après le {cutoff}"
+    else:
+        # Version sans date de fin d'entraînement : blocs chronologiques jamais vus par leur modèle
+        raw, y_test = time_fold_predictions(predictor.make_model, X, y)
+        scope = "blocs chronologiques hors échantillon"
+    calibrated = predictor.calibrate(raw, artifact)
+    print(f"Version {artifact.name}/{artifact.version} — calibrateur : "
+          f"{artifact.calibrator.method if artifact.calibrator else 'aucun'} ({scope})")
+    print_report(calibration_report(raw, y_test), calibration_report(calibrated, y_test),
+                 reliability_curve(calibrated, y_test))
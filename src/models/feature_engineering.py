@@ -1,84 +1,139 @@
+import os
+import numpy as np
 import pandas as pd
 from src.database import BettingDB
+from src.models.team_stats import TeamStatsIndex, TEAM_FEATURES
+from src.teams import TeamRegistry, key_column
+from src.utils.instrumentation import timed, current_span
+
 
 class FeatureEngineer:
-    def __init__(self):
-        self.db = BettingDB()
-
-    def calculate_rolling_stats(self, df, window=5):
-        # ... (Le code de cette méthode ne change pas car pas de SQL direct) ...
-        # Copie-colle ton code existant pour calculate_rolling_stats ici
-        home_df = df[['date', 'home_team', 'home_score', 'away_score', 'result']].copy()
-        home_df.columns = ['date', 'team', 'score_for', 'score_ag', 'res']
-        home_df['points'] = home_df['res'].apply(lambda x: 3 if x == 'H' else (1 if x == 'D' else 0))
-        home_df['at_home'] = 1
-        away_df = df[['date', 'away_team', 'away_score', 'home_score', 'result']].copy()
-        away_df.columns = ['date', 'team', 'score_for', 'score_ag', 'res']
-        away_df['points'] = away_df['res'].apply(lambda x: 3 if x == 'A' else (1 if x == 'D' else 0))
-        away_df['at_home'] = 0
-        stats_df = pd.concat([home_df, away_df]).sort_values(['team', 'date'])
-        
-        # Amélioration EMA (Moyenne Exponentielle) intégrée
-        stats_df['form_last_5'] = stats_df.groupby('team')['points'].transform(lambda x: x.ewm(span=window).mean())
-        stats_df['goals_for_last_5'] = stats_df.groupby('team')['score_for'].transform(lambda x: x.ewm(span=window).mean())
-        stats_df['goals_ag_last_5'] = stats_df.groupby('team')['score_ag'].transform(lambda x: x.ewm(span=window).mean())
-        stats_df = stats_df.fillna(0)
-        return stats_df
-
-    def enrich_matches(self, matches_df):
+    def __init__(self, sentiment_window=7, db=None, workers=None):
+        self.db = db or BettingDB()
+        # Fenêtre (en jours) des actualités prises en compte avant le coup d'envoi
+        self.sentiment_window = sentiment_window
+        # Processus pour les moyennes par équipe (FEATURE_WORKERS, 1 = calcul dans le process courant)
+        self.workers = workers or int(os.getenv("FEATURE_WORKERS", "1"))
+        # Stats de forme au coup d'envoi : même index à l'entraînement et en inférence
+        self.team_stats = TeamStatsIndex(self.db, workers=self.workers)
+        self.teams = TeamRegistry(self.db)
+        self._sentiment_cache = {}
+
+    def team_keys(self, names):
+        """Noms d'équipes (alias compris) -> clés entières, -1 pour une équipe jamais vue."""
+        conn = self.db.get_connection()
+        keys = self.teams.lookup(conn.cursor(), names)
+        conn.close()
+        return keys
+
+    @timed("features.enrich_matches")
+    def enrich_matches(self, matches_df, workers=None):
+        """
+        Ajoute forme / attaque / défense des deux équipes, calculées sur les seuls matchs joués
+        avant chacun (une passe, cf. TeamStatsIndex). L'index reste prêt pour l'inférence.
+        """
+        self.team_stats.workers = workers or self.workers
+        matches_df = matches_df.reset_index(drop=True)
         matches_df['result'] = 'D'
         matches_df.loc[matches_df['home_score'] > matches_df['away_score'], 'result'] = 'H'
         matches_df.loc[matches_df['away_score'] > matches_df['home_score'], 'result'] = 'A'
-        stats = self.calculate_rolling_stats(matches_df)
-        
-        matches_df = pd.merge(matches_df, stats[['date', 'team', 'form_last_5', 'goals_for_last_5', 'goals_ag_last_5']], 
-                              left_on=['date', 'home_team'], right_on=['date', 'team'], how='left')
-        matches_df.rename(columns={'form_last_5': 'home_form', 'goals_for_last_5': 'home_att', 'goals_ag_last_5': 'home_def'}, inplace=True)
-        matches_df.drop(columns=['team'], inplace=True)
-
-        matches_df = pd.merge(matches_df, stats[['date', 'team', 'form_last_5', 'goals_for_last_5', 'goals_ag_last_5']], 
-                              left_on=['date', 'away_team'], right_on=['date', 'team'], how='left')
-        matches_df.rename(columns={'form_last_5': 'away_form', 'goals_for_last_5': 'away_att', 'goals_ag_last_5': 'away_def'}, inplace=True)
-        matches_df.drop(columns=['team'], inplace=True)
+
+        matches_df[TEAM_FEATURES] = self.team_stats.build(matches_df)
         matches_df.fillna(0, inplace=True)
+        current_span().set(rows=len(matches_df), workers=self.team_stats.workers)
         return matches_df
-    
-    def get_team_latest_stats(self, team_name, window=5):
+
+    def stats_as_of(self, matches_df):
+        """Features de forme (TEAM_FEATURES) de matchs à venir ou passés, index chargé depuis la base au besoin."""
+        if not self.team_stats.loaded:
+            self.team_stats.load()
+        return self.team_stats.features(matches_df)
+
+    @timed("features.get_team_latest_stats")
+    def get_team_latest_stats(self, team_key, match_date=None):
+        """(forme, attaque, défense) d'une équipe (clé) avant un match (aujourd'hui par défaut)."""
+        if not self.team_stats.loaded:
+            self.team_stats.load()
+        return self.team_stats.lookup(team_key, match_date)
+
+    def load_daily_sentiment(self):
+        """Sentiment agrégé par (jour, clé d'équipe) : somme des scores et nombre d'articles."""
         conn = self.db.get_connection()
-        ph = self.db.get_placeholder()
-        
-        # Requête dynamique
-        query = f'''
-            SELECT date, home_team, away_team, home_score, away_score 
-            FROM matches 
-            WHERE (home_team = {ph} OR away_team = {ph}) 
-            AND status = 'FINISHED'
-            ORDER BY date DESC 
-            LIMIT {ph}
-        '''
-        # Note: pandas read_sql_query gère les params comme execute
-        df = pd.read_sql_query(query, conn, params=(team_name, team_name, 20))
+        query = "SELECT date, team_key, score_sum, n FROM sentiment_daily WHERE team_key IS NOT NULL"
+        daily = pd.read_sql_query(query, conn)
         conn.close()
+        return daily
+
+    @timed("features.add_sentiment_features")
+    def add_sentiment_features(self, matches_df, daily=None):
+        """
+        Ajoute `sentiment_home` / `sentiment_away` : moyenne des scores de chaque équipe
+        sur les `sentiment_window` jours précédant le match (jour du match exclu).
+        Jointure temporelle vectorisée sur les clés d'équipe (sommes cumulées par équipe + merge_asof),
+        sans requête par match.
+        """
+        if daily is None:
+            daily = self.load_daily_sentiment()
 
-        if len(df) < window:
-            return 1.3, 1.2, 1.2
+        # Format long : une ligne par (match, équipe)
+        n = len(matches_df)
+        dates = pd.to_datetime(matches_df['date']).to_numpy()
+        long_df = pd.DataFrame({
+            'pos': np.arange(2 * n),
+            'team_key': np.concatenate([key_column(matches_df, 'home_team_key'),
+                                        key_column(matches_df, 'away_team_key')]),
+            'date': np.concatenate([dates, dates]),
+        })
 
-        df = df.sort_values('date', ascending=True)
-        points, goals_for, goals_ag = [], [], []
+        if daily.empty or n == 0:
+            matches_df['sentiment_home'] = 0.0
+            matches_df['sentiment_away'] = 0.0
+            return matches_df
 
-        for _, row in df.iterrows():
-            if row['home_team'] == team_name:
-                h, a = row['home_score'], row['away_score']
-                goals_for.append(h); goals_ag.append(a)
-                points.append(3 if h > a else (1 if h == a else 0))
-            else:
-                h, a = row['home_score'], row['away_score']
-                goals_for.append(a); goals_ag.append(h)
-                points.append(3 if a > h else (1 if a == h else 0))
+        daily = daily.copy()
+        daily['date'] = pd.to_datetime(daily['date'])
+        daily['team_key'] = daily['team_key'].astype(np.int64)
+        daily = daily.sort_values(['team_key', 'date'])
+        daily['cum_sum'] = daily.groupby('team_key')['score_sum'].cumsum()
+        daily['cum_n'] = daily.groupby('team_key')['n'].cumsum()
+        daily = daily.sort_values('date')[['date', 'team_key', 'cum_sum', 'cum_n']]
 
-        # Moyenne simple ici car on travaille sur une liste extraite
-        avg_form = sum(points[-window:]) / window
-        avg_att = sum(goals_for[-window:]) / window
-        avg_def = sum(goals_ag[-window:]) / window
+        def cumulative_at(offset_days):
+            # Cumul de chaque équipe au dernier jour <= (date du match - offset)
+            left = long_df.assign(key=long_df['date'] - pd.Timedelta(days=offset_days)).sort_values('key')
+            merged = pd.merge_asof(left, daily, left_on='key', right_on='date', by='team_key',
+                                   direction='backward', suffixes=('', '_news'))
+            merged = merged.sort_values('pos')
+            return merged['cum_sum'].fillna(0).to_numpy(), merged['cum_n'].fillna(0).to_numpy()
+
+        end_sum, end_n = cumulative_at(1)
+        start_sum, start_n = cumulative_at(self.sentiment_window + 1)
+        count = end_n - start_n
+        mean = np.divide(end_sum - start_sum, count, out=np.zeros(len(count)), where=count > 0)
+
+        matches_df['sentiment_home'] = mean[:n]
+        matches_df['sentiment_away'] = mean[n:]
+        current_span().set(rows=n)
+        return matches_df
 
-        return avg_form, avg_att, avg_def
\ No newline at end of file
+    def get_team_sentiment(self, team_key, match_date=None):
+        """
+        Sentiment d'une équipe (clé) avant un match (même définition qu'à l'entraînement).
+        Un seul agrégat par date de match, mis en cache pour toutes les équipes du lot.
+        """
+        match_day = pd.Timestamp(match_date or pd.Timestamp.now()).normalize()
+        if match_day not in self._sentiment_cache:
+            start = (match_day - pd.Timedelta(days=self.sentiment_window)).strftime("%Y-%m-%d")
+            end = match_day.strftime("%Y-%m-%d")
+            ph = self.db.get_placeholder()
+            conn = self.db.get_connection()
+            query = f'''
+                SELECT team_key, SUM(score_sum) / SUM(n) AS score
+                FROM sentiment_daily
+                WHERE date >= {ph} AND date < {ph} AND team_key IS NOT NULL
+                GROUP BY team_key
+            '''
+            df = pd.read_sql_query(query, conn, params=(start, end))
+            conn.close()
+            self._sentiment_cache[match_day] = dict(zip(df['team_key'].astype(int), df['score']))
+        return float(self._sentiment_cache[match_day].get(int(team_key), 0.0))
@@ -0,0 +1,170 @@
+"""
+Index des confrontations directes (H2H), clé (équipe à domicile, équipe à l'extérieur),
+chaque équipe désignée par sa clé entière (`teams.id`, colonnes `*_team_key`).
+
+Par paire : nombre de matchs, points et différence de buts cumulés (côté domicile) et un
+score pondéré par la récence (+1 victoire / 0 nul / -1 défaite, demi-vie en jours).
+Construit en une passe sur `matches`, mis à jour à chaque nouveau résultat, et servi en O(1)
+par match (features "avant le match" à l'entraînement comme en inférence).
+"""
+import numpy as np
+import pandas as pd
+from src.database import BettingDB
+from src.teams import key_column
+from src.utils.instrumentation import timed, current_span
+
+H2H_FEATURES = ['h2h_games', 'h2h_points', 'h2h_goal_diff', 'h2h_score']
+
+
+def to_day(dates):
+    """Dates -> numéro de jour (entier, depuis 1970-01-01)."""
+    return pd.to_datetime(pd.Series(dates)).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+class H2HIndex:
+    def __init__(self, db=None, half_life_days=730):
+        self.db = db or BettingDB()
+        self.decay = np.log(2) / half_life_days
+        self.pairs = {}         # (clé domicile, clé extérieur) -> [matchs, points, diff. de buts, score, dernier jour]
+        self.loaded = False
+        self.version = 0        # incrémenté à chaque mise à jour (invalide les tableaux de lookup_many)
+        self._arrays = None
+
+    def _features(self, entry, day):
+        if entry is None:
+            return (0, 0.0, 0.0, 0.0)
+        games, points, goal_diff, score, last_day = entry
+        return (games, points / games, goal_diff / games, score * np.exp(-self.decay * max(day - last_day, 0)))
+
+    def _update(self, home, away, day, home_score, away_score):
+        self.version += 1
+        entry = self.pairs.get((home, away))
+        outcome = np.sign(home_score - away_score)
+        points = 3 if outcome > 0 else (1 if outcome == 0 else 0)
+        if entry is None:
+            self.pairs[(home, away)] = [1, points, home_score - away_score, float(outcome), day]
+            return
+        entry[0] += 1
+        entry[1] += points
+        entry[2] += home_score - away_score
+        if day >= entry[4]:
+            entry[3] = entry[3] * np.exp(-self.decay * (day - entry[4])) + outcome
+            entry[4] = day
+        else:
+            # Résultat plus ancien que le dernier connu (rattrapage, autre fichier) : le score reste
+            # daté du dernier jour, ce résultat y entre déjà amorti
+            entry[3] += outcome * np.exp(-self.decay * (entry[4] - day))
+
+    @timed("h2h.build")
+    def build(self, matches_df, reset=True):
+        """
+        Une passe chronologique sur des matchs terminés : retourne les features H2H de chaque
+        match telles qu'elles étaient avant son coup d'envoi (alignées sur matches_df),
+        et laisse l'index dans son état final. `reset=False` : suite d'une passe par blocs.
+        """
+        if reset:
+            self.pairs = {}
+        days = to_day(matches_df['date']) if len(matches_df) else np.empty(0, dtype=np.int64)
+        homes = key_column(matches_df, 'home_team_key')
+        aways = key_column(matches_df, 'away_team_key')
+        home_scores = matches_df['home_score'].to_numpy(dtype=float)
+        away_scores = matches_df['away_score'].to_numpy(dtype=float)
+
+        features = np.zeros((len(matches_df), len(H2H_FEATURES)))
+        for i in np.argsort(days, kind="stable"):
+            if homes[i] < 0 or aways[i] < 0:
+                continue        # équipe sans clé : pas d'historique suivi
+            pair = (int(homes[i]), int(aways[i]))
+            features[i] = self._features(self.pairs.get(pair), days[i])
+            self._update(*pair, days[i], home_scores[i], away_scores[i])
+
+        self.loaded = True
+        current_span().set(rows=len(matches_df), pairs=len(self.pairs))
+        return pd.DataFrame(features, columns=H2H_FEATURES, index=matches_df.index)
+
+    def lookup(self, home_key, away_key, match_date=None):
+        """Features H2H d'une affiche (clés d'équipe) à une date (aujourd'hui par défaut)."""
+        day = to_day([match_date or pd.Timestamp.now()])[0]
+        return self._features(self.pairs.get((int(home_key), int(away_key))), day)
+
+    def _pair_arrays(self):
+        """Index des affiches + tableau (paires, 5) des valeurs, reconstruits seulement si l'index a changé."""
+        if self._arrays is None or self._arrays[0] is not self.pairs or self._arrays[1] != self.version:
+            keys = list(self.pairs)
+            index = pd.MultiIndex.from_tuples(keys) if keys else None
+            values = np.array(list(self.pairs.values()), dtype=float).reshape(-1, 5)
+            self._arrays = (self.pairs, self.version, index, values)
+        return self._arrays[2], self._arrays[3]
+
+    def lookup_many(self, home_keys, away_keys, dates):
+        """Features H2H d'un lot d'affiches (clés) : une recherche d'index et un calcul NumPy pour tout le lot."""
+        days = to_day(dates) if len(dates) else np.empty(0, dtype=np.int64)
+        out = np.zeros((len(days), len(H2H_FEATURES)))
+        index, values = self._pair_arrays()
+        if index is not None and len(days):
+            pos = index.get_indexer(pd.MultiIndex.from_arrays([np.asarray(home_keys, dtype=np.int64),
+                                                               np.asarray(away_keys, dtype=np.int64)]))
+            found = pos >= 0
+            games, points, goal_diff, score, last_day = values[pos[found]].T
+            out[found] = np.column_stack([
+                games, points / games, goal_diff / games,
+                score * np.exp(-self.decay * np.maximum(days[found] - last_day, 0)),
+            ])
+        return pd.DataFrame(out, columns=H2H_FEATURES)
+
+    # --- Persistance (table h2h_index) ---
+
+    def load(self, cursor=None):
+        """Charge l'index depuis la base ; le construit (et l'enregistre) si la table est vide."""
+        conn = None
+        if cursor is None:
+            conn = self.db.get_connection()
+            cursor = conn.cursor()
+
+        cursor.execute("SELECT home_team_key, away_team_key, games, points, goal_diff, score, last_day FROM h2h_index")
+        rows = cursor.fetchall()
+        if rows:
+            self.pairs = {(h, a): [g, p, gd, s, d] for h, a, g, p, gd, s, d in rows}
+            self.loaded = True
+        else:
+            cursor.execute('''
+                SELECT date, home_team_key, away_team_key, home_score, away_score
+                FROM matches WHERE status = 'FINISHED' ORDER BY date ASC
+            ''')
+            finished = pd.DataFrame(cursor.fetchall(),
+                                    columns=['date', 'home_team_key', 'away_team_key', 'home_score', 'away_score'])
+            self.build(finished)
+            self.save(cursor, self.pairs)
+
+        if conn is not None:
+            conn.commit()
+            conn.close()
+        return self
+
+    def save(self, cursor, pairs):
+        rows = [(h, a, int(g), float(p), float(gd), float(s), int(d)) for (h, a), (g, p, gd, s, d) in pairs.items()]
+        self.db.insert_many(
+            cursor, "h2h_index",
+            ["home_team_key", "away_team_key", "games", "points", "goal_diff", "score", "last_day"], rows,
+            on_conflict='''ON CONFLICT (home_team_key, away_team_key) DO UPDATE SET
+                games = EXCLUDED.games, points = EXCLUDED.points, goal_diff = EXCLUDED.goal_diff,
+                score = EXCLUDED.score, last_day = EXCLUDED.last_day'''
+        )
+
+    def apply_results(self, cursor, results):
+        """
+        Mise à jour incrémentale avec de nouveaux résultats
+        `(date, clé domicile, clé extérieur, buts dom., buts ext.)`.
+        Seules les paires touchées sont réécrites.
+        """
+        if not results:
+            return 0
+        if not self.loaded:
+            self.load(cursor)
+        results = sorted(results, key=lambda r: r[0])
+        days = to_day([r[0] for r in results])
+        for (_, home, away, home_score, away_score), day in zip(results, days):
+            self._update(int(home), int(away), day, home_score, away_score)
+        touched = {(int(r[1]), int(r[2])) for r in results}
+        self.save(cursor, {pair: self.pairs[pair] for pair in touched})
+        return len(results)
@@ -6,10 +6,17 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
 from sklearn.preprocessing import LabelEncoder
 from src.database import BettingDB
+from src.models.feature_engineering import FeatureEngineer
+from src.models.registry import ModelRegistry, data_hash
+from src.teams import encode_teams
 
 class PredictorV1:
-    def __init__(self):
+    def __init__(self, registry=None):
         self.db = BettingDB()
+        self.fe = FeatureEngineer()
+        self.registry = registry or ModelRegistry()
+        self.model_name = "v1"
+        self.artifact = None
         self.model = None
         self.encoder = LabelEncoder()
         self.model_path = "data/model_v1.pkl"
@@ -20,7 +27,8 @@ class PredictorV1:
         conn = self.db.get_connection()
         # On ne charge que les matchs terminés pour l'entraînement
         query = '''
-            SELECT home_team, away_team, home_odds, draw_odds, away_odds, home_score, away_score 
+            SELECT date, home_team, away_team, home_odds, draw_odds, away_odds, home_score, away_score,
+                   home_team_key, away_team_key
             FROM matches 
             WHERE status = 'FINISHED'
         '''
@@ -39,28 +47,26 @@ class PredictorV1:
         all_teams = pd.concat([df['home_team'], df['away_team']]).unique()
         
         if training:
-            self.encoder.fit(all_teams)
-            joblib.dump(self.encoder, self.encoder_path)
-        else:
-            # En mode prédiction, on charge l'encodeur existant
+            # Encodeur sauvegardé avec la version du modèle (registre), plus dans le fichier partagé
+            self.encoder = LabelEncoder().fit(all_teams)
+        elif not hasattr(self.encoder, 'classes_'):
+            # En mode prédiction sans registre, on charge l'ancien encodeur
             try:
                 self.encoder = joblib.load(self.encoder_path)
             except:
                 self.encoder.fit(all_teams) # Fallback
 
-        # Transformation des noms en ID numériques
-        # On utilise .map pour éviter les erreurs si une équipe est inconnue (on met -1)
-        # (Astuce robuste pour la prod)
-        df['home_team_id'] = df['home_team'].apply(lambda x: self.encoder.transform([x])[0] if x in self.encoder.classes_ else -1)
-        df['away_team_id'] = df['away_team'].apply(lambda x: self.encoder.transform([x])[0] if x in self.encoder.classes_ else -1)
+        # Transformation des noms en ID numériques : recherche vectorisée dans les classes
+        # de l'encodeur, -1 si une équipe est inconnue (robuste pour la prod)
+        df['home_team_id'] = encode_teams(self.encoder, df['home_team'])
+        df['away_team_id'] = encode_teams(self.encoder, df['away_team'])
 
         # Sélection des Features (X)
         features = ['home_team_id', 'away_team_id', 'home_odds', 'draw_odds', 'away_odds']
         
-        # Ajout fictif du Sentiment (sera 0 pour l'historique, mais prêt pour le futur)
-        # Dans la V2, on fera une jointure SQL réelle ici.
-        df['sentiment_home'] = 0.0 
-        df['sentiment_away'] = 0.0
+        # Sentiment des jours précédant le match (jointure temporelle vectorisée)
+        if 'sentiment_home' not in df.columns:
+            df = self.fe.add_sentiment_features(df)
         features.extend(['sentiment_home', 'sentiment_away'])
 
         X = df[features]
@@ -114,12 +120,21 @@ class PredictorV1:
         print("Rapport détaillé :")
         print(classification_report(y_test, predictions, target_names=['Home', 'Draw', 'Away']))
 
-        # Sauvegarde
-        joblib.dump(self.model, self.model_path)
-        print(f"💾 Modèle sauvegardé dans {self.model_path}")
+        # Sauvegarde (nouvelle version dans le registre)
+        version = self.registry.register(
+            self.model_name, self.model, self.encoder, list(X.columns), data_hash(X, y),
+            metrics={'accuracy': float(accuracy), 'n_train': len(X_train), 'n_test': len(X_test)}
+        )
+        self.artifact = self.registry.load(self.model_name, version)
+        print(f"💾 Modèle sauvegardé (registre {self.model_name}/{version})")
 
-    def predict_match(self, home_team, away_team, home_odds, draw_odds, away_odds):
+    def predict_match(self, home_team, away_team, home_odds, draw_odds, away_odds, match_date=None):
         """Fait une prédiction pour un match spécifique."""
+        artifact = self.registry.get(self.model_name)
+        if artifact is not None and artifact is not self.artifact:
+            # Nouvelle version en production : bascule modèle + encodeur ensemble
+            self.artifact = artifact
+            self.model, self.encoder = artifact.model, artifact.encoder
         if self.model is None:
             try:
                 self.model = joblib.load(self.model_path)
@@ -128,10 +143,13 @@ class PredictorV1:
                 return None
 
         # Création d'un DataFrame d'une seule ligne
+        home_key, away_key = self.fe.team_keys([home_team, away_team])
         data = {
             'home_team': [home_team], 'away_team': [away_team],
             'home_odds': [home_odds], 'draw_odds': [draw_odds], 'away_odds': [away_odds],
-            'home_score': [None], 'away_score': [None] # Dummy
+            'home_score': [None], 'away_score': [None], # Dummy
+            'sentiment_home': [self.fe.get_team_sentiment(home_key, match_date)],
+            'sentiment_away': [self.fe.get_team_sentiment(away_key, match_date)],
         }
         df_single = pd.DataFrame(data)
         
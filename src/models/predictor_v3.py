@@ -1,3 +1,6 @@
+import os
+import tempfile
+import numpy as np
 import pandas as pd
 import joblib
 import xgboost as xgb
@@ -5,41 +8,74 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
 from sklearn.preprocessing import LabelEncoder
 from src.database import BettingDB
+from src.models.calibration import (ProbabilityCalibrator, time_fold_predictions, calibration_report,
+                                    reliability_curve, print_report)
 from src.models.feature_engineering import FeatureEngineer
+from src.models.h2h import H2HIndex, H2H_FEATURES
+from src.models.registry import ModelRegistry, ModelArtifact, data_hash
+from src.models.team_stats import TEAM_FEATURES
+from src.models.streaming import StreamingFeatureWriter, ChunkIter, chunk_files, default_nthread
+from src.teams import encode_teams, key_column
+from src.utils.instrumentation import timed, current_span
 
 class PredictorV3:
-    def __init__(self):
-        self.db = BettingDB()
-        self.fe = FeatureEngineer()
+    # PARAMÈTRES GAGNANTS (+1023€)
+    PARAMS = dict(n_estimators=200, learning_rate=0.05, max_depth=5)
+    FEATURES = [
+        'home_team_id', 'away_team_id', 
+        'home_odds', 'draw_odds', 'away_odds',
+        'home_form', 'home_att', 'home_def', 
+        'away_form', 'away_att', 'away_def',
+        'sentiment_home', 'sentiment_away'
+    ] + H2H_FEATURES
+
+    def __init__(self, registry=None, db=None, calibration="temperature"):
+        # db : base lue pour les features (ex: copie locale synchronisée, cf. src/snapshot.py)
+        self.db = db or BettingDB()
+        # Calibration des probabilités ajustée à l'entraînement ("temperature", "isotonic" ou None)
+        self.calibration = calibration
+        self.fe = FeatureEngineer(db=self.db)
+        self.h2h = H2HIndex(self.db)
+        self.registry = registry or ModelRegistry()
+        self.model_name = "v3"
+        self.artifact = None
         self.model = None
         self.encoder = LabelEncoder()
+        self.features = None
+        # Anciens fichiers partagés : lus en secours si le registre est vide, plus jamais écrits
         self.model_path = "data/model_v3_xgb.json"
         self.encoder_path = "data/encoder.pkl"
+        self.train_hash = None
+        self.match_dates = None
 
-    def load_and_prepare_data(self):
+    @timed("predictor.load_and_prepare_data")
+    def load_and_prepare_data(self, encoder=None):
+        """
+        Features et cibles de tous les matchs terminés (ordre chronologique ; dates dans `match_dates`).
+        `encoder` : encodeur d'équipes d'une version existante (évaluation) ; sinon un nouveau est ajusté.
+        """
         conn = self.db.get_connection()
         query = "SELECT * FROM matches WHERE status = 'FINISHED' ORDER BY date ASC"
         df = pd.read_sql_query(query, conn)
         conn.close()
 
-        # Feature Engineering (Stats de forme)
+        # Feature Engineering (Stats de forme + sentiment avant le match)
         df = self.fe.enrich_matches(df)
+        df = self.fe.add_sentiment_features(df)
+        # Confrontations directes avant chaque match (une passe ; l'index reste prêt pour l'inférence)
+        df[H2H_FEATURES] = self.h2h.build(df)
         
-        all_teams = pd.concat([df['home_team'], df['away_team']]).unique()
-        self.encoder.fit(all_teams)
-        joblib.dump(self.encoder, self.encoder_path)
-
-        df['home_team_id'] = df['home_team'].apply(lambda x: self.encoder.transform([x])[0])
-        df['away_team_id'] = df['away_team'].apply(lambda x: self.encoder.transform([x])[0])
-
-        features = [
-            'home_team_id', 'away_team_id', 
-            'home_odds', 'draw_odds', 'away_odds',
-            'home_form', 'home_att', 'home_def', 
-            'away_form', 'away_att', 'away_def'
-        ]
-        
-        X = df[features]
+        # L'encodeur est gardé en mémoire et sauvegardé avec la version du modèle (registre),
+        # pour ne plus écraser celui du modèle en production
+        if encoder is None:
+            all_teams = pd.concat([df['home_team'], df['away_team']]).unique()
+            encoder = self.encoder = LabelEncoder().fit(all_teams)
+
+        df['home_team_id'] = encode_teams(encoder, df['home_team'])
+        df['away_team_id'] = encode_teams(encoder, df['away_team'])
+        self.match_dates = df['date'].reset_index(drop=True)
+
+        X = df[self.FEATURES]
         
         y_list = []
         for _, row in df.iterrows():
@@ -48,8 +84,11 @@ class PredictorV3:
             else: y_list.append(2)
         y = pd.Series(y_list)
 
+        self.train_hash = data_hash(X, y)
+        current_span().set(rows=len(X))
         return X, y
 
+    @timed("predictor.train")
     def train(self):
         print("🚀 Entraînement V3 (Version CHAMPION : Manuelle)...")
         X, y = self.load_and_prepare_data()
@@ -58,58 +97,244 @@ class PredictorV3:
         X_train, X_test = X.iloc[:split], X.iloc[split:]
         y_train, y_test = y.iloc[:split], y.iloc[split:]
 
-        # PARAMÈTRES GAGNANTS (+1023€)
-        self.model = xgb.XGBClassifier(
-            n_estimators=200,      
-            learning_rate=0.05,    
-            max_depth=5,           
-            objective='multi:softprob',
-            num_class=3,
-            eval_metric='mlogloss',
-            random_state=42
-        )
-
+        self.model = self.make_model()
         self.model.fit(X_train, y_train)
 
         preds = self.model.predict(X_test)
         acc = accuracy_score(y_test, preds)
         print(f"✅ Précision XGBoost : {acc:.2%}")
 
-        self.model.save_model(self.model_path)
+        # Calibrateur ajusté sur des blocs chronologiques de l'entraînement, évalué sur le test
+        calibrator, report = None, {}
+        if self.calibration:
+            fold_probs, fold_y = time_fold_predictions(self.make_model, X_train, y_train)
+            calibrator, report = self.fit_calibrator(fold_probs, fold_y, self.model.predict_proba(X_test), y_test)
+
+        version = self.registry.register(
+            self.model_name, self.model, self.encoder, self.FEATURES, self.train_hash,
+            metrics={'accuracy': float(acc), 'n_train': len(X_train), 'n_test': len(X_test)},
+            extra={'calibration_report': report, 'train_until': str(self.match_dates.iloc[split - 1])},
+            calibrator=calibrator
+        )
+        self.artifact = self.registry.load(self.model_name, version)
+        self.features = list(self.FEATURES)
         print("💾 Modèle V3 Champion sauvegardé.")
 
-    def predict_match(self, home, away, odds_h, odds_d, odds_a):
-        if self.model is None:
-            self.model = xgb.XGBClassifier()
-            try:
-                self.model.load_model(self.model_path)
-                self.encoder = joblib.load(self.encoder_path)
-            except:
-                print("❌ Modèle non trouvé. Lance .train()")
-                return "N (Erreur)", 0.0
+    @classmethod
+    def make_model(cls, n_jobs=None):
+        return xgb.XGBClassifier(
+            **cls.PARAMS,
+            objective='multi:softprob',
+            num_class=3,
+            eval_metric='mlogloss',
+            random_state=42,
+            n_jobs=n_jobs or default_nthread()
+        )
+
+    @timed("predictor.fit_calibrator")
+    def fit_calibrator(self, fit_probs, fit_y, eval_probs, eval_y):
+        """Ajuste le calibrateur sur des prédictions hors échantillon ; rapport brut / calibré sur l'évaluation."""
+        if len(fit_y) == 0 or len(eval_y) == 0:
+            return None, {}
+        calibrator = ProbabilityCalibrator(self.calibration).fit(fit_probs, fit_y)
+        calibrated = calibrator.transform(eval_probs)
+        report = {'raw': calibration_report(eval_probs, eval_y), 'calibrated': calibration_report(calibrated, eval_y),
+                  'n_fit': int(len(fit_y))}
+        print_report(report['raw'], report['calibrated'], reliability_curve(calibrated, eval_y))
+        current_span().set(rows=len(fit_y), method=self.calibration)
+        return calibrator, report
+
+    @staticmethod
+    def calibrate(probs, artifact):
+        """Probabilités calibrées avec le calibrateur de la version (inchangées s'il n'y en a pas)."""
+        if artifact is None or artifact.calibrator is None:
+            return probs
+        return artifact.calibrator.transform(probs)
+
+    @timed("predictor.train_streaming")
+    def train_streaming(self, chunk_size=50000, nthread=None, external_memory=True, cache_dir=None):
+        """
+        Même modèle que train(), sans matrice complète en mémoire : features écrites par blocs
+        (une passe sur la base), puis relues par un itérateur XGBoost. `external_memory=True` :
+        ExtMemQuantileDMatrix (pages sur disque) ; sinon QuantileDMatrix (matrice quantifiée en RAM).
+        """
+        print(f"🚀 Entraînement V3 en flux (blocs de {chunk_size} matchs)...")
+        nthread = nthread or default_nthread()
+        with tempfile.TemporaryDirectory(dir=cache_dir) as workdir:
+            writer = StreamingFeatureWriter(self, workdir, chunk_size)
+            n_train, n_test, self.train_hash = writer.write()
+            if n_train == 0:
+                print("❌ Pas assez de données pour entraîner le modèle.")
+                return
+
+            train_iter = ChunkIter(chunk_files(workdir, "train"), self.FEATURES,
+                                   cache_prefix=os.path.join(workdir, "cache") if external_memory else None)
+            matrix_class = xgb.ExtMemQuantileDMatrix if external_memory else xgb.QuantileDMatrix
+            dtrain = matrix_class(train_iter, nthread=nthread)
 
+            params = {
+                'objective': 'multi:softprob', 'num_class': 3, 'eval_metric': 'mlogloss',
+                'eta': self.PARAMS['learning_rate'], 'max_depth': self.PARAMS['max_depth'],
+                'tree_method': 'hist', 'seed': 42, 'nthread': nthread,
+            }
+            booster = xgb.train(params, dtrain, num_boost_round=self.PARAMS['n_estimators'])
+            del dtrain, train_iter      # libère les pages du cache avant la suppression du dossier
+
+            # Précision sur les blocs de test, un bloc à la fois (seules les probabilités sont gardées)
+            correct = 0
+            test_probs, test_y = [], []
+            for path in chunk_files(workdir, "test"):
+                with np.load(path) as part:
+                    probs = booster.predict(xgb.DMatrix(part["X"], feature_names=self.FEATURES, nthread=nthread))
+                    correct += int((probs.argmax(axis=1) == part["y"]).sum())
+                    test_probs.append(probs)
+                    test_y.append(part["y"].astype(int))
+
+        # Booster -> XGBClassifier, pour le registre et l'inférence habituelle
+        self.model = xgb.XGBClassifier()
+        self.model.load_model(booster.save_raw("json"))
+        acc = correct / n_test if n_test else float('nan')
+        print(f"✅ Précision XGBoost (flux) : {acc:.2%}")
+
+        # Pas de matrice en mémoire pour refaire des entraînements par blocs : le calibrateur est
+        # ajusté sur la première moitié (chronologique) du test et évalué sur la seconde
+        calibrator, report = None, {}
+        if self.calibration and test_probs:
+            probs, y_test = np.vstack(test_probs), np.concatenate(test_y)
+            half = len(y_test) // 2
+            calibrator, report = self.fit_calibrator(probs[:half], y_test[:half], probs[half:], y_test[half:])
+
+        version = self.registry.register(
+            self.model_name, self.model, self.encoder, self.FEATURES, self.train_hash,
+            metrics={'accuracy': float(acc), 'n_train': n_train, 'n_test': n_test},
+            extra={'training': {'mode': 'streaming', 'chunk_size': chunk_size, 'nthread': nthread,
+                                'external_memory': external_memory},
+                   'calibration_report': report, 'train_until': writer.train_until},
+            calibrator=calibrator
+        )
+        self.artifact = self.registry.load(self.model_name, version)
+        self.features = list(self.FEATURES)
+        print("💾 Modèle V3 (flux) sauvegardé.")
+
+    def load_production(self):
+        """
+        Modèle courant : version « production » du registre (gardée en cache) ; si l'alias
+        a changé depuis le dernier appel, on bascule sur la nouvelle version d'un seul coup.
+        Retourne l'artefact, ou None si aucun modèle n'est disponible.
+        """
+        artifact = self.registry.get(self.model_name)
+        if artifact is None and self.artifact is None:
+            artifact = self._load_legacy()
+        if artifact is not None and artifact is not self.artifact:
+            self.artifact = artifact
+            self.model, self.encoder, self.features = artifact.model, artifact.encoder, artifact.features
+        return self.artifact
+
+    def _load_legacy(self):
+        """Secours : anciens fichiers data/model_v3_xgb.json + data/encoder.pkl."""
         try:
-            h_id = self.encoder.transform([home])[0]
-            a_id = self.encoder.transform([away])[0]
-        except:
+            model = xgb.XGBClassifier()
+            model.load_model(self.model_path)
+            encoder = joblib.load(self.encoder_path)
+        except Exception:
+            return None
+        # Les anciens modèles n'ont pas le sentiment
+        features = model.get_booster().feature_names or self.FEATURES[:11]
+        return ModelArtifact(self.model_name, "legacy", model, encoder, features, {})
+
+    @timed("predictor.predict_match")
+    def predict_match(self, home, away, odds_h, odds_d, odds_a, match_date=None):
+        # Référence locale : un changement de version pendant l'appel n'a pas d'effet
+        artifact = self.load_production()
+        if artifact is None:
+            print("❌ Modèle non trouvé. Lance .train()")
+            return "N (Erreur)", 0.0
+        model, encoder = artifact.model, artifact.encoder
+
+        h_id, a_id = encode_teams(encoder, [home, away])
+        if h_id < 0 or a_id < 0:
             print(f"⚠️ Équipe inconnue : {home} ou {away}")
             return "N (Inconnu)", 0.0
 
-        # Récupération des stats réelles
-        h_form, h_att, h_def = self.fe.get_team_latest_stats(home)
-        a_form, a_att, a_def = self.fe.get_team_latest_stats(away)
+        # Récupération des stats réelles (index et jointures sur les clés d'équipe)
+        home_key, away_key = self.fe.team_keys([home, away])
+        h_form, h_att, h_def = self.fe.get_team_latest_stats(home_key, match_date)
+        a_form, a_att, a_def = self.fe.get_team_latest_stats(away_key, match_date)
+
+        h_sent = self.fe.get_team_sentiment(home_key, match_date)
+        a_sent = self.fe.get_team_sentiment(away_key, match_date)
+
+        if not self.h2h.loaded:
+            self.h2h.load()
+        h2h = self.h2h.lookup(home_key, away_key, match_date)
 
         input_data = pd.DataFrame([[
             h_id, a_id, odds_h, odds_d, odds_a, 
             h_form, h_att, h_def, 
-            a_form, a_att, a_def
-        ]], columns=[
-            'home_team_id', 'away_team_id', 'home_odds', 'draw_odds', 'away_odds',
-            'home_form', 'home_att', 'home_def', 'away_form', 'away_att', 'away_def'
-        ])
-
-        pred_idx = self.model.predict(input_data)[0]
-        probs = self.model.predict_proba(input_data)[0]
+            a_form, a_att, a_def,
+            h_sent, a_sent, *h2h
+        ]], columns=self.FEATURES)[artifact.features]
+
+        probs = self.calibrate(model.predict_proba(input_data), artifact)[0]
+        pred_idx = int(probs.argmax())
         
         mapping = {0: '1 (Dom)', 1: 'N (Nul)', 2: '2 (Ext)'}
-        return mapping[pred_idx], probs[pred_idx]
\ No newline at end of file
+        return mapping[pred_idx], probs[pred_idx]
+
+    @timed("predictor.build_features")
+    def build_features(self, slate_df):
+        """
+        Lot de features commun pour un ensemble de matchs (colonnes : home_team, away_team,
+        home_odds, draw_odds, away_odds, date, et si possible home_team_key / away_team_key).
+        Stats de forme au coup d'envoi, comme à l'entraînement.
+        Les ID d'équipe ne sont pas inclus : chaque modèle les encode avec son propre encodeur.
+        """
+        batch = slate_df.reset_index(drop=True).copy()
+        # Clés d'équipe absentes du lot : résolues depuis les noms (une requête pour tout le lot)
+        for side in ('home', 'away'):
+            keys = key_column(batch, f'{side}_team_key')
+            missing = keys < 0
+            if missing.any():
+                keys[missing] = self.fe.team_keys(batch.loc[missing, f'{side}_team'])
+            batch[f'{side}_team_key'] = keys
+        batch[TEAM_FEATURES] = self.fe.stats_as_of(batch)
+
+        for side in ('home', 'away'):
+            batch[f'sentiment_{side}'] = [
+                self.fe.get_team_sentiment(k, d) for k, d in zip(batch[f'{side}_team_key'], batch['date'])
+            ]
+
+        if not self.h2h.loaded:
+            self.h2h.load()
+        batch[H2H_FEATURES] = self.h2h.lookup_many(batch['home_team_key'], batch['away_team_key'],
+                                                   batch['date']).to_numpy()
+        current_span().set(rows=len(batch))
+        return batch
+
+    def predict_proba_batch(self, batch, artifact=None):
+        """
+        Probabilités calibrées (n, 3) d'un modèle du registre sur un lot de features partagé.
+        Les matchs avec une équipe inconnue du modèle reçoivent des probabilités nulles.
+        """
+        artifact = artifact or self.load_production()
+        X = batch.copy()
+        X['home_team_id'] = encode_teams(artifact.encoder, X['home_team'])
+        X['away_team_id'] = encode_teams(artifact.encoder, X['away_team'])
+        known = ((X['home_team_id'] >= 0) & (X['away_team_id'] >= 0)).to_numpy()
+
+        probs = np.zeros((len(X), 3))
+        if known.any():
+            X_known = X.loc[known, artifact.features].astype(float)
+            probs[known] = self.calibrate(artifact.model.predict_proba(X_known), artifact)
+        return probs
+
+    @timed("predictor.predict_batch")
+    def predict_batch(self, batch, artifact=None):
+        """Équivalent groupé de predict_match : codes '1' / 'N' / '2', confiance et probabilités."""
+        return self.decode(self.predict_proba_batch(batch, artifact))
+
+    @staticmethod
+    def decode(probs):
+        """Probabilités (n, 3) -> codes '1' / 'N' / '2', confiance de la classe retenue, probabilités."""
+        pred_idx = probs.argmax(axis=1)
+        return np.array(['1', 'N', '2'])[pred_idx], probs[np.arange(len(probs)), pred_idx], probs
@@ -0,0 +1,202 @@
+"""
+Registre de modèles versionnés.
+
+Chaque entraînement produit une version immuable :
+    data/registry/<nom>/<version>/model.json|model.pkl, encoder.pkl, meta.json[, calibration.json]
+et des alias (ex: "production") pointent vers une version dans data/registry/aliases.json.
+
+L'inférence résout l'alias, garde l'artefact chargé en mémoire, et bascule sur une
+nouvelle version (chargée entièrement avant l'échange de référence) dès que l'alias change.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+import joblib
+import pandas as pd
+import xgboost as xgb
+from src.models.calibration import ProbabilityCalibrator
+
+
+def data_hash(X, y=None):
+    """Empreinte des données d'entraînement (features + cible)."""
+    digest = hashlib.sha1(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    if y is not None:
+        digest.update(pd.util.hash_pandas_object(pd.Series(y), index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ModelArtifact:
+    """Un modèle chargé avec tout ce qu'il faut pour prédire (encodeur, liste de features, calibrateur, méta)."""
+
+    def __init__(self, name, version, model, encoder, features, meta, calibrator=None):
+        self.name = name
+        self.version = version
+        self.model = model
+        self.encoder = encoder
+        self.features = features
+        self.meta = meta
+        self.calibrator = calibrator
+
+
+class ModelRegistry:
+    _cache = {}                 # (racine, nom, version) -> ModelArtifact, partagé dans le process
+    _lock = threading.Lock()
+
+    def __init__(self, root="data/registry"):
+        self.root = root
+        self.aliases_path = os.path.join(root, "aliases.json")
+        self._aliases = {}
+        self._aliases_mtime = None
+
+    # --- Écriture ---
+
+    def register(self, name, model, encoder, features, train_hash, metrics=None, alias="production", extra=None,
+                 calibrator=None):
+        """Enregistre une nouvelle version (et son calibrateur éventuel) et, par défaut, la promeut en production."""
+        base = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{train_hash[:8]}"
+        os.makedirs(os.path.join(self.root, name), exist_ok=True)
+        # Réservation atomique du dossier : deux entraînements dans la même seconde sur les mêmes
+        # données ne s'écrasent jamais (suffixe croissant -2, -3...)
+        for n in range(1, 1000):
+            version = base if n == 1 else f"{base}-{n}"
+            folder = os.path.join(self.root, name, version)
+            try:
+                os.mkdir(folder)
+                break
+            except FileExistsError:
+                continue
+        else:
+            raise RuntimeError(f"Impossible de réserver une version pour {name}/{base}")
+
+        if isinstance(model, xgb.XGBModel):
+            model_file = "model.json"
+            model.save_model(os.path.join(folder, model_file))
+        else:
+            model_file = "model.pkl"
+            joblib.dump(model, os.path.join(folder, model_file))
+        joblib.dump(encoder, os.path.join(folder, "encoder.pkl"))
+        if calibrator is not None:
+            calibrator.save(os.path.join(folder, "calibration.json"))
+
+        meta = {
+            "name": name,
+            "version": version,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "model_file": model_file,
+            "model_class": type(model).__name__,
+            "features": list(features),
+            "data_hash": train_hash,
+            "metrics": metrics or {},
+            "calibration": calibrator.method if calibrator is not None else None,
+        }
+        meta.update(extra or {})
+        with open(os.path.join(folder, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=4)
+
+        print(f"🗂️ Modèle {name} enregistré : version {version}")
+        if alias:
+            self.promote(name, version, alias)
+        return version
+
+    def promote(self, name, version, alias="production"):
+        """Fait pointer un alias vers une version (écriture atomique du fichier d'alias)."""
+        if not os.path.exists(os.path.join(self.root, name, version, "meta.json")):
+            raise ValueError(f"Version inconnue : {name}/{version}")
+        with self._lock:
+            aliases = self._read_aliases(force=True)
+            aliases.setdefault(name, {})[alias] = version
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = self.aliases_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(aliases, f, indent=4, sort_keys=True)
+            os.replace(tmp_path, self.aliases_path)
+        print(f"🚀 {name} [{alias}] -> {version}")
+
+    # --- Lecture ---
+
+    def _read_aliases(self, force=False):
+        """Relit le fichier d'alias seulement s'il a changé (un stat par appel)."""
+        try:
+            mtime = os.stat(self.aliases_path).st_mtime_ns
+        except FileNotFoundError:
+            self._aliases, self._aliases_mtime = {}, None
+            return self._aliases
+        if force or mtime != self._aliases_mtime:
+            with open(self.aliases_path) as f:
+                self._aliases = json.load(f)
+            self._aliases_mtime = mtime
+        return self._aliases
+
+    def resolve(self, name, alias="production"):
+        """Version pointée par l'alias (ou None)."""
+        return self._read_aliases().get(name, {}).get(alias)
+
+    def versions(self, name):
+        folder = os.path.join(self.root, name)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(v for v in os.listdir(folder) if os.path.exists(os.path.join(folder, v, "meta.json")))
+
+    def load(self, name, version):
+        """Charge une version (une seule fois par process)."""
+        key = (os.path.abspath(self.root), name, version)
+        artifact = self._cache.get(key)
+        if artifact is not None:
+            return artifact
+
+        folder = os.path.join(self.root, name, version)
+        with open(os.path.join(folder, "meta.json")) as f:
+            meta = json.load(f)
+
+        model_path = os.path.join(folder, meta["model_file"])
+        if meta["model_file"].endswith(".json"):
+            model = xgb.XGBClassifier()
+            model.load_model(model_path)
+        else:
+            model = joblib.load(model_path)
+        encoder = joblib.load(os.path.join(folder, "encoder.pkl"))
+        calibration_path = os.path.join(folder, "calibration.json")
+        calibrator = ProbabilityCalibrator.load(calibration_path) if os.path.exists(calibration_path) else None
+
+        artifact = ModelArtifact(name, version, model, encoder, meta["features"], meta, calibrator)
+        with self._lock:
+            self._cache.setdefault(key, artifact)
+        return self._cache[key]
+
+    def names(self):
+        """Modèles ayant au moins un alias."""
+        return sorted(self._read_aliases())
+
+    def aliased_artifacts(self):
+        """Toutes les versions pointées par un alias (production, candidate...), chargées une fois."""
+        artifacts = []
+        for name, aliases in sorted(self._read_aliases().items()):
+            for version in sorted(set(aliases.values())):
+                artifacts.append(self.load(name, version))
+        return artifacts
+
+    def get(self, name, alias="production"):
+        """Artefact courant de l'alias, ou None si rien n'est enregistré."""
+        version = self.resolve(name, alias)
+        if version is None:
+            return None
+        return self.load(name, version)
+
+
+if __name__ == "__main__":
+    # python -m src.models.registry list v3
+    # python -m src.models.registry promote v3 <version>   (rollback = promouvoir une ancienne version)
+    registry = ModelRegistry()
+    if len(sys.argv) >= 3 and sys.argv[1] == "list":
+        current = registry.resolve(sys.argv[2])
+        for v in registry.versions(sys.argv[2]):
+            with open(os.path.join(registry.root, sys.argv[2], v, "meta.json")) as f:
+                metrics = json.load(f).get("metrics", {})
+            print(f"{'👉' if v == current else '  '} {v}  {metrics}")
+    elif len(sys.argv) >= 4 and sys.argv[1] == "promote":
+        registry.promote(sys.argv[2], sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else "production")
+    else:
+        print("Usage : python -m src.models.registry list <nom> | promote <nom> <version> [alias]")
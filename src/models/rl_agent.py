@@ -2,17 +2,66 @@ import json
 import os
 import numpy as np
 
+DEFAULT_Q_TABLE_PATH = "data/q_table.json"
+
+
+def state_key(bin_index, bin_width=0.1):
+    """Clé d'état d'un intervalle de confiance (ex: bin 5, largeur 0.1 -> "0.5")."""
+    return str(round(int(bin_index) * bin_width, 6))
+
+
+def replay_q_table(q_table, confidences, rewards, alpha=0.1, bin_width=0.1, epochs=1, action=1):
+    """
+    Rejoue une suite d'expériences (confiance, récompense), dans l'ordre, `epochs` fois,
+    sans boucle Python par expérience ni par état. Retourne une nouvelle Q-Table.
+
+    Pour k récompenses successives sur un même état, la mise à jour se déplie en :
+        Q_k = (1-a)^k * Q_0 + S,  avec S = somme_i a * (1-a)^(k-1-i) * r_i
+    et E passages de la même suite donnent Q = (1-a)^(kE) * Q_0 + S * somme_e (1-a)^(ke).
+    """
+    new_table = {state: list(values) for state, values in (q_table or {}).items()}
+    rewards = np.asarray(rewards, dtype=float)
+    if len(rewards) == 0:
+        return new_table
+
+    # Tri stable par intervalle : l'ordre chronologique est conservé dans chaque état
+    bins = np.rint(np.asarray(confidences, dtype=float) / bin_width).astype(np.int64)
+    order = np.argsort(bins, kind="stable")
+    bins, rewards = bins[order], rewards[order]
+    unique_bins, starts, counts = np.unique(bins, return_index=True, return_counts=True)
+
+    decay = 1.0 - alpha
+    group = np.repeat(np.arange(len(unique_bins)), counts)
+    position = np.arange(len(rewards)) - starts[group]
+    gain = np.add.reduceat(alpha * decay ** (counts[group] - 1 - position) * rewards, starts)
+
+    decay_k = decay ** counts
+    repeat = np.full(len(counts), float(epochs))
+    partial = decay_k < 1.0
+    repeat[partial] = (1.0 - decay_k[partial] ** epochs) / (1.0 - decay_k[partial])
+
+    keys = [state_key(b, bin_width) for b in unique_bins]
+    q0 = np.array([new_table.get(key, [0.0, 0.0])[action] for key in keys])
+    q_new = decay_k ** epochs * q0 + gain * repeat
+    for key, value in zip(keys, q_new):
+        values = new_table.setdefault(key, [0.0, 0.0])
+        values[action] = float(value)
+    return new_table
+
+
 class RLAgent:
-    def __init__(self, alpha=0.1, gamma=0.9, epsilon=0.1):
-        self.q_table_path = "data/q_table.json"
+    def __init__(self, alpha=0.1, gamma=0.9, epsilon=0.1, bin_width=0.1, q_table_path=DEFAULT_Q_TABLE_PATH):
+        # q_table_path=None : agent en mémoire uniquement (backtests, ré-entraînement hors ligne)
+        self.q_table_path = q_table_path
         self.alpha = alpha      # Taux d'apprentissage (vitesse d'oubli)
         self.gamma = gamma      # Importance du futur (peu utile ici car "one-step")
         self.epsilon = epsilon  # Taux d'exploration (parfois on tente un pari risqué pour voir)
+        self.bin_width = bin_width  # Largeur des intervalles de confiance (états)
         self.q_table = self.load_q_table()
 
     def load_q_table(self):
         """Charge la Q-Table ou l'initialise."""
-        if os.path.exists(self.q_table_path):
+        if self.q_table_path and os.path.exists(self.q_table_path):
             with open(self.q_table_path, 'r') as f:
                 return json.load(f)
         else:
@@ -20,13 +69,15 @@ class RLAgent:
             return {}
 
     def save_q_table(self):
+        if not self.q_table_path:
+            return
         with open(self.q_table_path, 'w') as f:
             json.dump(self.q_table, f, indent=4)
 
     def get_state(self, confidence):
         """Discrétise la confiance pour réduire le nombre d'états."""
-        # On arrondit à la décimale (ex: 0.53 -> "0.5", 0.89 -> "0.9")
-        return str(round(confidence, 1))
+        # On arrondit à l'intervalle le plus proche (largeur 0.1 : 0.53 -> "0.5", 0.89 -> "0.9")
+        return state_key(round(confidence / self.bin_width), self.bin_width)
 
     def get_q_values(self, state):
         """Récupère les valeurs pour un état (Action 0: Skip, Action 1: Bet)."""
@@ -51,6 +102,15 @@ class RLAgent:
         else:
             return 0
 
+    def decide_actions(self, confidences):
+        """Version groupée de decide_action (mêmes règles, un tirage d'exploration par pari)."""
+        confidences = np.asarray(confidences, dtype=float)
+        q_values = np.array([self.get_q_values(self.get_state(c)) for c in confidences]).reshape(-1, 2)
+        actions = (q_values[:, 1] >= q_values[:, 0]).astype(int)
+        explore = np.random.uniform(0, 1, len(confidences)) < self.epsilon
+        actions[explore] = np.random.choice([0, 1], explore.sum())
+        return actions
+
     def learn(self, confidence, action, reward):
         """Met à jour la Q-Table en fonction du résultat."""
         state = self.get_state(confidence)
@@ -68,6 +128,17 @@ class RLAgent:
         
         print(f"🤖 [RL Learn] État {state} | Action {action} | Reward {reward} -> Q-Val mise à jour : {new_q:.2f}")
 
+    def learn_batch(self, confidences, rewards, action=1, save=True):
+        """Applique une série de mises à jour (dans l'ordre) en une passe, avec une seule écriture."""
+        if len(rewards) == 0:
+            return
+        before = len(self.q_table)
+        self.q_table = replay_q_table(self.q_table, confidences, rewards, self.alpha, self.bin_width, action=action)
+
+        if save:
+            self.save_q_table()
+            print(f"🤖 [RL Learn] {len(rewards)} mises à jour ({len(self.q_table) - before} nouveaux états), Q-Table sauvegardée.")
+
 # --- Bloc de test ---
 if __name__ == "__main__":
     agent = RLAgent()
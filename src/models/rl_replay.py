@@ -0,0 +1,86 @@
+"""
+Ré-entraînement hors ligne de l'agent RL par rejeu d'expériences.
+
+Rejoue l'historique des paris réglés (ou les candidats d'un backtest) dans la mise à jour
+du Q-Learning, en calcul vectorisé par état, et produit une Q-Table neuve sans toucher
+au fichier de production (data/q_table.json).
+
+    python -m src.models.rl_replay --epochs 3 --bin-width 0.05 --output data/q_table_replay.json
+"""
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+from src.database import BettingDB
+from src.models.rl_agent import RLAgent, DEFAULT_Q_TABLE_PATH, replay_q_table
+from src.utils.instrumentation import timed, current_span
+
+
+class ExperienceReplayTrainer:
+    def __init__(self, alpha=0.1, bin_width=0.1, epochs=1, db=None):
+        self.alpha = alpha
+        self.bin_width = bin_width
+        self.epochs = epochs
+        self.db = db
+
+    def load_settled_bets(self):
+        """Expériences réelles : (confiance, profit) des paris réglés, dans l'ordre de placement."""
+        db = self.db or BettingDB()
+        conn = db.get_connection()
+        df = pd.read_sql_query('''
+            SELECT confidence, profit FROM bets
+            WHERE result IN ('WIN', 'LOSE') AND confidence IS NOT NULL AND profit IS NOT NULL
+            ORDER BY id ASC
+        ''', conn)
+        conn.close()
+        return df['confidence'].to_numpy(dtype=float), df['profit'].to_numpy(dtype=float)
+
+    @timed("rl.replay")
+    def fit(self, confidences, rewards, q_table=None):
+        """Q-Table obtenue en rejouant les expériences `epochs` fois (partant de `q_table` ou de zéro)."""
+        q_table = replay_q_table(q_table, confidences, rewards, self.alpha, self.bin_width, self.epochs)
+        current_span().set(rows=len(rewards), states=len(q_table))
+        return q_table
+
+    def fit_settled_bets(self):
+        return self.fit(*self.load_settled_bets())
+
+    def fit_candidates(self, candidates):
+        """Candidats d'un backtest : liste de (confiance, profit) ou DataFrame avec ces colonnes."""
+        candidates = pd.DataFrame(candidates, columns=['confidence', 'profit'])
+        return self.fit(candidates['confidence'].to_numpy(dtype=float), candidates['profit'].to_numpy(dtype=float))
+
+    def to_agent(self, q_table, **kwargs):
+        """Agent en mémoire utilisant la Q-Table rejouée (aucune écriture disque)."""
+        agent = RLAgent(alpha=self.alpha, bin_width=self.bin_width, q_table_path=None, **kwargs)
+        agent.q_table = q_table
+        return agent
+
+    @staticmethod
+    def save(q_table, path):
+        if os.path.abspath(path) == os.path.abspath(DEFAULT_Q_TABLE_PATH):
+            raise ValueError("Le rejeu n'écrase pas la Q-Table de production : choisir un autre fichier.")
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(q_table, f, indent=4, sort_keys=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rejeu hors ligne des paris réglés dans la Q-Table")
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--bin-width", type=float, default=0.1)
+    parser.add_argument("--alpha", type=float, default=0.1)
+    parser.add_argument("--output", default="data/q_table_replay.json")
+    args = parser.parse_args()
+
+    trainer = ExperienceReplayTrainer(alpha=args.alpha, bin_width=args.bin_width, epochs=args.epochs)
+    confidences, rewards = trainer.load_settled_bets()
+    table = trainer.fit(confidences, rewards)
+    trainer.save(table, args.output)
+    print(f"🤖 {len(rewards)} paris rejoués x {args.epochs} époque(s) -> {len(table)} états ({args.output})")
+    for state in sorted(table, key=float):
+        skip, bet = table[state]
+        print(f"   {state:>6} | Q(Skip)={skip:8.2f} | Q(Bet)={bet:8.2f}")
@@ -0,0 +1,143 @@
+"""
+Entraînement en mémoire externe : les features sont produites par morceaux et passées à
+XGBoost via un itérateur, sans jamais charger toute la matrice en RAM.
+
+1. Une passe sur `matches` (curseur lu par blocs, côté serveur sous Postgres) calcule les
+   features de chaque bloc avec un état glissant (index des stats d'équipe au coup d'envoi,
+   index H2H, sentiment) et les écrit dans des fichiers .npz (train / test).
+2. XGBoost relit ces fichiers autant de fois qu'il le souhaite (`ChunkIter`), pour construire
+   un `ExtMemQuantileDMatrix` (pages sur disque) ou un `QuantileDMatrix` (matrice quantifiée).
+"""
+import glob
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.preprocessing import LabelEncoder
+from src.models.h2h import H2H_FEATURES
+from src.models.team_stats import TEAM_FEATURES
+from src.teams import encode_teams
+from src.utils.instrumentation import timed, current_span
+
+MATCH_COLUMNS = ['id', 'date', 'home_team', 'away_team', 'home_odds', 'draw_odds', 'away_odds',
+                 'home_score', 'away_score', 'home_team_key', 'away_team_key']
+
+
+def default_nthread():
+    """Threads XGBoost : XGB_NTHREAD si défini, sinon les cœurs réellement disponibles pour ce process."""
+    env = os.getenv("XGB_NTHREAD")
+    if env:
+        return int(env)
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class StreamingFeatureWriter:
+    """Passe unique sur la base : features par blocs écrites dans `cache_dir` (train-*.npz / test-*.npz)."""
+
+    def __init__(self, predictor, cache_dir, chunk_size=50000):
+        self.predictor = predictor
+        self.db = predictor.db
+        self.cache_dir = cache_dir
+        self.chunk_size = chunk_size
+        self.train_until = None     # date du dernier match d'entraînement (après write())
+
+    def _teams_and_count(self, cursor):
+        cursor.execute('''
+            SELECT home_team FROM matches WHERE status = 'FINISHED'
+            UNION SELECT away_team FROM matches WHERE status = 'FINISHED'
+        ''')
+        teams = sorted(r[0] for r in cursor.fetchall())
+        cursor.execute("SELECT COUNT(*) FROM matches WHERE status = 'FINISHED'")
+        return teams, cursor.fetchone()[0]
+
+    def _features(self, chunk, daily):
+        fe, h2h = self.predictor.fe, self.predictor.h2h
+        # L'index reçoit le bloc, mais chaque match n'y lit que les matchs antérieurs à sa date
+        chunk[TEAM_FEATURES] = fe.team_stats.update(chunk).features(chunk)
+        chunk = fe.add_sentiment_features(chunk, daily)
+        chunk[H2H_FEATURES] = h2h.build(chunk, reset=False)
+        chunk['home_team_id'] = encode_teams(self.predictor.encoder, chunk['home_team'])
+        chunk['away_team_id'] = encode_teams(self.predictor.encoder, chunk['away_team'])
+
+        X = chunk[self.predictor.FEATURES].to_numpy(dtype=np.float32)
+        home, away = chunk['home_score'].to_numpy(), chunk['away_score'].to_numpy()
+        y = np.where(home > away, 0, np.where(home == away, 1, 2)).astype(np.float32)
+        return X, y
+
+    @timed("streaming.write_features")
+    def write(self, test_fraction=0.2):
+        """Écrit les blocs ; retourne (lignes train, lignes test, empreinte des données)."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(self.cache_dir, "*.npz")):
+            os.remove(path)
+
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        teams, total = self._teams_and_count(cursor)
+        self.predictor.encoder = LabelEncoder().fit(teams)
+        split = int(total * (1 - test_fraction))
+
+        # Curseur serveur sous Postgres : les lignes arrivent par blocs, pas toutes en mémoire client
+        stream = conn.cursor(name="features_stream") if self.db.is_postgres else conn.cursor()
+        stream.execute(f'''
+            SELECT {", ".join(MATCH_COLUMNS)} FROM matches
+            WHERE status = 'FINISHED' ORDER BY date ASC
+        ''')
+
+        self.predictor.fe.team_stats.fit(pd.DataFrame(columns=MATCH_COLUMNS))
+        self.predictor.h2h.pairs = {}
+        daily = self.predictor.fe.load_daily_sentiment()
+        digest = hashlib.sha1()
+        seen, part = 0, 0
+        self.train_until = None
+        while True:
+            rows = stream.fetchmany(self.chunk_size)
+            if not rows:
+                break
+            X, y = self._features(pd.DataFrame(rows, columns=MATCH_COLUMNS), daily)
+            digest.update(X.tobytes())
+            digest.update(y.tobytes())
+
+            # Le bloc qui chevauche la frontière train / test est coupé en deux
+            cut = min(max(split - seen, 0), len(y))
+            if cut > 0:
+                self.train_until = str(rows[cut - 1][MATCH_COLUMNS.index('date')])
+            for kind, sl in (("train", slice(0, cut)), ("test", slice(cut, len(y)))):
+                if sl.stop > sl.start:
+                    np.savez(os.path.join(self.cache_dir, f"{kind}-{part:05d}.npz"), X=X[sl], y=y[sl])
+            seen += len(y)
+            part += 1
+
+        conn.close()
+        self.predictor.h2h.loaded = True
+        current_span().set(rows=seen, chunks=part)
+        return split, seen - split, digest.hexdigest()
+
+
+class ChunkIter(xgb.DataIter):
+    """Itérateur XGBoost sur les fichiers de features : un bloc en mémoire à la fois."""
+
+    def __init__(self, files, feature_names, cache_prefix=None):
+        self.files = files
+        self.feature_names = feature_names
+        self._it = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._it == len(self.files):
+            return False
+        with np.load(self.files[self._it]) as part:
+            input_data(data=part["X"], label=part["y"], feature_names=self.feature_names)
+        self._it += 1
+        return True
+
+    def reset(self):
+        self._it = 0
+
+
+def chunk_files(cache_dir, kind):
+    return sorted(glob.glob(os.path.join(cache_dir, f"{kind}-*.npz")))
@@ -0,0 +1,211 @@
+"""
+Stats de forme des équipes « au coup d'envoi » (forme, buts marqués, buts encaissés).
+
+Moyennes exponentielles (span 5, définition pandas ewm adjust=True) des matchs terminés
+strictement avant la date du match : le résultat du match lui-même n'entre jamais dans
+ses features. Un seul index sert l'entraînement (tous les matchs en une passe) et l'inférence
+(une affiche à une date) : pour un même match, les deux donnent exactement la même valeur.
+Les équipes sont désignées par leur clé entière (`teams.id`, colonnes `*_team_key`).
+Équipe sans historique (ou sans clé) : 0.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from src.database import BettingDB
+from src.models.h2h import to_day
+from src.teams import key_column
+from src.utils.instrumentation import timed, current_span
+
+TEAM_FEATURES = ['home_form', 'home_att', 'home_def', 'away_form', 'away_att', 'away_def']
+
+# Clé de recherche (équipe, jour) = code * DAY_SPAN + jour
+DAY_SPAN = 1 << 20
+
+
+def ewm_by_team(team_codes, values, span=5, init=None):
+    """
+    Moyennes exponentielles (pandas ewm, adjust=True) de `values` (n, k), équipe par équipe.
+    Les lignes doivent être groupées par équipe et triées par date dans chaque groupe.
+    Récurrence num = x + w * num ; den = 1 + w * den, déroulée match par match mais
+    vectorisée sur toutes les équipes (matrice équipes x rang du match).
+    `init=(num (g, k), den (g,))` : état de départ de chaque groupe (suite d'une série déjà calculée).
+    """
+    n = len(team_codes)
+    if n == 0:
+        return np.empty((0, values.shape[1]))
+    w = 1.0 - 2.0 / (span + 1)
+    starts = np.flatnonzero(np.r_[True, team_codes[1:] != team_codes[:-1]])
+    lengths = np.diff(np.r_[starts, n])
+    group = np.repeat(np.arange(len(starts)), lengths)
+    rank = np.arange(n) - starts[group]
+
+    grid = np.zeros((len(starts), lengths.max(), values.shape[1]))
+    grid[group, rank] = values
+    num = np.zeros((len(starts), values.shape[1])) if init is None else np.asarray(init[0], dtype=float)
+    den = np.zeros((len(starts), 1)) if init is None else np.asarray(init[1], dtype=float).reshape(-1, 1)
+    for t in range(grid.shape[1]):
+        num = grid[:, t] + w * num
+        den = 1.0 + w * den
+        grid[:, t] = num / den
+    return grid[group, rank]
+
+
+def _ewm_partition(args):
+    # Point d'entrée des workers (fonction de module : picklable)
+    return ewm_by_team(*args)
+
+
+class TeamStatsIndex:
+    def __init__(self, db=None, span=5, workers=1):
+        self.db = db or BettingDB()
+        self.span = span
+        # Processus pour le calcul des moyennes (équipes entières réparties entre eux)
+        self.workers = workers
+        self.loaded = False
+        self._reset()
+
+    def _reset(self):
+        # Observations brutes (une ligne par match et par équipe), gardées par lot : relues
+        # seulement si un lot arrive dans le désordre (reconstruction complète)
+        self._raw = []
+        self._index = pd.Index([], dtype=np.int64)
+        self._codes = np.empty(0, dtype=np.int64)
+        self._keys = np.empty(0, dtype=np.int64)
+        self._stats = np.empty((0, 3))
+        # État courant par équipe (code) : dernier jour, numérateur et dénominateur de la moyenne
+        self._last_day = np.empty(0, dtype=np.int64)
+        self._num = np.empty((0, 3))
+        self._den = np.empty(0)
+
+    @staticmethod
+    def _observations(matches_df):
+        """Format long : (clé d'équipe, jour, [points, buts marqués, buts encaissés]) pour chaque match terminé."""
+        done = matches_df[matches_df['home_score'].notna() & matches_df['away_score'].notna()]
+        home, away = done['home_score'].to_numpy(dtype=float), done['away_score'].to_numpy(dtype=float)
+        home_points = np.where(home > away, 3, np.where(home == away, 1, 0))
+        away_points = np.where(away > home, 3, np.where(home == away, 1, 0))
+        days = to_day(done['date']) if len(done) else np.empty(0, dtype=np.int64)
+        teams = np.concatenate([key_column(done, 'home_team_key'), key_column(done, 'away_team_key')])
+        values = np.column_stack([
+            np.concatenate([home_points, away_points]),
+            np.concatenate([home, away]),
+            np.concatenate([away, home]),
+        ]).astype(float)
+        known = teams >= 0
+        return teams[known], np.concatenate([days, days])[known], values[known]
+
+    def _ewm(self, codes, values):
+        workers = min(self.workers, len(np.unique(codes)))
+        if workers <= 1:
+            return ewm_by_team(codes, values, self.span)
+        # Partitions d'équipes entières, de tailles (en lignes) comparables
+        cuts = np.searchsorted(codes, np.quantile(codes, np.linspace(0, 1, workers + 1)[1:-1]))
+        bounds = np.unique(np.r_[0, cuts, len(codes)])
+        parts = [(codes[lo:hi], values[lo:hi], self.span) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return np.concatenate(list(pool.map(_ewm_partition, parts)))
+
+    def _set_state(self, codes, days, stats, counts, den0=0.0):
+        """État final des équipes d'un lot trié (codes groupés) : n = matchs ajoutés par équipe."""
+        w = 1.0 - 2.0 / (self.span + 1)
+        last = np.flatnonzero(np.r_[codes[1:] != codes[:-1], True])
+        team = codes[last]
+        den = w ** counts * den0 + (1.0 - w ** counts) / (1.0 - w)
+        self._last_day[team] = days[last]
+        self._den[team] = den
+        self._num[team] = stats[last] * den[:, None]
+
+    def _rebuild(self):
+        """Index trié par (équipe, jour) : moyennes après chaque match, cherchées par dichotomie."""
+        teams, days, values = (np.concatenate(parts) for parts in zip(*self._raw))
+        codes, names = pd.factorize(teams, sort=True)
+        order = np.lexsort((days, codes))
+        self._index = pd.Index(names, dtype=np.int64)
+        self._codes = codes[order].astype(np.int64)
+        self._keys = self._codes * DAY_SPAN + days[order]
+        self._stats = self._ewm(self._codes, values[order])
+
+        self._last_day = np.full(len(names), -1, dtype=np.int64)
+        self._num, self._den = np.zeros((len(names), 3)), np.zeros(len(names))
+        if len(self._codes):
+            self._set_state(self._codes, days[order], self._stats, np.bincount(self._codes)[np.unique(self._codes)])
+
+    def _append(self, teams, days, values):
+        """
+        Suite de l'index sans recalcul : les moyennes des nouveaux matchs partent de l'état de chaque
+        équipe, puis sont fusionnées dans les tableaux triés. False si un match précède le dernier
+        jour connu de son équipe (il faut alors tout reconstruire).
+        """
+        new = pd.Index(pd.unique(teams), dtype=np.int64).difference(self._index)
+        if len(new):
+            self._index = self._index.append(new)
+            self._last_day = np.r_[self._last_day, np.full(len(new), -1, dtype=np.int64)]
+            self._num = np.vstack([self._num, np.zeros((len(new), 3))])
+            self._den = np.r_[self._den, np.zeros(len(new))]
+        codes = self._index.get_indexer(teams).astype(np.int64)
+        if (days < self._last_day[codes]).any():
+            return False
+
+        order = np.lexsort((days, codes))
+        codes, days, values = codes[order], days[order], values[order]
+        groups = np.unique(codes)
+        stats = ewm_by_team(codes, values, self.span, init=(self._num[groups], self._den[groups]))
+        self._set_state(codes, days, stats, np.bincount(codes)[groups], self._den[groups])
+
+        # Fusion : même clé (équipe, jour) -> après les matchs déjà indexés
+        keys = codes * DAY_SPAN + days
+        pos = np.searchsorted(self._keys, keys, side='right')
+        self._keys = np.insert(self._keys, pos, keys)
+        self._codes = np.insert(self._codes, pos, codes)
+        self._stats = np.insert(self._stats, pos, stats, axis=0)
+        return True
+
+    @timed("team_stats.update")
+    def update(self, matches_df):
+        """Ajoute des matchs terminés à l'index (sans relire la base ni recalculer l'historique)."""
+        teams, days, values = self._observations(matches_df)
+        self._raw.append((teams, days, values))
+        if len(teams) and (len(self._keys) == 0 or not self._append(teams, days, values)):
+            self._rebuild()
+        self.loaded = True
+        current_span().set(rows=len(matches_df), teams=len(self._index))
+        return self
+
+    def fit(self, matches_df):
+        self._reset()
+        return self.update(matches_df)
+
+    def load(self):
+        """Construit l'index depuis tous les matchs terminés de la base (une requête)."""
+        conn = self.db.get_connection()
+        df = pd.read_sql_query('''
+            SELECT date, home_team_key, away_team_key, home_score, away_score
+            FROM matches WHERE status = 'FINISHED'
+        ''', conn)
+        conn.close()
+        return self.fit(df)
+
+    def lookup_many(self, team_keys, dates):
+        """(forme, attaque, défense) de chaque équipe (clé) à chaque date, sur les matchs strictement antérieurs."""
+        codes = self._index.get_indexer(pd.Index(np.asarray(team_keys, dtype=np.int64)))
+        days = to_day(dates) if len(codes) else np.empty(0, dtype=np.int64)
+        pos = np.searchsorted(self._keys, codes.astype(np.int64) * DAY_SPAN + days, side='left') - 1
+        valid = (codes >= 0) & (pos >= 0)
+        valid[valid] &= self._codes[pos[valid]] == codes[valid]
+        out = np.zeros((len(codes), 3))
+        out[valid] = self._stats[pos[valid]]
+        return out
+
+    def lookup(self, team_key, match_date=None):
+        return tuple(self.lookup_many([team_key], [match_date or pd.Timestamp.now()])[0])
+
+    def features(self, matches_df):
+        """Les 6 colonnes TEAM_FEATURES de chaque match, telles qu'au coup d'envoi."""
+        home = self.lookup_many(key_column(matches_df, 'home_team_key'), matches_df['date'])
+        away = self.lookup_many(key_column(matches_df, 'away_team_key'), matches_df['date'])
+        return pd.DataFrame(np.hstack([home, away]), columns=TEAM_FEATURES, index=matches_df.index)
+
+    @timed("team_stats.build")
+    def build(self, matches_df):
+        """Une passe sur l'historique : index reconstruit, puis features avant match de chaque ligne."""
+        return self.fit(matches_df).features(matches_df)
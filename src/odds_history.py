@@ -0,0 +1,150 @@
+"""
+Historique des cotes en ajout seul : une ligne (match_id, ts, 3 cotes) par variation observée.
+
+Format compact : clé primaire (match_id, ts) qui sert aussi d'index pour les recherches
+« dernière cote connue à T » et « cote de clôture » ; cotes en REAL (float32 sous Postgres).
+"""
+import datetime
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+from src.database import BettingDB
+
+ODDS_COLUMNS = ['home_odds', 'draw_odds', 'away_odds']
+
+
+def to_ts(value=None):
+    """Timestamp UNIX (secondes, UTC) ; maintenant par défaut."""
+    if value is None:
+        return int(datetime.datetime.now(datetime.timezone.utc).timestamp())
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(pd.Timestamp(value, tz="UTC").timestamp())
+
+
+def kickoff_ts(match_date):
+    """Heure exacte inconnue : on considère toute cote relevée jusqu'à la fin du jour du match."""
+    return to_ts(match_date) + 86400 - 1
+
+
+class OddsHistory:
+    def __init__(self, db=None):
+        self.db = db or BettingDB()
+
+    def record(self, cursor, snapshots, ts=None):
+        """Ajoute des relevés `(match_id, home, draw, away)` horodatés à `ts` (maintenant par défaut)."""
+        if not snapshots:
+            return 0
+        ts = to_ts(ts)
+        rows = [(match_id, ts, float(h), float(d), float(a)) for match_id, h, d, a in snapshots]
+        if self.db.is_postgres:
+            execute_values(cursor, '''
+                INSERT INTO odds_snapshots (match_id, ts, home_odds, draw_odds, away_odds)
+                VALUES %s ON CONFLICT (match_id, ts) DO NOTHING
+            ''', rows, page_size=1000)
+        else:
+            cursor.executemany('''
+                INSERT OR IGNORE INTO odds_snapshots (match_id, ts, home_odds, draw_odds, away_odds)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+        return len(rows)
+
+    def _query(self, query, params=()):
+        conn = self.db.get_connection()
+        df = pd.read_sql_query(query, conn, params=params)
+        conn.close()
+        return df
+
+    def latest_as_of(self, match_id, ts=None):
+        """Dernière cote connue pour un match à l'instant `ts` (tuple de 3 cotes ou None)."""
+        ph = self.db.get_placeholder()
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT home_odds, draw_odds, away_odds
+            FROM odds_snapshots
+            WHERE match_id = {ph} AND ts <= {ph}
+            ORDER BY ts DESC
+            LIMIT 1
+        ''', (match_id, to_ts(ts)))
+        row = cursor.fetchone()
+        conn.close()
+        return row
+
+    def latest_as_of_many(self, match_ids, ts=None):
+        """Version groupée : une seule requête, sous-requête corrélée servie par la clé primaire."""
+        match_ids = list(match_ids)
+        if not match_ids:
+            return pd.DataFrame(columns=['match_id', 'ts'] + ODDS_COLUMNS)
+        ph = self.db.get_placeholder()
+        in_list = ", ".join([ph] * len(match_ids))
+        return self._query(f'''
+            SELECT s.match_id, s.ts, s.home_odds, s.draw_odds, s.away_odds
+            FROM odds_snapshots s
+            WHERE s.match_id IN ({in_list})
+              AND s.ts = (SELECT MAX(ts) FROM odds_snapshots
+                          WHERE match_id = s.match_id AND ts <= {ph})
+        ''', tuple(match_ids) + (to_ts(ts),))
+
+    def closing_line(self, match_id):
+        """Cote de clôture : dernier relevé avant le coup d'envoi."""
+        ph = self.db.get_placeholder()
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT date FROM matches WHERE id = {ph}", (match_id,))
+        row = cursor.fetchone()
+        conn.close()
+        if row is None:
+            return None
+        return self.latest_as_of(match_id, kickoff_ts(row[0]))
+
+    def closing_lines(self, snapshots_df, matches_df):
+        """Cote de clôture de chaque match, calculée en bloc (tri + dernier relevé <= coup d'envoi)."""
+        if snapshots_df.empty:
+            return pd.DataFrame(columns=['match_id'] + ['closing_' + c for c in ODDS_COLUMNS])
+        epoch = (pd.to_datetime(matches_df['date']) - pd.Timestamp("1970-01-01")) // pd.Timedelta(seconds=1)
+        kickoffs = pd.Series(epoch.to_numpy() + 86400 - 1, index=matches_df['id'].to_numpy())
+        snaps = snapshots_df[snapshots_df['ts'].to_numpy() <= kickoffs.reindex(snapshots_df['match_id']).to_numpy()]
+        closing = snaps.sort_values(['match_id', 'ts']).drop_duplicates('match_id', keep='last')
+        return closing.rename(columns={c: 'closing_' + c for c in ODDS_COLUMNS}).drop(columns=['ts'])
+
+    def clv_report(self):
+        """
+        Closing Line Value de tous les paris : cote prise / cote de clôture - 1.
+        Positif = on a battu le marché. Deux requêtes au total, calcul vectorisé.
+        """
+        bets = self._query('''
+            SELECT b.id AS bet_id, b.match_id, b.prediction, b.odds_taken, b.result, m.date
+            FROM bets b
+            JOIN matches m ON b.match_id = m.id
+        ''')
+        snapshots = self._query('''
+            SELECT s.match_id, s.ts, s.home_odds, s.draw_odds, s.away_odds
+            FROM odds_snapshots s
+            WHERE s.match_id IN (SELECT match_id FROM bets)
+        ''')
+        if bets.empty:
+            return bets.assign(closing_odds=pd.Series(dtype=float), clv=pd.Series(dtype=float))
+
+        matches = bets[['match_id', 'date']].drop_duplicates('match_id').rename(columns={'match_id': 'id'})
+        closing = self.closing_lines(snapshots, matches)
+        report = bets.merge(closing, on='match_id', how='left')
+
+        # Cote de clôture de l'issue pariée (1 / N / 2)
+        choice = report['prediction'].map({'1': 0, 'N': 1, '2': 2}).fillna(-1).astype(int).to_numpy()
+        closing_matrix = report[['closing_' + c for c in ODDS_COLUMNS]].to_numpy(dtype=float)
+        picked = np.full(len(report), np.nan)
+        valid = choice >= 0
+        picked[valid] = closing_matrix[np.flatnonzero(valid), choice[valid]]
+
+        report['closing_odds'] = picked
+        report['clv'] = report['odds_taken'].to_numpy(dtype=float) / picked - 1
+        return report.drop(columns=['closing_' + c for c in ODDS_COLUMNS])
+
+
+if __name__ == "__main__":
+    report = OddsHistory().clv_report()
+    if report.empty or report['clv'].isna().all():
+        print("⚠️ Pas encore de cotes de clôture pour les paris.")
+    else:
+        print(f"📈 CLV moyenne : {report['clv'].mean():+.2%} sur {report['clv'].notna().sum()} paris")
@@ -0,0 +1,98 @@
+"""
+Exécution des étapes du bot sous forme de graphe de dépendances, dans un seul process.
+
+Les étapes indépendantes (ex: collecte stats et sentiments) tournent en parallèle.
+Une étape qui fournit une empreinte (`fingerprint`) est sautée si ses entrées n'ont pas
+bougé depuis le dernier run réussi (état stocké dans data/pipeline_state.json).
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from src.utils import instrumentation
+
+
+class Stage:
+    def __init__(self, name, func, deps=(), fingerprint=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.fingerprint = fingerprint
+
+
+class PipelineRunner:
+    def __init__(self, stages, state_path="data/pipeline_state.json", max_workers=4, force=False):
+        self.stages = {s.name: s for s in stages}
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self.force = force
+        self.state = self.load_state()
+
+        for stage in stages:
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Étape inconnue '{dep}' (dépendance de '{stage.name}')")
+
+    def load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def save_state(self):
+        folder = os.path.dirname(self.state_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(self.state_path, 'w') as f:
+            json.dump(self.state, f, indent=4, sort_keys=True)
+
+    def _run_stage(self, stage):
+        """Exécute une étape (ou la saute). Retourne 'done' ou 'skipped'."""
+        if stage.fingerprint is not None and not self.force:
+            before = stage.fingerprint()
+            if before is not None and self.state.get(stage.name) == before:
+                print(f"⏭️  [{stage.name}] entrées inchangées, étape sautée.")
+                return "skipped"
+
+        print(f"▶️  [{stage.name}]")
+        with instrumentation.span(f"stage.{stage.name}"):
+            stage.func()
+
+        if stage.fingerprint is not None:
+            # Empreinte prise après coup : un run identique juste après sera sauté
+            self.state[stage.name] = stage.fingerprint()
+        return "done"
+
+    def run(self):
+        """Exécute le graphe. Retourne {étape: 'done' | 'skipped' | 'failed' | 'blocked'}."""
+        status = {}
+        pending = dict(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                # Les étapes dont une dépendance a échoué ne sont pas lancées
+                for name, stage in list(pending.items()):
+                    if any(status.get(d) in ("failed", "blocked") for d in stage.deps):
+                        status[name] = "blocked"
+                        print(f"⛔ [{name}] annulée (dépendance en échec).")
+                        del pending[name]
+
+                for name, stage in list(pending.items()):
+                    if all(status.get(d) in ("done", "skipped") for d in stage.deps):
+                        running[pool.submit(self._run_stage, stage)] = name
+                        del pending[name]
+
+                if not running:
+                    break
+
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        status[name] = future.result()
+                    except Exception as e:
+                        status[name] = "failed"
+                        print(f"❌ [{name}] échec : {e}")
+
+        self.save_state()
+        return status
@@ -1,26 +1,31 @@
+import numpy as np
 import pandas as pd
 import sqlite3
 import joblib
-import os
 import matplotlib.pyplot as plt
 import seaborn as sns
 import xgboost as xgb
 from src.database import BettingDB
+from src.models.calibration import ProbabilityCalibrator, time_fold_predictions
 from src.models.predictor_v3 import PredictorV3
 from src.models.rl_agent import RLAgent
+from src.utils.instrumentation import timed, current_span
 
 class Backtester:
-    def __init__(self):
-        self.db = BettingDB()
-        self.predictor = PredictorV3()
-        # Reset RL Agent
-        if os.path.exists("data/q_table.json"):
-            os.remove("data/q_table.json")
-        self.rl_agent = RLAgent() 
+    def __init__(self, db=None):
+        self.db = db or BettingDB()
+        self.predictor = PredictorV3(db=self.db)
+        # Agent RL neuf, en mémoire : la Q-Table de production n'est ni effacée ni modifiée
+        self.rl_agent = RLAgent(q_table_path=None)
         self.fixed_stake = 100.0
+        self.calibrator = None
+        # Paris passant le filtre Value (confiance, profit), pariés ou non : rejouables hors ligne
+        self.candidates = []
 
-    def run_backtest(self):
+    def _prepare(self):
+        """Historique + features alignés, modèle entraîné sur les premiers matchs, agent RL remis à zéro."""
         print("⏳ Chargement de l'historique...")
+        self.rl_agent = RLAgent(q_table_path=None)
         X_all, y_all = self.predictor.load_and_prepare_data()
         
         conn = self.db.get_connection()
@@ -39,17 +44,31 @@ class Backtester:
         X_train = X_all.iloc[:split_index]
         y_train = y_all.iloc[:split_index]
         
-        self.predictor.model = xgb.XGBClassifier(
-            n_estimators=200, learning_rate=0.05, max_depth=5,
-            objective='multi:softprob', num_class=3, eval_metric='mlogloss', random_state=42
-        )
+        self.predictor.model = PredictorV3.make_model()
         self.predictor.model.fit(X_train, y_train)
 
+        # Calibrateur ajusté sur des blocs chronologiques du bootcamp (jamais sur la période simulée)
+        self.calibrator = None
+        if self.predictor.calibration:
+            fold_probs, fold_y = time_fold_predictions(PredictorV3.make_model, X_train, y_train)
+            if len(fold_y):
+                self.calibrator = ProbabilityCalibrator(self.predictor.calibration).fit(fold_probs, fold_y)
+        return raw_df, X_all, split_index
+
+    def _predict_proba(self, X):
+        probs = self.predictor.model.predict_proba(X)
+        return self.calibrator.transform(probs) if self.calibrator is not None else probs
+
+    @timed("backtest.run_backtest")
+    def run_backtest(self):
+        raw_df, X_all, split_index = self._prepare()
+
         # --- SIMULATION ---
         print(f"🚀 Simulation (Mise Fixe 100€)...")
         history = []
         bankroll = 0
         bets = 0
+        self.candidates = []
         
         test_indices = range(split_index, len(raw_df))
         
@@ -57,8 +76,8 @@ class Backtester:
             row = raw_df.iloc[i]
             features = X_all.iloc[[i]]
             
-            pred_idx = self.predictor.model.predict(features)[0]
-            probs = self.predictor.model.predict_proba(features)[0]
+            probs = self._predict_proba(features)[0]
+            pred_idx = int(probs.argmax())
             confidence = probs[pred_idx]
             mapping = {0: '1', 1: 'N', 2: '2'}
             pred_code = mapping[pred_idx]
@@ -73,26 +92,95 @@ class Backtester:
             # VALUE FILTER
             if confidence < (1/odds + 0.05): continue
 
-            # RL AGENT
-            action = self.rl_agent.decide_action(confidence)
-            if action == 0: continue
-            
             # MISE FIXE
             stake = self.fixed_stake
-            bets += 1
-            
+
             actual = 'N'
             if row['home_score'] > row['away_score']: actual = '1'
             elif row['away_score'] > row['home_score']: actual = '2'
             
             profit = -stake
             if pred_code == actual: profit = (stake * odds) - stake
+            self.candidates.append((confidence, profit))
+
+            # RL AGENT
+            action = self.rl_agent.decide_action(confidence)
+            if action == 0: continue
+            bets += 1
             
             bankroll += profit
             self.rl_agent.learn(confidence, 1, profit)
             history.append(bankroll)
 
         print(f"🏁 PROFIT FINAL : {bankroll:.2f} € ({bets} paris)")
+        current_span().set(rows=len(test_indices), bets=bets)
+        return history
+
+    @timed("backtest.run_matchday_backtest")
+    def run_matchday_backtest(self, initial_bankroll=10000.0, max_exposure=0.2):
+        """
+        Backtest événementiel : les matchs d'une même date forment une journée.
+        Chaque journée est notée en un seul lot, les mises sont engagées avant tout règlement
+        (plafonnées à `max_exposure` x bankroll, mises réduites au prorata si besoin),
+        puis la journée est réglée d'un bloc (bankroll et agent RL mis à jour ensemble).
+        """
+        raw_df, X_all, split_index = self._prepare()
+        test_df = raw_df.iloc[split_index:].reset_index(drop=True)
+        X_test = X_all.iloc[split_index:].reset_index(drop=True)
+
+        odds_matrix = test_df[['home_odds', 'draw_odds', 'away_odds']].to_numpy(dtype=float)
+        actual_idx = np.select(
+            [test_df['home_score'] > test_df['away_score'], test_df['home_score'] < test_df['away_score']],
+            [0, 2], default=1
+        )
+
+        print(f"🚀 Simulation par journée (bankroll {initial_bankroll:.0f}€, exposition max {max_exposure:.0%})...")
+        bankroll = initial_bankroll
+        cumulative = 0.0
+        history = []
+        bets = 0
+        matchdays = 0
+        self.candidates = []
+
+        for _, rows in test_df.groupby('date', sort=True).indices.items():
+            if bankroll <= 0:
+                print("💀 Bankroll épuisée.")
+                break
+            matchdays += 1
+
+            # 1. Notation de toute la journée en un lot
+            probs = self._predict_proba(X_test.iloc[rows])
+            pred_idx = probs.argmax(axis=1)
+            confidence = probs[np.arange(len(rows)), pred_idx]
+            odds = odds_matrix[rows, pred_idx]
+
+            # 2. Filtre Value + décision RL, en bloc
+            value = (odds > 1.0) & (confidence >= 1 / np.where(odds > 0, odds, np.inf) + 0.05)
+            won = pred_idx == actual_idx[rows]
+            flat_profit = np.where(won, self.fixed_stake * (odds - 1), -self.fixed_stake)
+            self.candidates.extend(zip(confidence[value].tolist(), flat_profit[value].tolist()))
+
+            selected = np.flatnonzero(value)
+            selected = selected[self.rl_agent.decide_actions(confidence[selected]) == 1]
+            if len(selected) == 0:
+                continue
+
+            # 3. Mises engagées avant règlement, sous plafond d'exposition
+            stakes = np.full(len(selected), self.fixed_stake)
+            cap = max_exposure * bankroll
+            if stakes.sum() > cap:
+                stakes *= cap / stakes.sum()
+
+            # 4. Règlement de la journée
+            profits = np.where(won[selected], stakes * (odds[selected] - 1), -stakes)
+            bankroll += profits.sum()
+            history.extend((cumulative + np.cumsum(profits)).tolist())
+            cumulative += profits.sum()
+            bets += len(selected)
+            self.rl_agent.learn_batch(confidence[selected], profits, save=False)
+
+        print(f"🏁 PROFIT FINAL : {cumulative:.2f} € ({bets} paris sur {matchdays} journées, bankroll {bankroll:.2f} €)")
+        current_span().set(rows=len(test_df), bets=bets, matchdays=matchdays)
         return history
 
     def plot_results(self, history):
@@ -107,6 +195,8 @@ class Backtester:
         print("📈 Graphique généré.")
 
 if __name__ == "__main__":
+    import sys
     bt = Backtester()
-    h = bt.run_backtest()
+    # python -m src.simulation.backtest --matchday   (simulation journée par journée)
+    h = bt.run_matchday_backtest() if "--matchday" in sys.argv else bt.run_backtest()
     bt.plot_results(h)
\ No newline at end of file
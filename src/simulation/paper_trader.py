@@ -1,19 +1,78 @@
+import os
 import sqlite3
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from src.database import BettingDB
 from src.models.predictor_v3 import PredictorV3
 from src.models.rl_agent import RLAgent
+from src.odds_history import to_ts
 from src.utils.notifier import TelegramNotifier
+from src.utils.instrumentation import timed, current_span
 
 class PaperTrader:
-    def __init__(self):
+    def __init__(self, shadow=None, shadow_workers=4, read_db=None):
         self.db = BettingDB()
-        self.predictor = PredictorV3()
+        # Les features peuvent être lues sur une copie locale ; paris et prédictions vont dans self.db
+        self.predictor = PredictorV3(db=read_db)
         self.rl_agent = RLAgent()
         self.notifier = TelegramNotifier()
         self.fixed_stake = 100.0
+        # Mode shadow : tous les modèles du registre notent le lot, seule la production parie
+        self.shadow = shadow if shadow is not None else os.getenv("SHADOW_MODE") == "1"
+        self.shadow_workers = shadow_workers
+
+    @timed("trader.shadow_evaluate")
+    def shadow_evaluate(self, batch, production):
+        """
+        Fait noter le même lot de features par chaque version du registre, en parallèle,
+        et journalise toutes les probabilités dans `predictions`. Retourne celles de la production.
+        """
+        artifacts = self.predictor.registry.aliased_artifacts()
+        if all(a is not production for a in artifacts):
+            artifacts.append(production)
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(len(artifacts), self.shadow_workers))) as pool:
+            futures = {pool.submit(self.predictor.predict_proba_batch, batch, a): a for a in artifacts}
+            for future, artifact in futures.items():
+                try:
+                    results[artifact] = future.result()
+                except Exception as e:
+                    print(f"⚠️ [SHADOW] {artifact.name}/{artifact.version} en échec : {e}")
 
+        conn = self.db.get_connection()
+        self.log_predictions(conn.cursor(), batch, results, production)
+        conn.commit()
+        conn.close()
+        print(f"🕶️ [SHADOW] {len(results)} modèle(s) évalué(s) sur {len(batch)} matchs.")
+        current_span().set(rows=len(batch), models=len(results))
+        return results.get(production)
+
+    def log_predictions(self, cursor, batch, results, production):
+        """
+        Journalise dans `predictions` les probabilités de chaque modèle ({artefact: probabilités}) sur le lot.
+        Les matchs non notés (équipe inconnue du modèle : probabilités nulles) ne sont pas journalisés.
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = []
+        for artifact, probs in results.items():
+            codes = self.predictor.decode(probs)[0]
+            scored = probs.sum(axis=1) > 0
+            for match_id, p, code, ok in zip(batch['id'], probs, codes, scored):
+                if not ok:
+                    continue
+                rows.append((match_id, artifact.name, artifact.version, float(p[0]), float(p[1]), float(p[2]),
+                             str(code), int(artifact is production), now))
+        self.db.insert_many(
+            cursor, "predictions",
+            ["match_id", "model_name", "model_version", "prob_home", "prob_draw", "prob_away",
+             "prediction", "is_production", "created_at"],
+            rows, on_conflict="ON CONFLICT (match_id, model_name, model_version) DO NOTHING"
+        )
+
+    @timed("trader.place_new_bets")
     def place_new_bets(self):
         conn = self.db.get_connection()
         cursor = conn.cursor()
@@ -21,7 +80,8 @@ class PaperTrader:
 
         # Lecture des matchs à venir
         query = '''
-            SELECT m.id, m.home_team, m.away_team, m.home_odds, m.draw_odds, m.away_odds
+            SELECT m.id, m.home_team, m.away_team, m.home_odds, m.draw_odds, m.away_odds, m.date,
+                   m.home_team_key, m.away_team_key
             FROM matches m
             LEFT JOIN bets b ON m.id = b.match_id
             WHERE m.status = 'SCHEDULED' AND b.id IS NULL
@@ -38,14 +98,36 @@ class PaperTrader:
             return
 
         print(f"💰 Analyse de {len(rows)} matchs...")
+        current_span().set(rows=len(rows))
+        bet_messages = []
+
+        slate = pd.DataFrame(rows, columns=['id', 'home_team', 'away_team', 'home_odds', 'draw_odds', 'away_odds', 'date',
+                                            'home_team_key', 'away_team_key'])
+        slate = slate[slate['home_odds'] != 0].reset_index(drop=True)
+
+        # Un seul modèle de production pour tout le lot (pas de bascule en cours de route)
+        production = self.predictor.load_production()
+        if slate.empty or production is None:
+            if production is None:
+                print("❌ Modèle non trouvé. Lance .train()")
+            conn.close()
+            return
 
-        for row in rows:
-            match_id, home, away, odd_h, odd_d, odd_a = row
-            if odd_h == 0: continue
-
-            # Prédiction
-            pred_label, confidence = self.predictor.predict_match(home, away, odd_h, odd_d, odd_a)
-            pred_code = pred_label.split(' ')[0] 
+        # Features calculées une fois pour le lot, partagées par tous les modèles
+        batch = self.predictor.build_features(slate)
+        probs = self.shadow_evaluate(batch, production) if self.shadow else None
+        if probs is None:
+            probs = self.predictor.predict_proba_batch(batch, production)
+            # Hors mode shadow aussi : les probabilités de la production sont gardées avec les paris
+            # (même transaction), pour l'analyse du registre (src/ledger_export.py)
+            self.log_predictions(cursor, batch, {production: probs}, production)
+        codes, confidences, _ = self.predictor.decode(probs)
+        model_version = f"{production.name}/{production.version}"
+
+        for row, pred_code, confidence in zip(slate.itertuples(index=False), codes, confidences):
+            match_id, home, away = row.id, row.home_team, row.away_team
+            odd_h, odd_d, odd_a = row.home_odds, row.draw_odds, row.away_odds
+            confidence = float(confidence)
             
             odds_taken = 0.0
             if pred_code == '1': odds_taken = odd_h
@@ -70,33 +152,38 @@ class PaperTrader:
             # Insertion du pari
             insert_query = f'''
                 INSERT INTO bets (match_id, prediction, confidence, stake, odds_taken, result, bet_date, model_version)
-                VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, 'PENDING', {ph}, 'V3-Champion')
+                VALUES ({ph}, {ph}, {ph}, {ph}, {ph}, 'PENDING', {ph}, {ph})
             '''
-            cursor.execute(insert_query, (match_id, pred_code, confidence, stake, odds_taken, datetime.now().strftime("%Y-%m-%d")))
+            cursor.execute(insert_query, (match_id, pred_code, confidence, stake, odds_taken, datetime.now().strftime("%Y-%m-%d"), model_version))
             
             print(f"✅ [BET] {home}-{away} : {pred_code} (@{odds_taken})")
 
-            # Notification
-            try:
-                msg = f"🚨 **NOUVEAU PARI**\n⚽ {home} vs {away}\n📊 {pred_code} @ {odds_taken}\n🧠 Conf: {confidence:.2f}"
-                self.notifier.send_message(msg)
-            except Exception as e:
-                print(f"⚠️ Erreur Telegram: {e}")
+            # Notification (regroupée et envoyée après le commit)
+            bet_messages.append(f"⚽ {home} vs {away}\n📊 {pred_code} @ {odds_taken}\n🧠 Conf: {confidence:.2f}")
 
         conn.commit()
         conn.close()
 
+        try:
+            self.notifier.send_digest(bet_messages, title="🚨 **NOUVEAUX PARIS**")
+        except Exception as e:
+            print(f"⚠️ Erreur Telegram: {e}")
+
+    @timed("trader.check_results")
     def check_results(self):
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        ph = self.db.get_placeholder()
 
-        # Lecture des résultats
+        # Lecture des résultats : l'issue réelle (1/N/2) est calculée directement en SQL
         query = '''
-            SELECT b.id, b.prediction, b.stake, b.odds_taken, m.home_score, m.away_score, b.confidence, m.home_team, m.away_team
+            SELECT b.id, b.prediction, b.stake, b.odds_taken, b.confidence, m.home_team, m.away_team,
+                   CASE WHEN m.home_score > m.away_score THEN '1'
+                        WHEN m.away_score > m.home_score THEN '2'
+                        ELSE 'N' END AS actual
             FROM bets b
             JOIN matches m ON b.match_id = m.id
             WHERE b.result = 'PENDING' AND m.status = 'FINISHED'
+            ORDER BY b.id ASC
         '''
         
         # --- CORRECTION ICI AUSSI ---
@@ -110,37 +197,39 @@ class PaperTrader:
             return
 
         print(f"📊 Traitement de {len(rows)} paris...")
-        telegram_report = "📊 **BILAN** 📊\n\n"
-        
-        for row in rows:
-            bet_id, prediction, stake, odds, h_score, a_score, confidence, home, away = row
-            
-            actual = 'N'
-            if h_score > a_score: actual = '1'
-            elif a_score > h_score: actual = '2'
-
-            status = 'WIN' if prediction == actual else 'LOSE'
-            profit = (stake * odds) - stake if status == 'WIN' else -stake
-
-            # Update du pari
-            update_query = f'UPDATE bets SET result = {ph}, profit = {ph} WHERE id = {ph}'
-            cursor.execute(update_query, (status, profit, bet_id))
-            
-            # Apprentissage RL
-            self.rl_agent.learn(confidence, action=1, reward=profit)
-            
-            icon = "✅" if status == 'WIN' else "❌"
-            telegram_report += f"{icon} {home}-{away} ({prediction})\n💰 {profit:+.2f}€\n\n"
-
+        current_span().set(rows=len(rows))
+
+        # Calcul vectorisé des statuts et profits pour tout le lot
+        bet_ids, predictions, stakes, odds, confidences, homes, aways, actuals = zip(*rows)
+        stakes = np.asarray(stakes, dtype=float)
+        odds = np.asarray(odds, dtype=float)
+        won = np.asarray(predictions) == np.asarray(actuals)
+        profits = np.where(won, stakes * odds - stakes, -stakes)
+        statuses = np.where(won, 'WIN', 'LOSE')
+
+        # Update de tous les paris en une seule requête
+        settled_at = to_ts()
+        self.db.update_many(
+            cursor, "bets", "id", ["result", "profit", "settled_at"],
+            [(int(i), str(st), float(p), settled_at) for i, st, p in zip(bet_ids, statuses, profits)]
+        )
         conn.commit()
         conn.close()
-        
+
+        # Apprentissage RL en lot (une seule écriture de la Q-Table)
+        self.rl_agent.learn_batch(confidences, profits, action=1)
+
+        lines = [
+            f"{'✅' if w else '❌'} {home}-{away} ({pred})\n💰 {p:+.2f}€"
+            for w, home, away, pred, p in zip(won, homes, aways, predictions, profits)
+        ]
         try:
-            self.notifier.send_message(telegram_report)
+            self.notifier.send_digest(lines, title="📊 **BILAN** 📊")
         except Exception as e:
             print(f"⚠️ Erreur Telegram: {e}")
 
 if __name__ == "__main__":
     trader = PaperTrader()
     trader.place_new_bets()
-    trader.check_results()
\ No newline at end of file
+    trader.check_results()
+    trader.notifier.close()
\ No newline at end of file
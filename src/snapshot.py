@@ -0,0 +1,169 @@
+"""
+Copie locale (SQLite compressée) des tables lues par les étapes lourdes.
+
+La CI ne garde pas de base locale : sans ce cache, features, entraînement et backtests relisent
+tout l'historique `matches` depuis Postgres à chaque run. `LocalSnapshot.sync()` ne rapatrie
+que les matchs modifiés depuis le dernier filigrane (`matches.updated_at`), plus l'état des
+features (cumul de sentiment récent, index H2H, équipes), puis `reader()` sert ces lectures
+depuis la copie locale. Les écritures (paris, collecte...) restent sur la base principale.
+
+    python -m src.snapshot            # synchronise data/snapshot.db(.gz)
+    python -m src.snapshot --full     # reconstruit la copie complète
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+from src.database import BettingDB
+from src.utils.instrumentation import timed, current_span
+
+MATCH_COLUMNS = ['id', 'date', 'home_team', 'away_team', 'home_odds', 'draw_odds', 'away_odds',
+                 'home_score', 'away_score', 'status', 'home_team_key', 'away_team_key', 'league',
+                 'updated_at']   # updated_at en dernier (filigrane)
+SENTIMENT_COLUMNS = ['date', 'team', 'team_key', 'score_sum', 'n']
+H2H_COLUMNS = ['home_team_key', 'away_team_key', 'games', 'points', 'goal_diff', 'score', 'last_day']
+TEAM_COLUMNS = ['id', 'name']
+
+# Marge de recouvrement (secondes) : tolère un écart d'horloge entre les machines qui écrivent
+WATERMARK_OVERLAP = 3600
+
+
+class LocalSnapshot:
+    def __init__(self, source=None, path="data/snapshot.db"):
+        self.source = source or BettingDB()
+        self.path = path
+        self.archive = path + ".gz"
+        # Après sync(), la copie décompressée est déjà à jour : inutile de redécompresser l'archive
+        self.synced = False
+
+    # --- Fichier compressé (c'est lui qui est mis en cache entre deux runs) ---
+
+    def unpack(self):
+        if os.path.exists(self.archive) and (
+                not os.path.exists(self.path) or os.path.getmtime(self.archive) > os.path.getmtime(self.path)):
+            with gzip.open(self.archive, 'rb') as src, open(self.path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+
+    def pack(self):
+        tmp_path = self.archive + ".tmp"
+        with open(self.path, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, self.archive)
+
+    # --- Synchronisation ---
+
+    def _init_local(self, local):
+        # Index H2H d'avant les clés d'équipe (indexé par nom) : recopié en entier à chaque sync
+        if 'home_team' in [row[1] for row in local.execute("PRAGMA table_info(h2h_index)")]:
+            local.execute("DROP TABLE h2h_index")
+        local.executescript('''
+            CREATE TABLE IF NOT EXISTS matches (
+                id TEXT PRIMARY KEY, date TEXT, home_team TEXT, away_team TEXT,
+                home_odds REAL, draw_odds REAL, away_odds REAL, home_score INTEGER, away_score INTEGER,
+                status TEXT, home_team_key INTEGER, away_team_key INTEGER, league TEXT, updated_at INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_matches_date ON matches (date);
+            CREATE TABLE IF NOT EXISTS sentiment_daily (
+                date TEXT, team TEXT, team_key INTEGER, score_sum REAL, n INTEGER, PRIMARY KEY (date, team)
+            );
+            CREATE INDEX IF NOT EXISTS idx_sentiment_daily_team_key ON sentiment_daily (team_key, date);
+            CREATE TABLE IF NOT EXISTS h2h_index (
+                home_team_key INTEGER, away_team_key INTEGER, games INTEGER, points REAL, goal_diff REAL,
+                score REAL, last_day INTEGER, PRIMARY KEY (home_team_key, away_team_key)
+            );
+            CREATE TABLE IF NOT EXISTS teams (id INTEGER PRIMARY KEY, name TEXT UNIQUE);
+            CREATE TABLE IF NOT EXISTS snapshot_meta (key TEXT PRIMARY KEY, value TEXT);
+        ''')
+        # Copie créée avant la colonne `league` : on l'ajoute et on repart de zéro pour les matchs
+        # (les lignes déjà copiées sont sous le filigrane et ne seraient jamais relues)
+        if 'league' not in [row[1] for row in local.execute("PRAGMA table_info(matches)")]:
+            local.execute("ALTER TABLE matches ADD COLUMN league TEXT")
+            local.execute("DELETE FROM snapshot_meta WHERE key = 'matches_watermark'")
+        # Lignes copiées avant le remplissage des clés d'équipe : les jointures se font sur les clés,
+        # on recopie donc tout (sous le filigrane, elles ne seraient jamais relues)
+        if local.execute("SELECT 1 FROM matches WHERE home_team_key IS NULL OR away_team_key IS NULL LIMIT 1").fetchone():
+            local.execute("DELETE FROM snapshot_meta WHERE key = 'matches_watermark'")
+        if local.execute("SELECT 1 FROM sentiment_daily WHERE team_key IS NULL LIMIT 1").fetchone():
+            local.execute("DELETE FROM sentiment_daily")
+            local.execute("DELETE FROM snapshot_meta WHERE key = 'sentiment_last_date'")
+
+    def _meta(self, local, key, default=None):
+        row = local.execute("SELECT value FROM snapshot_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    @staticmethod
+    def _replace(local, table, columns, rows):
+        local.executemany(
+            f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            rows
+        )
+
+    @timed("snapshot.sync")
+    def sync(self, full=False):
+        """Rapatrie les changements depuis la base principale. Retourne le nombre de lignes par table."""
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        if full:
+            for path in (self.path, self.archive):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.unpack()
+
+        local = sqlite3.connect(self.path)
+        self._init_local(local)
+        ph = self.source.get_placeholder()
+        conn = self.source.get_connection()
+        cursor = conn.cursor()
+
+        # 1. Matchs modifiés depuis le filigrane (+ recouvrement) : quelques lignes par run
+        watermark = int(self._meta(local, "matches_watermark", -1))
+        cursor.execute(f'''
+            SELECT {", ".join(MATCH_COLUMNS)} FROM matches
+            WHERE updated_at IS NULL OR updated_at >= {ph}
+        ''', (watermark - WATERMARK_OVERLAP if watermark >= 0 else -1,))
+        matches = cursor.fetchall()
+        self._replace(local, "matches", MATCH_COLUMNS, matches)
+        stamps = [r[-1] for r in matches if r[-1] is not None]
+        new_watermark = max([watermark] + stamps)
+
+        # 2. Cumul de sentiment : seuls les derniers jours bougent (le jour déjà vu est repris)
+        last_day = self._meta(local, "sentiment_last_date", "")
+        cursor.execute(f"SELECT {', '.join(SENTIMENT_COLUMNS)} FROM sentiment_daily WHERE date >= {ph}", (last_day,))
+        sentiments = cursor.fetchall()
+        self._replace(local, "sentiment_daily", SENTIMENT_COLUMNS, sentiments)
+        new_last_day = max([last_day] + [r[0] for r in sentiments])
+
+        # 3. Petits états recopiés en entier (une ligne par affiche / par équipe)
+        cursor.execute(f"SELECT {', '.join(H2H_COLUMNS)} FROM h2h_index")
+        h2h = cursor.fetchall()
+        local.execute("DELETE FROM h2h_index")
+        self._replace(local, "h2h_index", H2H_COLUMNS, h2h)
+        cursor.execute(f"SELECT {', '.join(TEAM_COLUMNS)} FROM teams")
+        self._replace(local, "teams", TEAM_COLUMNS, cursor.fetchall())
+        conn.close()
+
+        self._replace(local, "snapshot_meta", ["key", "value"], [
+            ("matches_watermark", str(new_watermark)), ("sentiment_last_date", new_last_day),
+        ])
+        local.commit()
+        local.close()
+        self.pack()
+        self.synced = True
+
+        counts = {'matches': len(matches), 'sentiment_daily': len(sentiments), 'h2h_index': len(h2h)}
+        current_span().set(rows=len(matches), **counts)
+        print(f"🗄️ Copie locale synchronisée : {counts['matches']} matchs, "
+              f"{counts['sentiment_daily']} cumuls de sentiment, {counts['h2h_index']} affiches H2H.")
+        return counts
+
+    def reader(self):
+        """Base à utiliser pour les lectures lourdes (features, entraînement, backtests)."""
+        if not self.synced:
+            self.unpack()
+        return BettingDB(sqlite_path=self.path)
+
+
+if __name__ == "__main__":
+    LocalSnapshot().sync(full="--full" in sys.argv)
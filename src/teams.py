@@ -0,0 +1,120 @@
+"""
+Référentiel des équipes : un nom canonique (celui de football-data) et un ID entier par équipe.
+
+Chaque source a ses propres graphies ("PSG" / "Paris SG", "Saint-Etienne" / "St Etienne") :
+les collecteurs passent par `TeamRegistry` pour ramener tout nom à sa forme canonique et
+stocker la clé entière correspondante (`teams.id`). Les alias sont dans la table `team_aliases`
+(pré-remplie avec TEAM_ALIASES, extensible sans toucher au code).
+"""
+import re
+import unicodedata
+import numpy as np
+import pandas as pd
+
+# Nom canonique -> autres graphies connues
+TEAM_ALIASES = {
+    "Paris SG": ["PSG", "Paris Saint-Germain", "Paris Saint Germain"],
+    "St Etienne": ["Saint-Etienne", "Saint-Étienne", "ASSE"],
+    "Marseille": ["OM", "Olympique de Marseille"],
+    "Lyon": ["OL", "Olympique Lyonnais"],
+    "Monaco": ["AS Monaco"],
+    "Lille": ["LOSC", "LOSC Lille"],
+    "Lens": ["RC Lens"],
+    "Rennes": ["Stade Rennais"],
+    "Nice": ["OGC Nice"],
+    "Strasbourg": ["RC Strasbourg", "RC Strasbourg Alsace"],
+    "Reims": ["Stade de Reims"],
+    "Montpellier": ["Montpellier HSC"],
+    "Toulouse": ["Toulouse FC", "TFC"],
+    "Nantes": ["FC Nantes"],
+    "Le Havre": ["HAC", "Le Havre AC"],
+    "Brest": ["Stade Brestois"],
+    "Lorient": ["FC Lorient"],
+    "Metz": ["FC Metz"],
+    "Auxerre": ["AJ Auxerre", "AJA"],
+    "Angers": ["Angers SCO", "SCO Angers"],
+    "Clermont": ["Clermont Foot"],
+    "Ajaccio": ["AC Ajaccio"],
+    "Troyes": ["ESTAC", "ESTAC Troyes"],
+    "Bordeaux": ["Girondins de Bordeaux"],
+    "Nimes": ["Nîmes", "Nimes Olympique"],
+    "Paris FC": [],
+}
+
+
+def normalize_key(name):
+    """Clé de comparaison : minuscules, sans accents ni ponctuation ("Saint-Étienne" -> "saintetienne")."""
+    text = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]", "", text.lower())
+
+
+def key_column(df, column):
+    """Colonne de clés d'équipe en entiers (-1 si la colonne est absente ou la clé vide)."""
+    if column not in df:
+        return np.full(len(df), -1, dtype=np.int64)
+    return pd.to_numeric(df[column]).fillna(-1).to_numpy(dtype=np.int64)
+
+
+def encode_teams(encoder, names):
+    """
+    Encodage vectorisé d'une série de noms avec un LabelEncoder déjà entraîné
+    (une recherche dans l'index des classes, -1 pour une équipe inconnue).
+    """
+    return pd.Index(encoder.classes_).get_indexer(pd.Index(names))
+
+
+class TeamRegistry:
+    def __init__(self, db):
+        self.db = db
+        self._aliases = None        # clé normalisée -> nom canonique
+        self._ids = {}              # nom canonique -> teams.id
+        self._ids_loaded = False    # toute la table `teams` déjà lue (recherche sans création)
+
+    def _load_aliases(self, cursor):
+        cursor.execute("SELECT a.alias, t.name FROM team_aliases a JOIN teams t ON a.team_id = t.id")
+        aliases = {normalize_key(name): name for name in TEAM_ALIASES}
+        aliases.update({normalize_key(alias): name for alias, name in cursor.fetchall()})
+        self._aliases = aliases
+
+    def seed(self, cursor):
+        """Crée les équipes de TEAM_ALIASES et leurs alias (idempotent)."""
+        self.ensure(cursor, list(TEAM_ALIASES))
+        rows = [(alias, self._ids[name]) for name, aliases in TEAM_ALIASES.items() for alias in aliases]
+        self.db.insert_many(cursor, "team_aliases", ["alias", "team_id"], rows,
+                            on_conflict="ON CONFLICT (alias) DO NOTHING")
+        self._aliases = None
+
+    def canonical(self, cursor, names):
+        """Noms canoniques (array) ; un nom sans alias connu est gardé tel quel (espaces retirés)."""
+        if self._aliases is None:
+            self._load_aliases(cursor)
+        names = pd.Series(names, dtype=object)
+        uniques = names.dropna().unique()
+        mapping = {u: self._aliases.get(normalize_key(u), str(u).strip()) for u in uniques}
+        return names.map(mapping).to_numpy()
+
+    def ensure(self, cursor, canonical_names):
+        """Crée les équipes manquantes (sans conflit entre collecteurs concurrents) et met les ID en cache."""
+        missing = sorted({n for n in canonical_names if n is not None and n not in self._ids})
+        if not missing:
+            return
+        self.db.insert_many(cursor, "teams", ["name"], [(n,) for n in missing],
+                            on_conflict="ON CONFLICT (name) DO NOTHING")
+        cursor.execute("SELECT name, id FROM teams")
+        self._ids.update(dict(cursor.fetchall()))
+
+    def keys(self, cursor, names):
+        """Noms quelconques -> (noms canoniques, clés entières ; -1 si nom absent), une recherche par nom distinct."""
+        canonical = self.canonical(cursor, names)
+        self.ensure(cursor, pd.unique(canonical[pd.notna(canonical)]))
+        keys = pd.Series(canonical, dtype=object).map(self._ids).fillna(-1).to_numpy(dtype=np.int64)
+        return canonical, keys
+
+    def lookup(self, cursor, names):
+        """Noms quelconques -> clés entières des équipes déjà référencées (-1 sinon), sans rien créer."""
+        canonical = self.canonical(cursor, names)
+        if not self._ids_loaded and any(n not in self._ids for n in pd.unique(canonical[pd.notna(canonical)])):
+            cursor.execute("SELECT name, id FROM teams")
+            self._ids.update(dict(cursor.fetchall()))
+            self._ids_loaded = True
+        return pd.Series(canonical, dtype=object).map(self._ids).fillna(-1).to_numpy(dtype=np.int64)
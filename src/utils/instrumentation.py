@@ -0,0 +1,204 @@
+"""
+Instrumentation légère du pipeline (chronométrage, volumes, allers-retours BDD).
+
+Désactivée par défaut : les décorateurs se contentent alors d'appeler la fonction.
+Activation par variables d'environnement (ou via enable()) :
+    METRICS_FILE=data/metrics.jsonl      -> une ligne JSON par étape
+    PROFILE_STAGES=all | predictor.train -> cProfile sur les étapes choisies
+    PROFILE_DIR=data/profiles            -> dossier des fichiers .prof
+"""
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class _State:
+    def __init__(self):
+        self.enabled = False
+        self.metrics_file = None
+        self.profile_stages = set()
+        self.profile_all = False
+        self.profile_dir = "data/profiles"
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+
+_state = _State()
+
+
+class _NullSpan:
+    """Span inerte renvoyée quand l'instrumentation est coupée."""
+
+    def set(self, **fields):
+        pass
+
+    def add(self, key, n=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _local():
+    local = _state.local
+    if not hasattr(local, "stack"):
+        local.stack = []
+        local.db_calls = 0
+        local.db_connects = 0
+        local.profiling = False
+    return local
+
+
+class Span:
+    """Mesure d'une étape : durée, champs libres (ex: rows) et compteurs BDD."""
+
+    def __init__(self, name, fields=None):
+        self.name = name
+        self.fields = dict(fields or {})
+        self.profiler = None
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def add(self, key, n=1):
+        self.fields[key] = self.fields.get(key, 0) + n
+
+    def _should_profile(self, local):
+        if local.profiling:
+            return False
+        if _state.profile_all:
+            return not local.stack
+        return self.name in _state.profile_stages
+
+    def __enter__(self):
+        local = _local()
+        self.parent = local.stack[-1].name if local.stack else None
+        local.stack.append(self)
+        self.db_calls_start = local.db_calls
+        self.db_connects_start = local.db_connects
+
+        if self._should_profile(local):
+            local.profiling = True
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        local = _local()
+
+        record = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "span": self.name,
+            "parent": self.parent,
+            "seconds": round(elapsed, 6),
+            "db_calls": local.db_calls - self.db_calls_start,
+            "db_connects": local.db_connects - self.db_connects_start,
+            "thread": threading.current_thread().name,
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            local.profiling = False
+            os.makedirs(_state.profile_dir, exist_ok=True)
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            path = os.path.join(_state.profile_dir, f"{self.name}-{stamp}.prof")
+            self.profiler.dump_stats(path)
+            record["profile"] = path
+
+        record.update(self.fields)
+        local.stack.pop()
+        _write(record)
+        return False
+
+
+def _write(record):
+    if not _state.metrics_file:
+        return
+    line = json.dumps(record, default=str)
+    with _state.lock:
+        folder = os.path.dirname(_state.metrics_file)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(_state.metrics_file, "a") as f:
+            f.write(line + "\n")
+
+
+def enable(metrics_file=None, profile=None, profile_dir=None):
+    """Active l'instrumentation. `profile` : None, "all" ou liste/CSV de noms d'étapes."""
+    _state.metrics_file = metrics_file or _state.metrics_file or "data/metrics.jsonl"
+    if profile:
+        stages = profile.split(",") if isinstance(profile, str) else list(profile)
+        stages = {s.strip() for s in stages if s.strip()}
+        _state.profile_all = "all" in stages
+        _state.profile_stages = stages - {"all"}
+    if profile_dir:
+        _state.profile_dir = profile_dir
+    _state.enabled = True
+
+
+def disable():
+    _state.enabled = False
+
+
+def is_enabled():
+    return _state.enabled
+
+
+def span(name, **fields):
+    """Context manager : `with span("stage", rows=n) as s: ...`."""
+    if not _state.enabled:
+        return _NULL_SPAN
+    return Span(name, fields)
+
+
+def current_span():
+    """Span en cours dans ce thread (ou span inerte) pour y ajouter des volumes."""
+    if not _state.enabled:
+        return _NULL_SPAN
+    stack = _local().stack
+    return stack[-1] if stack else _NULL_SPAN
+
+
+def timed(name):
+    """Décorateur : mesure chaque appel de la fonction sous le nom `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+            with Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_db_call():
+    """Compte un appel BDD (execute / executemany des curseurs comptés de src.database)."""
+    _local().db_calls += 1
+
+
+def count_db_connect():
+    _local().db_connects += 1
+
+
+# Activation automatique via l'environnement (ex: dans le workflow GitHub)
+if os.getenv("METRICS_FILE") or os.getenv("PROFILE_STAGES"):
+    enable(os.getenv("METRICS_FILE"), os.getenv("PROFILE_STAGES"), os.getenv("PROFILE_DIR"))
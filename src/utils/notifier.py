@@ -1,40 +1,205 @@
 import os
+import time
+import queue
+import atexit
+import threading
+from collections import deque
+from contextlib import contextmanager
 import requests
 from dotenv import load_dotenv
 
 # On charge les variables du fichier .env
 load_dotenv()
 
+_STOP = object()
+
+
 class TelegramNotifier:
-    def __init__(self):
-        self.token = os.getenv("TELEGRAM_TOKEN")
-        self.chat_id = os.getenv("TELEGRAM_CHAT_ID")
-        
+    """
+    Envoi Telegram non bloquant : les messages partent dans une file traitée par un thread
+    de fond (session HTTP persistante, timeout, respect du 429 `retry_after` et des limites anti-flood).
+    """
+    MAX_LENGTH = 4096  # Limite Telegram par message
+
+    def __init__(self, token=None, chat_id=None, api_url=None, timeout=10,
+                 min_interval=1.0, max_per_minute=20, max_retries=5):
+        self.token = token or os.getenv("TELEGRAM_TOKEN")
+        self.chat_id = chat_id or os.getenv("TELEGRAM_CHAT_ID")
+        # Surchargeable pour tester contre un serveur local
+        self.api_url = (api_url or os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")).rstrip("/")
+        self.timeout = timeout
+        self.min_interval = min_interval        # 1 message/seconde par chat
+        self.max_per_minute = max_per_minute    # 20 messages/minute dans un groupe
+        self.max_retries = max_retries
+
+        self.session = requests.Session()
+        self.queue = queue.Queue()
+        self.worker = None
+        self.lock = threading.Lock()
+        self.sent_times = deque()
+        self.digests = threading.local()       # tampon de digest propre à chaque thread
+        self.exit_hook = False
+        self.sent_count = 0
+
         if not self.token or not self.chat_id:
             print("⚠️ Attention : Identifiants Telegram non trouvés dans le fichier .env")
 
     def send_message(self, message):
-        """Envoie un message texte sur Telegram."""
+        """Met un message texte en file d'envoi (retour immédiat)."""
         if not self.token or not self.chat_id:
             return
 
-        url = f"https://api.telegram.org/bot{self.token}/sendMessage"
+        buffer = getattr(self.digests, "buffer", None)
+        if buffer is not None:
+            buffer.append(message)
+            return
+        with self.lock:
+            self._start_worker()
+        self.queue.put(message)
+
+    @contextmanager
+    def digest(self, title=None):
+        """Regroupe les messages envoyés dans le bloc en un seul message (découpé si trop long)."""
+        self.digests.buffer = messages = []
+        try:
+            yield self
+        finally:
+            # En cas d'erreur (ex: transaction annulée), on n'annonce rien
+            self.digests.buffer = None
+        self.send_digest(messages, title)
+
+    def send_digest(self, messages, title=None):
+        """Envoie une liste de messages en un minimum d'appels (un seul si ça tient)."""
+        if not messages:
+            return
+        header = f"{title} ({len(messages)})" if title else None
+        for chunk in self._split(messages, header):
+            self.send_message(chunk)
+
+    def _split(self, messages, header=None):
+        """Concatène les messages en blocs <= MAX_LENGTH sans couper un message en deux."""
+        # En-tête (tronqué à la moitié de la limite) collé au premier message : jamais envoyé seul
+        header = (header or "")[:self.MAX_LENGTH // 2]
+        chunks, current = [], ""
+        for i, msg in enumerate(messages):
+            if i == 0 and header:
+                msg = f"{header}\n\n{msg}"
+            msg = msg[:self.MAX_LENGTH]
+            candidate = f"{current}\n\n{msg}" if current else msg
+            if len(candidate) > self.MAX_LENGTH:
+                chunks.append(current)
+                candidate = msg
+            current = candidate
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def flush(self, timeout=None):
+        """Attend que la file soit vidée (True si tout est parti avant `timeout`)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=30):
+        """Vide la file puis arrête le thread d'envoi."""
+        if self.worker is None:
+            return
+        self.flush(timeout)
+        self.queue.put(_STOP)
+        self.worker.join(timeout)
+        self.worker = None
+        self.session.close()
+        if self.exit_hook:
+            atexit.unregister(self.close)
+            self.exit_hook = False
+
+    def _start_worker(self):
+        if self.worker is not None and self.worker.is_alive():
+            return
+        self.worker = threading.Thread(target=self._run, name="telegram-notifier", daemon=True)
+        self.worker.start()
+        # Les messages en file partent même si le script se termine juste après (un seul hook)
+        if not self.exit_hook:
+            atexit.register(self.close)
+            self.exit_hook = True
+
+    def _run(self):
+        while True:
+            message = self.queue.get()
+            try:
+                if message is _STOP:
+                    return
+                self._deliver(message)
+            except Exception as e:
+                print(f"❌ Erreur connexion Telegram : {e}")
+            finally:
+                self.queue.task_done()
+
+    def _wait_for_slot(self):
+        """Espace les envois pour rester sous les limites anti-flood de Telegram."""
+        now = time.monotonic()
+        while self.sent_times and now - self.sent_times[0] > 60:
+            self.sent_times.popleft()
+
+        wait = 0.0
+        if self.sent_times:
+            wait = self.min_interval - (now - self.sent_times[-1])
+        if len(self.sent_times) >= self.max_per_minute:
+            wait = max(wait, 60 - (now - self.sent_times[0]))
+        if wait > 0:
+            time.sleep(wait)
+
+    def _deliver(self, message):
+        url = f"{self.api_url}/bot{self.token}/sendMessage"
         payload = {
             "chat_id": self.chat_id,
             "text": message,
             "parse_mode": "Markdown" # Permet de mettre du gras avec **texte**
         }
-        
-        try:
-            response = requests.post(url, data=payload)
+
+        for attempt in range(self.max_retries):
+            self._wait_for_slot()
+            try:
+                response = self.session.post(url, data=payload, timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"❌ Erreur connexion Telegram : {e}")
+                time.sleep(min(2 ** attempt, 30))
+                continue
+
+            self.sent_times.append(time.monotonic())
+
             if response.status_code == 200:
+                self.sent_count += 1
                 print("📩 Notification Telegram envoyée !")
-            else:
-                print(f"❌ Erreur Telegram : {response.text}")
-        except Exception as e:
-            print(f"❌ Erreur connexion Telegram : {e}")
+                return True
+
+            if response.status_code == 429:
+                # Telegram indique combien de secondes attendre
+                try:
+                    retry_after = response.json().get("parameters", {}).get("retry_after", 1)
+                except ValueError:
+                    retry_after = 1
+                print(f"⏳ Limite Telegram atteinte, nouvel essai dans {retry_after}s")
+                time.sleep(retry_after)
+                continue
+
+            if response.status_code >= 500:
+                time.sleep(min(2 ** attempt, 30))
+                continue
+
+            print(f"❌ Erreur Telegram : {response.text}")
+            return False
+
+        print("❌ Erreur Telegram : abandon après plusieurs essais")
+        return False
 
 # --- Test rapide ---
 if __name__ == "__main__":
     bot = TelegramNotifier()
-    bot.send_message("👋 Salut ! Ceci est un test depuis ton **Ligue 1 Bot** ⚽")
\ No newline at end of file
+    bot.send_message("👋 Salut ! Ceci est un test depuis ton **Ligue 1 Bot** ⚽")
+    bot.close()
@@ -1,32 +1,91 @@
-import sqlite3
-import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # Rendu sans écran (CI / serveur)
 import matplotlib.pyplot as plt
-import seaborn as sns
 from src.database import BettingDB
+from src.utils.instrumentation import timed, current_span
 
 class Visualizer:
-    def __init__(self):
+    def __init__(self, max_points=2000):
         self.db = BettingDB()
-        # Configuration du style des graphiques
-        sns.set_theme(style="darkgrid")
+        # Au-delà, la courbe est sous-échantillonnée (un point tous les N paris)
+        self.max_points = max_points
 
+    def compute_kpis(self, cursor):
+        """KPIs lus sur la dernière ligne de `bankroll_history` (cumuls tenus à chaque ajout) : temps constant."""
+        cursor.execute('''
+            SELECT cumulative_bets, cumulative_wins, cumulative_profit, cumulative_stake
+            FROM bankroll_history ORDER BY step DESC LIMIT 1
+        ''')
+        last = cursor.fetchone()
+        return tuple(last) if last else (0, 0, 0.0, 0.0)
+
+    def update_bankroll_history(self, cursor):
+        """Ajoute à la suite de `bankroll_history` les paris réglés depuis le dernier rapport."""
+        ph = self.db.get_placeholder()
+
+        # Filigrane : date de règlement du dernier pari de l'historique (clé primaire + index)
+        cursor.execute('''
+            SELECT h.step, h.cumulative_profit, h.cumulative_bets, h.cumulative_wins, h.cumulative_stake, b.settled_at
+            FROM bankroll_history h
+            LEFT JOIN bets b ON b.id = h.bet_id
+            ORDER BY h.step DESC LIMIT 1
+        ''')
+        last = cursor.fetchone()
+        step, cumulative, bets, wins, stakes, watermark = last if last else (0, 0.0, 0, 0, 0.0, None)
+
+        # Seuls les règlements depuis le filigrane sont lus (index idx_bets_settled_at), dans l'ordre
+        # de règlement ; ceux de la seconde du filigrane déjà dans l'historique sont écartés (bet_id unique)
+        cursor.execute(f'''
+            SELECT b.id, b.profit, b.stake, b.result
+            FROM bets b
+            WHERE b.result IN ('WIN', 'LOSE') AND b.settled_at >= {ph}
+              AND NOT EXISTS (SELECT 1 FROM bankroll_history h WHERE h.bet_id = b.id)
+            ORDER BY b.settled_at ASC, b.id ASC
+        ''', (watermark if watermark is not None else -1,))
+        new_rows = []
+        for bet_id, profit, stake, result in cursor.fetchall():
+            step += 1
+            cumulative += profit
+            bets += 1
+            wins += result == 'WIN'
+            stakes += stake
+            new_rows.append((step, bet_id, profit, cumulative, bets, wins, stakes))
+
+        self.db.insert_many(
+            cursor, "bankroll_history",
+            ["step", "bet_id", "profit", "cumulative_profit", "cumulative_bets", "cumulative_wins", "cumulative_stake"],
+            new_rows
+        )
+        return step, len(new_rows)
+
+    def load_curve(self, cursor, last_step):
+        """Points de la courbe, sous-échantillonnés côté SQL pour les longs historiques."""
+        stride = max(1, -(-last_step // self.max_points))
+        if stride == 1:
+            cursor.execute("SELECT step, cumulative_profit FROM bankroll_history ORDER BY step ASC")
+            return cursor.fetchall()
+        # Étapes voulues calculées ici puis lues par clé primaire (pas de balayage de la table).
+        # Entiers inlinés sans paramètre pour rester compatibles SQLite/Postgres
+        steps = sorted({1, int(last_step), *range(stride, int(last_step) + 1, stride)})
+        cursor.execute(f'''
+            SELECT step, cumulative_profit
+            FROM bankroll_history
+            WHERE step IN ({", ".join(map(str, steps))})
+            ORDER BY step ASC
+        ''')
+        return cursor.fetchall()
+
+    @timed("report.generate_report")
     def generate_report(self):
         """Génère les stats et le graphique de performance."""
         conn = self.db.get_connection()
-        
-        # --- CORRECTION ICI ---
-        # On fait une jointure (JOIN) pour récupérer les noms des équipes
-        # depuis la table 'matches' en utilisant 'match_id'
-        query = '''
-            SELECT b.bet_date, m.home_team, m.away_team, b.prediction, b.result, b.profit, b.stake
-            FROM bets b
-            JOIN matches m ON b.match_id = m.id
-            WHERE b.result IN ('WIN', 'LOSE')
-            ORDER BY b.id ASC
-        '''
-        
+        cursor = conn.cursor()
+
         try:
-            df = pd.read_sql_query(query, conn)
+            last_step, added = self.update_bankroll_history(cursor)
+            conn.commit()
+            total_bets, total_wins, total_profit, total_stake = self.compute_kpis(cursor)
+            points = self.load_curve(cursor, last_step) if total_bets else []
         except Exception as e:
             print(f"❌ Erreur SQL : {e}")
             conn.close()
@@ -34,17 +93,13 @@ class Visualizer:
 
         conn.close()
 
-        if df.empty:
+        if total_bets == 0:
             print("⚠️ Pas encore de paris terminés pour générer un rapport.")
             return
 
         # --- 1. Calcul des KPIs ---
-        total_bets = len(df)
-        total_wins = len(df[df['result'] == 'WIN'])
+        current_span().set(rows=total_bets, appended=added)
         win_rate = (total_wins / total_bets) * 100
-        
-        total_profit = df['profit'].sum()
-        total_stake = df['stake'].sum()
         roi = (total_profit / total_stake) * 100
 
         print("\n" + "="*40)
@@ -57,32 +112,32 @@ class Visualizer:
         print("="*40)
 
         # --- 2. Génération du Graphique (Courbe de gains) ---
-        
-        # On calcule le cumul des profits ligne par ligne
-        df['cumulative_profit'] = df['profit'].cumsum()
-        
-        # Création de la figure
-        plt.figure(figsize=(10, 6))
-        
-        # La courbe principale
-        sns.lineplot(data=df, x=df.index, y='cumulative_profit', marker='o', color='#00ff00')
-        
+        steps = [p[0] for p in points]
+        cumulative = [p[1] for p in points]
+
+        fig, ax = plt.subplots(figsize=(10, 6))
+
+        # La courbe principale (marqueurs seulement si la courbe reste lisible)
+        ax.plot(steps, cumulative, color='#00ff00', marker='o' if len(points) <= 200 else None)
+
         # Ligne zéro (Breakeven) en rouge pointillé
-        plt.axhline(0, color='red', linestyle='--', alpha=0.5)
-        
-        plt.title('Évolution de la Bankroll (Profits Cumulés)', fontsize=16)
-        plt.xlabel('Nombre de Paris', fontsize=12)
-        plt.ylabel('Profit Net (€)', fontsize=12)
-        
+        ax.axhline(0, color='red', linestyle='--', alpha=0.5)
+
+        ax.set_title('Évolution de la Bankroll (Profits Cumulés)', fontsize=16)
+        ax.set_xlabel('Nombre de Paris', fontsize=12)
+        ax.set_ylabel('Profit Net (€)', fontsize=12)
+        ax.grid(True, alpha=0.3)
+
         # Remplissage sous la courbe (Vert si positif, Rouge si négatif)
-        plt.fill_between(df.index, df['cumulative_profit'], alpha=0.1, color='green')
+        ax.fill_between(steps, cumulative, alpha=0.1, color='green')
 
         # Sauvegarde
         filename = "performance_report.png"
-        plt.savefig(filename)
+        fig.savefig(filename)
+        plt.close(fig)
         print(f"\n📈 Graphique sauvegardé sous : {filename}")
 
 # --- Bloc de test ---
 if __name__ == "__main__":
     viz = Visualizer()
-    viz.generate_report()
\ No newline at end of file
+    viz.generate_report()
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+from sklearn.dummy import DummyClassifier
+from sklearn.preprocessing import LabelEncoder
+from src.database import BettingDB
+from src.ledger_export import LedgerExport
+from src.models.predictor_v3 import PredictorV3
+from src.models.registry import ModelRegistry
+from src.simulation.paper_trader import PaperTrader
+
+
+def test_export_has_production_probabilities_without_shadow(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    monkeypatch.delenv("SHADOW_MODE", raising=False)
+    db = BettingDB()
+    db.initialize_tables()
+
+    # Modèle minimal en production : probabilités a priori (domicile favori)
+    X = pd.DataFrame(np.zeros((5, len(PredictorV3.FEATURES))), columns=PredictorV3.FEATURES)
+    model = DummyClassifier(strategy="prior").fit(X, [0, 0, 0, 1, 2])
+    encoder = LabelEncoder().fit(["Lens", "Lille"])
+    ModelRegistry().register("v3", model, encoder, PredictorV3.FEATURES, "0" * 40)
+
+    conn = db.get_connection()
+    conn.execute('''
+        INSERT INTO matches (id, date, home_team, away_team, home_odds, draw_odds, away_odds, status, league)
+        VALUES ('2024-05-01_Lens_Lille', '2024-05-01', 'Lens', 'Lille', 10.0, 10.0, 10.0, 'SCHEDULED', 'F1')
+    ''')
+    # Équipe inconnue du modèle : probabilités nulles, ni pari ni prédiction journalisée
+    conn.execute('''
+        INSERT INTO matches (id, date, home_team, away_team, home_odds, draw_odds, away_odds, status, league)
+        VALUES ('2024-05-01_Metz_Brest', '2024-05-01', 'Metz', 'Brest', 10.0, 10.0, 10.0, 'SCHEDULED', 'F1')
+    ''')
+    conn.commit()
+    conn.close()
+
+    trader = PaperTrader(shadow=False)
+    monkeypatch.setattr(trader.rl_agent, "decide_action", lambda confidence: 1)
+    trader.place_new_bets()
+
+    conn = db.get_connection()
+    assert conn.execute("SELECT match_id, is_production FROM predictions").fetchall() == [('2024-05-01_Lens_Lille', 1)]
+    conn.execute("UPDATE matches SET home_score = 2, away_score = 0, status = 'FINISHED'")
+    conn.commit()
+    conn.close()
+    trader.check_results()
+
+    ledger = LedgerExport(source=db)
+    assert ledger.export() == 1
+    frame = ledger.to_frame(["bet_id", "result", "prob_home", "prob_draw", "prob_away"])
+    assert list(frame["result"]) == ["WIN"]
+    np.testing.assert_allclose(frame[["prob_home", "prob_draw", "prob_away"]].to_numpy()[0], [0.6, 0.2, 0.2])
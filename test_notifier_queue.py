@@ -0,0 +1,53 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs
+from src.utils.notifier import TelegramNotifier
+
+
+class FakeTelegram(BaseHTTPRequestHandler):
+    """Faux endpoint sendMessage : répond 429 au premier appel, puis 200."""
+    received = []
+    calls = 0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = parse_qs(self.rfile.read(length).decode())
+        FakeTelegram.calls += 1
+
+        if FakeTelegram.calls == 1:
+            payload = {"ok": False, "error_code": 429, "parameters": {"retry_after": 0.2}}
+            self.send_response(429)
+        else:
+            FakeTelegram.received.append(body["text"][0])
+            payload = {"ok": True}
+            self.send_response(200)
+
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(payload).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def test_digest_is_sent_once_after_rate_limit():
+    server = HTTPServer(("127.0.0.1", 0), FakeTelegram)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    notifier = TelegramNotifier(
+        token="TEST", chat_id="42", api_url=f"http://127.0.0.1:{server.server_port}", min_interval=0
+    )
+    with notifier.digest("🚨 **NOUVEAUX PARIS**"):
+        for i in range(30):
+            notifier.send_message(f"⚽ Match {i}")
+
+    assert notifier.flush(timeout=10)
+    notifier.close()
+    server.shutdown()
+
+    # 1 réponse 429 + 1 envoi réussi : les 30 paris tiennent dans un seul message
+    assert FakeTelegram.calls == 2
+    assert len(FakeTelegram.received) == 1
+    assert FakeTelegram.received[0].startswith("🚨 **NOUVEAUX PARIS** (30)")
+    assert "⚽ Match 29" in FakeTelegram.received[0]